@@ -1,11 +1,13 @@
 """
 Authentication and session management for privacy.
 """
-from fastapi import Header, HTTPException
+from fastapi import Header, HTTPException, Query
 from typing import Optional
 import secrets
 import string
 
+from . import config
+
 def generate_session_id() -> str:
     """Generate a secure session ID."""
     # Generate 32-character random session ID
@@ -41,6 +43,23 @@ def get_session_id(x_session_id: Optional[str] = Header(None, alias="X-Session-I
     
     return x_session_id
 
+def get_stream_session_id(
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID"),
+    session: Optional[str] = Query(None),
+) -> str:
+    """
+    Get session ID from header or ``session`` query parameter.
+    Browsers' EventSource cannot send custom headers, so streaming endpoints
+    also accept the session ID in the URL.
+    
+    Returns:
+        Validated session ID
+        
+    Raises:
+        HTTPException: If session ID is missing or invalid
+    """
+    return get_session_id(x_session_id or session)
+
 def verify_image_access(image_session_id: str, request_session_id: str) -> bool:
     """
     Verify that the requesting session has access to the image.
@@ -54,3 +73,23 @@ def verify_image_access(image_session_id: str, request_session_id: str) -> bool:
     """
     return image_session_id == request_session_id
 
+
+def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    """
+    Allow only requests carrying the admin token ("Authorization: Bearer <ADMIN_TOKEN>").
+    
+    Raises:
+        HTTPException: 404 if the admin API is disabled (no ADMIN_TOKEN),
+            401 without a bearer token, 403 with a wrong one
+    """
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(
+            status_code=401,
+            detail="Admin token required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if not secrets.compare_digest(token.strip().encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
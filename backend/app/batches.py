@@ -0,0 +1,241 @@
+"""
+Bulk ingestion: many files or one ZIP/TAR archive per request.
+
+Archives are read entry by entry from the uploaded file (spooled to disk
+while the request is received, see uploads.py), so an archive is never held
+in memory as a whole. Each
+accepted entry is stored in the uploads blob store as it is read; the rows
+for the whole batch are then inserted by the caller in a single transaction.
+
+Results of a batch are downloaded as a ZIP that is generated while it is
+being sent.
+"""
+import io
+import logging
+import os
+import tarfile
+import time
+import zipfile
+from dataclasses import dataclass, field
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from .config import BATCH_UPLOAD_MAX_FILES, MAX_UPLOAD_BYTES
+from .storage import BlobStore
+from .uploads import ImageInspector, UploadRejected
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_MIME_TYPES = {
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-tar",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-compressed-tar",
+}
+
+_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/avif": ".avif",
+}
+
+
+@dataclass
+class IngestedFile:
+    """An accepted file, already stored in the uploads blob store."""
+    filename: str
+    key: str
+    mime: str
+    width: Optional[int]
+    height: Optional[int]
+
+
+@dataclass
+class IngestResult:
+    """Outcome of reading a bulk upload."""
+    files: list[IngestedFile] = field(default_factory=list)
+    skipped: list[dict] = field(default_factory=list)
+
+
+def is_archive(filename: Optional[str], content_type: Optional[str]) -> bool:
+    """Whether an uploaded part should be treated as an archive."""
+    name = (filename or "").lower()
+    return (
+        content_type in ARCHIVE_MIME_TYPES
+        or name.endswith((".zip", ".tar", ".tar.gz", ".tgz"))
+    )
+
+
+def _is_hidden(name: str) -> bool:
+    """Metadata entries added by archivers (e.g. __MACOSX/, .DS_Store)."""
+    return any(part.startswith((".", "__MACOSX")) for part in name.split("/"))
+
+
+def _iter_zip(fileobj: BinaryIO) -> Iterator[tuple[str, int, Optional[BinaryIO]]]:
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            if info.file_size > MAX_UPLOAD_BYTES:
+                yield info.filename, info.file_size, None
+                continue
+            with archive.open(info) as entry:
+                yield info.filename, info.file_size, entry
+
+
+def _iter_tar(fileobj: BinaryIO) -> Iterator[tuple[str, int, Optional[BinaryIO]]]:
+    # Stream mode: members are read sequentially without seeking
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            if member.size > MAX_UPLOAD_BYTES:
+                yield member.name, member.size, None
+                continue
+            yield member.name, member.size, archive.extractfile(member)
+
+
+def iter_archive(fileobj: BinaryIO) -> Iterator[tuple[str, int, Optional[BinaryIO]]]:
+    """
+    Iterate over the regular files of a ZIP or (optionally compressed) TAR.
+
+    Yields:
+        (entry name, declared size, readable stream or None if over the size limit)
+
+    Raises:
+        ValueError: If the file is neither a ZIP nor a TAR archive
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        yield from _iter_zip(fileobj)
+        return
+    fileobj.seek(0)
+    try:
+        yield from _iter_tar(fileobj)
+    except tarfile.ReadError as e:
+        raise ValueError(f"Unsupported archive: {e}")
+
+
+def ingest_uploads(parts: Iterable[tuple[str, str, BinaryIO]], store: BlobStore) -> IngestResult:
+    """
+    Read uploaded files and archives and store the images they contain.
+
+    Entries that are not images, exceed MAX_UPLOAD_BYTES, have more than
+    MAX_IMAGE_PIXELS pixels or come after the first BATCH_UPLOAD_MAX_FILES
+    are skipped and reported.
+
+    Args:
+        parts: (filename, content type, file object) of each uploaded part
+        store: Blob store for the originals
+
+    Returns:
+        Accepted files and skipped entries
+
+    Raises:
+        ValueError: If an archive cannot be read
+    """
+    result = IngestResult()
+
+    def accept(name: str, size: int, stream: Optional[BinaryIO]) -> None:
+        if _is_hidden(name):
+            return
+        if len(result.files) >= BATCH_UPLOAD_MAX_FILES:
+            result.skipped.append({"filename": name, "reason": "too many files"})
+            return
+        if stream is None or size > MAX_UPLOAD_BYTES:
+            result.skipped.append({"filename": name, "reason": "file too large"})
+            return
+        data = stream.read(MAX_UPLOAD_BYTES + 1)
+        if len(data) > MAX_UPLOAD_BYTES:
+            result.skipped.append({"filename": name, "reason": "file too large"})
+            return
+        inspector = ImageInspector()
+        try:
+            inspector.feed(data)
+            inspector.finish(io.BytesIO(data))
+        except UploadRejected as e:
+            reason = "too many pixels" if e.status_code == 413 else "not an image"
+            result.skipped.append({"filename": name, "reason": reason})
+            return
+        result.files.append(IngestedFile(
+            name, store.put(data), inspector.mime, inspector.width, inspector.height
+        ))
+
+    for filename, content_type, fileobj in parts:
+        if is_archive(filename, content_type):
+            for name, size, stream in iter_archive(fileobj):
+                accept(name, size, stream)
+        else:
+            fileobj.seek(0, os.SEEK_END)
+            size = fileobj.tell()
+            fileobj.seek(0)
+            accept(filename or "upload", size, fileobj)
+    return result
+
+
+def archive_name(filename: Optional[str], image_id: int, mime: Optional[str], used: set) -> str:
+    """
+    Name of a result inside the download archive.
+
+    Keeps the base name of the uploaded file, so results can be matched to
+    the scans they came from; collisions get the image ID appended.
+    """
+    stem = os.path.splitext(os.path.basename(filename or ""))[0] or f"image_{image_id}"
+    extension = _EXTENSIONS.get(mime or "", ".jpg")
+    name = f"{stem}_colorized{extension}"
+    if name in used:
+        name = f"{stem}_colorized_{image_id}{extension}"
+    used.add(name)
+    return name
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable file collecting bytes until drained."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._offset = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries: Iterable[tuple[str, BlobStore, str]]) -> Iterator[bytes]:
+    """
+    Generate a ZIP archive of stored blobs chunk by chunk.
+
+    Entries are stored uncompressed (the images are already compressed), and
+    sizes are written in data descriptors, so nothing needs to be buffered
+    or seeked back to.
+
+    Args:
+        entries: (name in the archive, blob store, key) of each file
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, store, key in entries:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            with archive.open(info, "w") as dest:
+                for chunk in store.iter_range(key):
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+    data = sink.drain()
+    if data:
+        yield data
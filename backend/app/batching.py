@@ -0,0 +1,289 @@
+"""
+Dynamic micro-batching in front of the colorizer.
+
+Jobs are queued and grouped by model, by render_factor (all images in a
+batch must be scaled to the same model input size) and by processing path
+(standard or large-image). A group is dispatched as soon as it
+reaches the maximum batch size, or when its oldest job has waited for the
+maximum wait time, whichever comes first. When several groups are due at
+once, those of the model that ran last go first, so the registry does not
+swap generators back and forth.
+
+Chunks of video frames (see video.py) are submitted as ready-made batches
+and run as soon as the dispatch thread gets to them, so they share the
+loaded generators and the single inference thread with image jobs.
+
+Jobs carry the trace IDs and profiling session of the code that submitted
+them; a batch runs on behalf of all of its jobs.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+from .profiling import current_profile
+from .tracing import current_traces, tracer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Job:
+    """A single queued colorization request (or a chunk of video frames)."""
+    image_data: object
+    model: str
+    render_factor: int
+    large: bool
+    deadline: float
+    frames: bool = False
+    traces: tuple = ()
+    profile: Optional[object] = None
+    future: Future = field(default_factory=Future)
+
+
+_STOP = object()
+
+
+class BatchScheduler:
+    """Collects colorization jobs and runs them through the model in batches."""
+
+    def __init__(
+        self,
+        models,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+    ):
+        """
+        Initialize the scheduler and start its dispatch thread.
+
+        Args:
+            models: Model registry: provides resolve(name), get(name) returning an
+                object with colorize_batch(images, render_factor), and render_factor
+            max_batch_size: Maximum number of images per forward pass
+            max_wait_ms: Maximum time a job waits for others to join its batch
+        """
+        self.models = models
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes: Counter = Counter()
+        self._last_batch_size = 0
+        self._last_model: Optional[str] = None
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        image_data: bytes,
+        render_factor: Optional[int] = None,
+        large: bool = False,
+        model: Optional[str] = None,
+    ) -> Future:
+        """
+        Queue an image for colorization.
+
+        Args:
+            image_data: Raw image bytes
+            render_factor: Rendering factor, defaults to the registry's
+            large: Use the colorizer's large-image path
+            model: Model name, defaults to the registry's default model
+
+        Returns:
+            Future resolving to (colorized_image_bytes, output_mime_type)
+        """
+        job = _Job(
+            image_data=image_data,
+            model=self.models.resolve(model),
+            render_factor=render_factor or self.models.render_factor,
+            large=large,
+            deadline=time.monotonic() + self.max_wait,
+            traces=current_traces.get(),
+            profile=current_profile.get(),
+        )
+        self._queue.put(job)
+        return job.future
+
+    def submit_frames(
+        self,
+        frames: list,
+        render_factor: Optional[int] = None,
+        model: Optional[str] = None,
+    ) -> Future:
+        """
+        Queue video frames, which run through the model as one batch.
+
+        Args:
+            frames: RGB frames as NumPy arrays
+            render_factor: Rendering factor, defaults to the registry's
+            model: Model name, defaults to the registry's default model
+
+        Returns:
+            Future resolving to the raw colour predictions (see predict_frames)
+        """
+        job = _Job(
+            image_data=frames,
+            model=self.models.resolve(model),
+            render_factor=render_factor or self.models.render_factor,
+            large=False,
+            deadline=time.monotonic(),
+            frames=True,
+            traces=current_traces.get(),
+            profile=current_profile.get(),
+        )
+        self._queue.put(job)
+        return job.future
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Flush queued jobs and stop the dispatch thread."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """Return batch size statistics."""
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            images = sum(size * count for size, count in self._batch_sizes.items())
+            return {
+                "maxBatchSize": self.max_batch_size,
+                "maxWaitMs": self.max_wait * 1000.0,
+                "batches": batches,
+                "images": images,
+                "averageBatchSize": images / batches if batches else 0.0,
+                "lastBatchSize": self._last_batch_size,
+                "batchSizeHistogram": dict(sorted(self._batch_sizes.items())),
+                "queued": self._queue.qsize(),
+            }
+
+    def _run(self) -> None:
+        """Dispatch loop: group incoming jobs and execute ready batches."""
+        groups: dict[tuple[str, int, bool], list[_Job]] = {}
+        while True:
+            timeout = None
+            if groups:
+                oldest_deadline = min(jobs[0].deadline for jobs in groups.values())
+                timeout = max(0.0, oldest_deadline - time.monotonic())
+
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                job = None
+
+            if job is _STOP:
+                for key, jobs in sorted(groups.items(), key=lambda item: item[0][0]):
+                    for start in range(0, len(jobs), self.max_batch_size):
+                        self._execute(key, jobs[start:start + self.max_batch_size])
+                return
+            if job is not None and job.frames:
+                self._execute((job.model, job.render_factor, False), [job])
+            elif job is not None:
+                groups.setdefault((job.model, job.render_factor, job.large), []).append(job)
+
+            now = time.monotonic()
+            for key in sorted(groups, key=lambda key: key[0] != self._last_model):
+                jobs = groups[key]
+                if len(jobs) >= self.max_batch_size or jobs[0].deadline <= now:
+                    batch, rest = jobs[:self.max_batch_size], jobs[self.max_batch_size:]
+                    if rest:
+                        groups[key] = rest
+                    else:
+                        del groups[key]
+                    self._execute(key, batch)
+
+    def _execute(self, key: tuple[str, int, bool], jobs: list[_Job]) -> None:
+        """Run one batch and resolve the futures of its jobs."""
+        jobs = [job for job in jobs if job.future.set_running_or_notify_cancel()]
+        if not jobs:
+            return
+        model, render_factor, large = key
+        self._last_model = model
+
+        profile = next((job.profile for job in jobs if job.profile is not None), None)
+        traces = current_traces.set(tuple(trace for job in jobs for trace in job.traces))
+        profiling = current_profile.set(profile)
+        try:
+            size = len(jobs[0].image_data) if jobs[0].frames else len(jobs)
+            with tracer.span("batch", size=size, model=model, render_factor=render_factor), \
+                    (profile.section() if profile else nullcontext()):
+                self._run_batch(model, render_factor, large, jobs)
+        finally:
+            current_traces.reset(traces)
+            current_profile.reset(profiling)
+
+    def _run_batch(self, model: str, render_factor: int, large: bool, jobs: list[_Job]) -> None:
+        """Colorize a batch, falling back to one image at a time if it fails."""
+        started = time.perf_counter()
+        if jobs[0].frames:
+            job = jobs[0]
+            try:
+                job.future.set_result(self.models.get(model).predict_frames(job.image_data, render_factor))
+            except Exception as e:
+                job.future.set_exception(e)
+            self._record_batch(len(job.image_data))
+            return
+
+        colorizer = None
+        try:
+            colorizer = self.models.get(model)
+            results = colorizer.colorize_batch(
+                [job.image_data for job in jobs], render_factor, large=large
+            )
+        except Exception as e:
+            if len(jobs) == 1 or colorizer is None:
+                # Nothing to retry: a single job, or the model failed to load
+                for job in jobs:
+                    job.future.set_exception(e)
+                return
+            # Retry one by one so a single bad image does not fail its neighbours
+            logger.warning(f"Batch of {len(jobs)} failed ({e}), retrying individually")
+            for job in jobs:
+                try:
+                    job.future.set_result(
+                        colorizer.colorize_batch([job.image_data], render_factor, large=large)[0]
+                    )
+                except Exception as job_error:
+                    job.future.set_exception(job_error)
+                self._record_batch(1)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._record_batch(len(jobs))
+        logger.info(
+            f"Colorized batch of {len(jobs)} (model={model}, render_factor={render_factor}, large={large}) "
+            f"in {elapsed_ms:.0f} ms"
+        )
+        for job, result in zip(jobs, results):
+            job.future.set_result(result)
+
+    def _record_batch(self, size: int) -> None:
+        with self._lock:
+            self._batch_sizes[size] += 1
+            self._last_batch_size = size
+
+
+# Global scheduler instance (lazy initialization)
+_scheduler_instance: Optional[BatchScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_batch_scheduler() -> BatchScheduler:
+    """Get or create the global batch scheduler."""
+    global _scheduler_instance
+    with _scheduler_lock:
+        if _scheduler_instance is None:
+            from .registry import get_model_registry
+            _scheduler_instance = BatchScheduler(get_model_registry())
+    return _scheduler_instance
+
+
+def get_batch_stats() -> Optional[dict]:
+    """Return scheduler statistics, or None if it has not been started."""
+    if _scheduler_instance is None:
+        return None
+    return _scheduler_instance.stats()
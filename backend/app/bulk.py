@@ -0,0 +1,453 @@
+"""
+Offline bulk colorization of a directory tree.
+
+Colorizes every image under a source directory (by default ``ml/data/raw``)
+into the same layout under a destination directory (``ml/data/processed``),
+without the API, database or job queue. Files are split into shards of
+roughly equal bytes, one per worker process, and each process is pinned to
+its own slice of the CPU cores. Inside a process, decoding, inference and
+encoding run in separate threads connected by bounded queues, so the
+generator never waits for file I/O or JPEG coding while memory stays
+bounded.
+
+Every finished file is appended to a JSON-lines manifest in the
+destination. An interrupted run started again skips the files the manifest
+records as done (unless they changed since) and retries the failed ones.
+
+Usage (from backend/)::
+
+    python -m app.bulk ../ml/data/raw ../ml/data/processed --processes 4 --batch-size 8
+"""
+import argparse
+import io
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable, Optional
+
+from .config import BASE_DIR, BATCH_MAX_SIZE, MODELS
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+MANIFEST_NAME = "manifest.jsonl"
+DEFAULT_SOURCE = BASE_DIR.parent / "ml" / "data" / "raw"
+DEFAULT_DEST = BASE_DIR.parent / "ml" / "data" / "processed"
+
+# End of input marker passed down the pipeline queues
+_END = None
+
+
+def find_images(source: Path, exclude: Optional[Path] = None) -> list[dict]:
+    """
+    Images under a directory.
+
+    Args:
+        exclude: Directory to leave out (the destination, if it is inside)
+
+    Returns:
+        ``path`` (relative, POSIX), ``size`` and ``mtime`` (ns) of each file, by path
+    """
+    found = []
+    for root, dirs, files in os.walk(source):
+        if exclude is not None:
+            dirs[:] = [name for name in dirs if Path(root, name).resolve() != exclude]
+        dirs.sort()
+        for name in sorted(files):
+            path = Path(root, name)
+            if path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            stat = path.stat()
+            found.append({
+                "path": path.relative_to(source).as_posix(),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+            })
+    return sorted(found, key=lambda file: file["path"])
+
+
+def output_path(relative: str) -> str:
+    """
+    Path of the result of a source file, relative to the destination.
+
+    The source extension is kept (``scan.png`` -> ``scan.png.jpg``), so
+    files differing only in extension do not share a result.
+    """
+    return f"{relative}.jpg"
+
+
+def read_manifest(path: Path) -> dict[str, dict]:
+    """
+    Latest manifest entry of each source file.
+
+    A line cut short by an interrupted write is ignored.
+    """
+    entries = {}
+    if not path.exists():
+        return entries
+    with open(path, encoding="utf-8") as manifest:
+        for line in manifest:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[entry["path"]] = entry
+    return entries
+
+
+def is_done(entry: Optional[dict], file: dict, dest: Path) -> bool:
+    """Whether the manifest records the current version of a file as done."""
+    return bool(
+        entry
+        and entry["status"] == "done"
+        and entry["size"] == file["size"]
+        and entry["mtime"] == file["mtime"]
+        and (dest / entry["output"]).exists()
+    )
+
+
+def shard_files(files: list[dict], count: int) -> list[list[dict]]:
+    """
+    Split files into up to ``count`` shards of roughly equal total size.
+
+    Largest files are placed first, each on the lightest shard so far.
+    """
+    shards = [[] for _ in range(max(count, 1))]
+    loads = [0] * len(shards)
+    for file in sorted(files, key=lambda file: (-file["size"], file["path"])):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(file)
+        loads[lightest] += file["size"]
+    return [shard for shard in shards if shard]
+
+
+def available_cores() -> list[int]:
+    """CPU cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_slices(count: int, cores: Optional[list[int]] = None) -> list[list[int]]:
+    """Split the cores into ``count`` contiguous slices (shared round-robin if too few)."""
+    cores = cores if cores is not None else available_cores()
+    if count >= len(cores):
+        return [[cores[index % len(cores)]] for index in range(count)]
+    return [cores[index * len(cores) // count:(index + 1) * len(cores) // count] for index in range(count)]
+
+
+def colorize_files(
+    colorizer,
+    files: list[dict],
+    source: Path,
+    dest: Path,
+    emit: Callable[[dict], None],
+    render_factor: Optional[int] = None,
+    batch_size: int = BATCH_MAX_SIZE,
+) -> dict:
+    """
+    Colorize files through a decode -> inference -> encode pipeline.
+
+    Decoding and encoding (with writing) run in their own threads; the
+    calling thread runs the model on batches of ``batch_size`` images. The
+    queues between the stages hold two batches each. Images above
+    LARGE_IMAGE_PIXELS go through the large-image path one at a time.
+
+    Args:
+        colorizer: ImageColorizer (or a stand-in with the same interface)
+        files: Entries from find_images
+        emit: Called with the manifest entry of every finished file
+        render_factor: Rendering factor (default: the colorizer's)
+
+    Returns:
+        Seconds spent in each stage
+    """
+    from PIL import Image
+    from .colorizer import ImageColorizer
+    from .worker import use_large_path
+
+    decoded: queue.Queue = queue.Queue(maxsize=batch_size * 2)
+    colorized: queue.Queue = queue.Queue(maxsize=batch_size * 2)
+    seconds = {"decode": 0.0, "inference": 0.0, "encode": 0.0}
+
+    def fail(file: dict, error: Exception) -> None:
+        logger.warning(f"Failed to colorize {file['path']}: {error}")
+        emit({**file, "status": "failed", "error": str(error)})
+
+    def decode() -> None:
+        for file in files:
+            started = time.perf_counter()
+            try:
+                data = (source / file["path"]).read_bytes()
+                image = Image.open(io.BytesIO(data))
+                large = use_large_path(None, *image.size)
+                if large:
+                    # Decoded in reduced form by the large-image path itself
+                    image = data
+                else:
+                    image = ImageColorizer.load_image(image)
+                    image.load()
+            except Exception as e:
+                fail(file, e)
+                continue
+            finally:
+                seconds["decode"] += time.perf_counter() - started
+            decoded.put((file, image, large))
+        decoded.put(_END)
+
+    def encode() -> None:
+        while (item := colorized.get()) is not _END:
+            file, output = item
+            started = time.perf_counter()
+            try:
+                data = output if isinstance(output, bytes) else ImageColorizer.encode_image(output)
+                target = dest / output_path(file["path"])
+                target.parent.mkdir(parents=True, exist_ok=True)
+                # Written aside first: the manifest never points at a partial file
+                partial = target.with_name(target.name + ".part")
+                partial.write_bytes(data)
+                os.replace(partial, target)
+            except Exception as e:
+                fail(file, e)
+                continue
+            finally:
+                seconds["encode"] += time.perf_counter() - started
+            emit({**file, "status": "done", "output": output_path(file["path"])})
+
+    def infer(batch: list) -> None:
+        started = time.perf_counter()
+        try:
+            if batch[0][2]:
+                outputs = [data for data, _ in colorizer.colorize_batch([batch[0][1]], render_factor, large=True)]
+            else:
+                outputs = colorizer.colorize_images([image for _, image, _ in batch], render_factor)
+        except Exception as e:
+            if len(batch) == 1:
+                fail(batch[0][0], e)
+                return
+            # Find the image that broke the batch; the others still succeed
+            for item in batch:
+                infer([item])
+            return
+        finally:
+            seconds["inference"] += time.perf_counter() - started
+        for (file, _, _), output in zip(batch, outputs):
+            colorized.put((file, output))
+
+    decoder = threading.Thread(target=decode, name="bulk-decode", daemon=True)
+    encoder = threading.Thread(target=encode, name="bulk-encode", daemon=True)
+    decoder.start()
+    encoder.start()
+    try:
+        batch = []
+        while (item := decoded.get()) is not _END:
+            if item[2]:
+                infer([item])
+                continue
+            batch.append(item)
+            if len(batch) == batch_size:
+                infer(batch)
+                batch = []
+        if batch:
+            infer(batch)
+    finally:
+        colorized.put(_END)
+        encoder.join()
+    return {stage: round(value, 3) for stage, value in seconds.items()}
+
+
+def _pin(cores: list[int]) -> None:
+    """Restrict this process and its inference threads to some cores."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    if importlib.util.find_spec("torch") is not None:
+        from .inference import set_threads
+        set_threads(len(cores))
+
+
+def _shard_main(
+    index: int,
+    cores: list[int],
+    files: list[dict],
+    source: str,
+    dest: str,
+    model: Optional[str],
+    render_factor: Optional[int],
+    batch_size: int,
+    results,
+) -> None:
+    """Entry point of a shard process: results and a final report go to ``results``."""
+    # Ctrl+C reaches the whole process group; the parent stops the shards
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    _pin(cores)
+    from .registry import get_model_registry
+
+    colorizer = get_model_registry().get(model)
+    logger.info(f"Shard {index}: {len(files)} files on cores {cores}")
+    seconds = colorize_files(
+        colorizer, files, Path(source), Path(dest), results.put, render_factor, batch_size
+    )
+    results.put({"shard": index, "seconds": seconds})
+
+
+class Progress:
+    """Throughput and ETA of a run."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.finished = 0
+        self.started = time.monotonic()
+
+    def rate(self) -> float:
+        """Images finished per second since the start."""
+        elapsed = time.monotonic() - self.started
+        return self.finished / elapsed if elapsed > 0 else 0.0
+
+    def line(self) -> str:
+        rate = self.rate()
+        remaining = self.total - self.finished
+        eta = str(timedelta(seconds=round(remaining / rate))) if rate > 0 else "?"
+        return f"{self.finished}/{self.total} images, {rate:.2f} images/s, ETA {eta}"
+
+
+def run(
+    source: Path,
+    dest: Path,
+    processes: int,
+    batch_size: int = BATCH_MAX_SIZE,
+    model: Optional[str] = None,
+    render_factor: Optional[int] = None,
+    manifest: Optional[Path] = None,
+    report_interval: float = 5.0,
+) -> dict:
+    """
+    Colorize a directory tree, resuming from the manifest.
+
+    Returns:
+        Summary: file counts, duration, throughput and per-shard stage seconds
+    """
+    source, dest = Path(source).resolve(), Path(dest).resolve()
+    dest.mkdir(parents=True, exist_ok=True)
+    manifest = manifest or dest / MANIFEST_NAME
+    recorded = read_manifest(manifest)
+    files = find_images(source, exclude=dest)
+    todo = [file for file in files if not is_done(recorded.get(file["path"]), file, dest)]
+    summary = {"total": len(files), "skipped": len(files) - len(todo), "done": 0, "failed": 0}
+    if not todo:
+        return {**summary, "seconds": 0.0, "imagesPerSecond": 0.0, "shards": []}
+
+    shards = shard_files(todo, processes)
+    slices = cpu_slices(len(shards))
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [
+        context.Process(
+            target=_shard_main,
+            args=(index, slices[index], shard, str(source), str(dest), model, render_factor, batch_size, results),
+            name=f"bulk-{index}",
+            daemon=True,
+        )
+        for index, shard in enumerate(shards)
+    ]
+    logger.info(
+        f"{len(todo)} of {len(files)} files to colorize ({summary['skipped']} done before) "
+        f"in {len(shards)} processes"
+    )
+    for worker in workers:
+        worker.start()
+
+    progress = Progress(len(todo))
+    reports = {}
+    last_report = time.monotonic()
+    try:
+        with open(manifest, "a+", encoding="utf-8") as log:
+            # A line cut short by an interrupted run must not swallow the next one
+            if log.tell() > 0:
+                log.seek(log.tell() - 1)
+                if log.read(1) != "\n":
+                    log.write("\n")
+            while len(reports) < len(workers):
+                try:
+                    message = results.get(timeout=0.5)
+                except queue.Empty:
+                    crashed = [
+                        index for index, worker in enumerate(workers)
+                        if not worker.is_alive() and index not in reports
+                    ]
+                    if crashed and results.empty():
+                        for index in crashed:
+                            logger.error(f"Shard {index} exited with code {workers[index].exitcode}")
+                            reports[index] = {"shard": index, "exitcode": workers[index].exitcode}
+                    message = None
+                if message is not None and "shard" in message:
+                    reports[message["shard"]] = message
+                elif message is not None:
+                    log.write(json.dumps(message) + "\n")
+                    log.flush()
+                    progress.finished += 1
+                    summary[message["status"]] += 1
+                if time.monotonic() - last_report >= report_interval:
+                    last_report = time.monotonic()
+                    print(progress.line(), flush=True)
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+
+    print(progress.line(), flush=True)
+    elapsed = time.monotonic() - progress.started
+    return {
+        **summary,
+        "seconds": round(elapsed, 3),
+        "imagesPerSecond": round(progress.rate(), 3),
+        "shards": [reports[index] for index in sorted(reports)],
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    cores = len(available_cores())
+    parser = argparse.ArgumentParser(description="Colorize every image in a directory tree")
+    parser.add_argument("source", nargs="?", type=Path, default=DEFAULT_SOURCE)
+    parser.add_argument("dest", nargs="?", type=Path, default=DEFAULT_DEST)
+    parser.add_argument(
+        "--processes", type=int, default=max(cores // 4, 1),
+        help="Worker processes, each pinned to its share of the cores (default: one per 4 cores)",
+    )
+    parser.add_argument("--batch-size", type=int, default=BATCH_MAX_SIZE, help="Images per forward pass")
+    parser.add_argument("--model", help="Model name from MODELS (default: DEFAULT_MODEL)")
+    parser.add_argument("--render-factor", type=int, help="Rendering factor (default: the model's)")
+    parser.add_argument("--manifest", type=Path, help=f"Progress manifest (default: DEST/{MANIFEST_NAME})")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="Seconds between progress lines")
+    args = parser.parse_args(argv)
+    if not args.source.is_dir():
+        parser.error(f"{args.source} is not a directory")
+    if args.model is not None and args.model not in MODELS:
+        parser.error(f"--model must name a model from MODELS ({', '.join(MODELS)})")
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        summary = run(
+            args.source, args.dest, args.processes, args.batch_size, args.model,
+            args.render_factor, args.manifest, args.report_interval,
+        )
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; run again to resume from the manifest")
+        return 130
+    print(json.dumps(summary, indent=2))
+    crashed = any("exitcode" in report for report in summary["shards"])
+    return 1 if summary["failed"] or crashed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+Colorization result cache.
+
+Results are keyed by everything that determines the output: the SHA-256 of
+the input image, the model weights, the render_factor and the output format.
+A small in-memory LRU sits in front of a larger on-disk tier; both tiers are
+bounded by a byte budget and evict the least recently used entries.
+
+The memory tier belongs to one process. The disk tier is one directory
+shared by all worker processes, and its budget applies to the directory as
+a whole: recency is kept in the files' modification times, and a process
+whose index goes over the budget rebuilds it from the directory before
+evicting, so entries written by the other processes are counted too.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from .config import RESULT_CACHE_DIR, RESULT_CACHE_MEMORY_MB, RESULT_CACHE_DISK_MB
+
+logger = logging.getLogger(__name__)
+
+
+def model_fingerprint(model_path: str) -> str:
+    """
+    Identify a weights file by name, size and modification time.
+
+    Replacing the weights in place (e.g. with a new fine-tune) changes the
+    fingerprint, so stale results are never served.
+    """
+    try:
+        stat = os.stat(model_path)
+        return f"{os.path.basename(model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    except OSError:
+        return os.path.basename(model_path)
+
+
+def make_cache_key(
+    input_sha256: str,
+    model_id: str,
+    render_factor: int,
+    output_format: str,
+    variant: str = "standard",
+) -> str:
+    """
+    Build the cache key for a colorization result.
+
+    ``variant`` distinguishes processing paths that produce different output
+    for the same inputs (e.g. the large-image path).
+    """
+    raw = f"{input_sha256}|{model_id}|{render_factor}|{output_format.lower()}"
+    if variant != "standard":
+        raw += f"|{variant}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Two-tier (memory + disk) LRU cache of colorized image bytes."""
+
+    def __init__(
+        self,
+        directory: Path,
+        memory_budget_bytes: int,
+        disk_budget_bytes: int,
+    ):
+        """
+        Initialize the cache and index existing disk entries.
+
+        Args:
+            directory: Directory for the on-disk tier
+            memory_budget_bytes: Maximum bytes kept in memory
+            disk_budget_bytes: Maximum bytes kept on disk
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.memory_budget = memory_budget_bytes
+        self.disk_budget = disk_budget_bytes
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        self._counters = {"memoryHits": 0, "diskHits": 0, "misses": 0, "evictions": 0}
+        self._load_disk_index()
+        self._evict_disk(rescan=False)
+
+    def _path_for(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _load_disk_index(self) -> None:
+        """Rebuild the disk LRU order and size from the files in the directory."""
+        entries = []
+        for path in self.directory.glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # Evicted by another process meanwhile
+                continue
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+        self._disk = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._disk_bytes = sum(self._disk.values())
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Look up a cached result.
+
+        Disk hits (including entries written by other processes) are
+        promoted to the memory tier.
+
+        Returns:
+            Cached bytes, or None on a miss
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._counters["memoryHits"] += 1
+                return data
+
+        path = self._path_for(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            data = None
+        with self._lock:
+            if data is None:
+                self._drop_disk_entry(key)
+                self._counters["misses"] += 1
+                return None
+            self._add_disk_entry(key, len(data))
+            self._counters["diskHits"] += 1
+            self._put_memory(key, data)
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store a result in both tiers."""
+        path = self._path_for(key)
+        if len(data) <= self.disk_budget:
+            # Another process may have stored the same result already
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_name = tempfile.mkstemp(dir=self.directory)
+                try:
+                    with os.fdopen(fd, "wb") as tmp:
+                        tmp.write(data)
+                    os.replace(tmp_name, path)
+                except Exception:
+                    if os.path.exists(tmp_name):
+                        os.unlink(tmp_name)
+                    raise
+            with self._lock:
+                self._add_disk_entry(key, len(data))
+                self._evict_disk()
+
+        with self._lock:
+            self._put_memory(key, data)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and tier sizes."""
+        with self._lock:
+            lookups = sum(v for k, v in self._counters.items() if k != "evictions")
+            hits = self._counters["memoryHits"] + self._counters["diskHits"]
+            return {
+                **self._counters,
+                "hitRate": hits / lookups if lookups else 0.0,
+                "memoryEntries": len(self._memory),
+                "memoryBytes": self._memory_bytes,
+                "diskEntries": len(self._disk),
+                "diskBytes": self._disk_bytes,
+            }
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        """Insert into the memory tier (caller holds the lock)."""
+        if len(data) > self.memory_budget:
+            return
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _add_disk_entry(self, key: str, size: int) -> None:
+        """Record a disk entry as most recently used, counting it once (caller holds the lock)."""
+        self._drop_disk_entry(key)
+        self._disk[key] = size
+        self._disk_bytes += size
+
+    def _drop_disk_entry(self, key: str) -> None:
+        """Forget a disk entry (caller holds the lock)."""
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _evict_disk(self, rescan: bool = True) -> None:
+        """
+        Delete least recently used files until under budget (caller holds the lock).
+
+        Args:
+            rescan: Rebuild the index from the shared directory before
+                evicting, once this process's view is over the budget
+        """
+        if self._disk_bytes <= self.disk_budget:
+            return
+        if rescan:
+            self._load_disk_index()
+        while self._disk_bytes > self.disk_budget and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._counters["evictions"] += 1
+            try:
+                self._path_for(key).unlink()
+            except FileNotFoundError:
+                pass
+
+
+# Global cache instance (lazy initialization)
+_cache_instance: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Get or create the global result cache."""
+    global _cache_instance
+    with _cache_lock:
+        if _cache_instance is None:
+            _cache_instance = ResultCache(
+                RESULT_CACHE_DIR,
+                memory_budget_bytes=RESULT_CACHE_MEMORY_MB * 1024 * 1024,
+                disk_budget_bytes=RESULT_CACHE_DISK_MB * 1024 * 1024,
+            )
+    return _cache_instance
@@ -0,0 +1,129 @@
+"""
+Vectorized colour-space helpers for full-resolution chroma transfer.
+
+The model only sees a small square version of the image, and the colour it
+predicts is smooth, so only the chroma planes need to be upsampled; the
+detail comes from the original full-resolution luminance. Everything here
+works on row strips, so peak memory is bounded by the output array plus a
+few strips of temporaries, independent of how large the scan is.
+"""
+import numpy as np
+
+# ITU-R BT.601 full-range (JPEG) conversion, identical to PIL's YCbCr mode
+_RGB_TO_YCBCR = np.array([
+    [0.299, 0.587, 0.114],
+    [-0.168736, -0.331264, 0.5],
+    [0.5, -0.418688, -0.081312],
+], dtype=np.float32)
+
+# Cb/Cr to (R-Y, G-Y, B-Y)
+_CHROMA_TO_RGB_OFFSET = np.array([
+    [0.0, 1.402],
+    [-0.344136, -0.714136],
+    [1.772, 0.0],
+], dtype=np.float32)
+
+
+def rgb_to_luma(rgb: np.ndarray) -> np.ndarray:
+    """
+    Compute the luminance (Y) plane of an RGB image.
+
+    Args:
+        rgb: Array of shape (H, W, 3), uint8
+
+    Returns:
+        uint8 array of shape (H, W)
+    """
+    luma = rgb.astype(np.float32) @ _RGB_TO_YCBCR[0]
+    luma += 0.5
+    return np.clip(luma, 0, 255).astype(np.uint8)
+
+
+def rgb_to_chroma(rgb: np.ndarray) -> np.ndarray:
+    """
+    Extract the Cb/Cr planes of an RGB image.
+
+    Args:
+        rgb: Array of shape (H, W, 3), uint8
+
+    Returns:
+        float32 array of shape (H, W, 2), centred on zero
+    """
+    return rgb.astype(np.float32) @ _RGB_TO_YCBCR[1:].T
+
+
+def _bilinear_axis(src_size: int, dst_size: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sample positions for resizing one axis with pixel-centre alignment.
+
+    Returns:
+        (lower index, upper index, weight of the upper index) per output pixel
+    """
+    scale = src_size / dst_size
+    pos = (np.arange(dst_size, dtype=np.float32) + 0.5) * scale - 0.5
+    pos = np.clip(pos, 0, src_size - 1)
+    lower = np.floor(pos).astype(np.intp)
+    upper = np.minimum(lower + 1, src_size - 1)
+    return lower, upper, (pos - lower).astype(np.float32)
+
+
+def transfer_chroma(
+    luma: np.ndarray,
+    chroma: np.ndarray,
+    strip_rows: int = 256,
+    out: np.ndarray = None,
+) -> np.ndarray:
+    """
+    Combine full-resolution luminance with low-resolution chroma.
+
+    The chroma planes are bilinearly upsampled to the luminance size one
+    strip of rows at a time and converted straight to RGB.
+
+    Args:
+        luma: Full-resolution Y plane, shape (H, W), uint8
+        chroma: Low-resolution Cb/Cr planes from rgb_to_chroma, shape (h, w, 2)
+        strip_rows: Number of output rows processed at once
+        out: Optional preallocated (H, W, 3) uint8 output array
+
+    Returns:
+        RGB image, shape (H, W, 3), uint8
+    """
+    height, width = luma.shape
+    if out is None:
+        out = np.empty((height, width, 3), dtype=np.uint8)
+
+    src_h, src_w = chroma.shape[:2]
+    y0, y1, wy = _bilinear_axis(src_h, height)
+    x0, x1, wx = _bilinear_axis(src_w, width)
+
+    # Per-channel offsets from luminance (R-Y, G-Y, B-Y). Interpolation is
+    # linear, so upsampling the offsets equals converting upsampled chroma,
+    # and each strip then needs a single broadcast add.
+    offsets = chroma @ _CHROMA_TO_RGB_OFFSET.T
+
+    # Horizontal pass once over the few source rows: (src_h, W, 3)
+    wx = wx[None, :, None]
+    wide = offsets[:, x0] * (1 - wx) + offsets[:, x1] * wx
+    del offsets
+
+    for top in range(0, height, strip_rows):
+        bottom = min(top + strip_rows, height)
+        rows = slice(top, bottom)
+
+        # Vertical pass for this strip as a small dense matrix product over
+        # the source rows it touches (much faster than gathering rows)
+        first, last = y0[top], y1[bottom - 1] + 1
+        weights = np.zeros((bottom - top, last - first), dtype=np.float32)
+        index = np.arange(bottom - top)
+        np.add.at(weights, (index, y0[rows] - first), 1 - wy[rows])
+        np.add.at(weights, (index, y1[rows] - first), wy[rows])
+        strip = (weights @ wide[first:last].reshape(last - first, -1)).reshape(bottom - top, width, 3)
+
+        # +0.5 so that the truncating cast to uint8 rounds to nearest
+        luma_strip = luma[rows].astype(np.float32)
+        luma_strip += 0.5
+        strip += luma_strip[..., None]
+        np.clip(strip, 0, 255, out=strip)
+        out[rows] = strip
+
+    return out
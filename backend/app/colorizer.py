@@ -1,56 +1,83 @@
 """
 DeOldify image colorization logic.
+
+torch and the DeOldify/fastai stack are imported when the model is
+initialized, not when this module is imported, so importing it is cheap.
 """
+import gc
 import os
-import torch
+import importlib.util
+import sys
+import time
 from PIL import Image
 import io
 import base64
-from typing import Optional
+from typing import Optional, Union
 import logging
 
+from .tracing import record_stage, stage
+
 logger = logging.getLogger(__name__)
 
-# Try to import DeOldify
-DEOLDIFY_AVAILABLE = False
-try:
-    from deoldify import device
-    from deoldify.device_id import DeviceId
-    from deoldify.visualize import get_image_colorizer
-    DEOLDIFY_AVAILABLE = True
-except ImportError as e:
-    logger.warning(f"DeOldify not available: {e}. Install it to enable colorization.")
-except Exception as e:
-    logger.warning(f"DeOldify import error: {e}")
+# Anything ImageColorizer.load_image can decode: encoded bytes, a PIL image or a NumPy array
+ImageSource = Union[bytes, bytearray, memoryview, Image.Image, "numpy.ndarray"]
+
+# Only check that DeOldify is installed; it is imported in _initialize_model
+DEOLDIFY_AVAILABLE = importlib.util.find_spec("deoldify") is not None
 
 
 class ImageColorizer:
     """Wrapper for DeOldify image colorization."""
     
-    def __init__(self, model_path: Optional[str] = None, render_factor: int = 35):
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        render_factor: int = 35,
+        artistic: Optional[bool] = None,
+        device: Optional[str] = None,
+        backend: Optional[str] = None,
+        quantized: Optional[bool] = None,
+    ):
         """
         Initialize the colorizer.
         
         Args:
             model_path: Path to DeOldify model weights. If None, uses default location.
             render_factor: Rendering factor (higher = better quality but slower). Default 35.
+            artistic: Use the artistic generator. If None, decided from the file name.
+            device: "cuda" or "cpu". If None, CUDA is used when available.
+            backend: Inference backend (see inference.py). Defaults to INFERENCE_BACKEND.
+            quantized: Use the int8 export (ONNX). Defaults to INFERENCE_QUANTIZED.
         """
+        from .config import INFERENCE_BACKEND, INFERENCE_QUANTIZED
+        
         self.render_factor = render_factor
         self.model_path = model_path or os.getenv(
             "DEOLDIFY_MODEL_PATH",
             os.path.join(os.path.dirname(__file__), "../../ml/models/ColorAize_weights.pth")
         )
+        self.artistic = artistic
+        self.requested_device = device
+        self.backend = backend or INFERENCE_BACKEND
+        self.quantized = INFERENCE_QUANTIZED if quantized is None else quantized
+        # Exported generators per render_factor (None = run eagerly)
+        self._runners: dict = {}
         self.colorizer = None
         self.device = None
         
         if DEOLDIFY_AVAILABLE:
             self._initialize_model()
+        else:
+            logger.warning("DeOldify not available. Install it to enable colorization.")
     
     def _initialize_model(self):
         """Initialize DeOldify model."""
         try:
             import torch
             import ssl
+            from deoldify import device
+            from deoldify.device_id import DeviceId
+            from deoldify.visualize import get_artistic_image_colorizer, get_stable_image_colorizer
             from pathlib import Path
             from .config import BASE_DIR
             
@@ -73,7 +100,8 @@ class ImageColorizer:
             torch.load = patched_torch_load
             
             # Set device
-            if torch.cuda.is_available():
+            use_cuda = torch.cuda.is_available() if self.requested_device is None else self.requested_device == "cuda"
+            if use_cuda:
                 self.device = torch.device("cuda")
                 device.set(device=DeviceId.GPU0)
             else:
@@ -81,6 +109,8 @@ class ImageColorizer:
                 device.set(device=DeviceId.CPU)
             
             logger.info(f"Using device: {self.device}")
+            from .inference import set_threads
+            set_threads()
             
             # Determine root folder (where DeOldify will look for models/)
             # DeOldify expects models in root_folder/models/
@@ -89,9 +119,11 @@ class ImageColorizer:
             project_root = BASE_DIR.parent
             root_folder = project_root / "ml"  # DeOldify will look in ml/models/
             
-            # Determine which model to use based on filename
+            # Determine which model to use based on filename, unless given
             model_name = Path(self.model_path).name
-            use_artistic = "Artistic" in model_name or "artistic" in model_name.lower()
+            use_artistic = self.artistic
+            if use_artistic is None:
+                use_artistic = "Artistic" in model_name or "artistic" in model_name.lower()
             
             # Check if model file exists
             if not os.path.exists(self.model_path):
@@ -125,11 +157,13 @@ class ImageColorizer:
                 os.chdir(str(root_folder))
                 
                 # Initialize colorizer
-                # DeOldify looks for models in root_folder/models/ and ./dummy/ relative to cwd
+                # DeOldify loads <root>/models/<weights_name>.pth and ./dummy/ relative to cwd
                 # Note: Model is already pre-trained, no training needed!
-                self.colorizer = get_image_colorizer(
-                    root_folder=root_folder,
-                    artistic=use_artistic,
+                weights = Path(self.model_path).resolve()
+                get_generator = get_artistic_image_colorizer if use_artistic else get_stable_image_colorizer
+                self.colorizer = get_generator(
+                    root_folder=weights.parent.parent,
+                    weights_name=weights.stem,
                     render_factor=self.render_factor
                 )
             finally:
@@ -141,61 +175,371 @@ class ImageColorizer:
             logger.error(f"Failed to initialize DeOldify model: {e}")
             raise
     
-    def colorize(self, image_data: bytes, mime_type: str = "image/jpeg") -> tuple[bytes, str]:
+    def _check_ready(self):
+        """Raise if the model cannot be used."""
+        if not DEOLDIFY_AVAILABLE:
+            raise RuntimeError("DeOldify is not available. Please install it first.")
+        
+        if self.colorizer is None:
+            raise RuntimeError("Colorizer not initialized. Call _initialize_model() first.")
+    
+    @staticmethod
+    def load_image(source: ImageSource) -> Image.Image:
+        """
+        Decode an image from memory.
+        
+        Args:
+            source: Encoded image bytes (bytes, bytearray or memoryview),
+                a PIL image, or a NumPy array (H, W) / (H, W, 3) of uint8
+        
+        Returns:
+            RGB PIL image
+        """
+        if isinstance(source, Image.Image):
+            image = source
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            # BytesIO shares a bytes object's buffer instead of copying it
+            image = Image.open(io.BytesIO(source))
+        elif hasattr(source, "__array_interface__"):
+            image = Image.fromarray(source)
+        else:
+            raise TypeError(f"Unsupported image source: {type(source).__name__}")
+        return image if image.mode == "RGB" else image.convert("RGB")
+    
+    @staticmethod
+    def encode_image(image: Image.Image, format: str = "JPEG", quality: int = 95) -> bytes:
+        """Encode a PIL image to bytes."""
+        output_buffer = io.BytesIO()
+        image.save(output_buffer, format=format, quality=quality)
+        return output_buffer.getvalue()
+    
+    def colorize_image(self, source: ImageSource, render_factor: Optional[int] = None) -> Image.Image:
+        """
+        Colorize an in-memory image.
+        
+        Runs DeOldify's filter directly on the decoded image, without the
+        temporary file that get_transformed_image would need to read from.
+        
+        Args:
+            source: Encoded bytes, PIL image or NumPy array (see load_image)
+            render_factor: Rendering factor, defaults to the instance's
+            
+        Returns:
+            Colorized RGB PIL image
+        """
+        self._check_ready()
+        from deoldify.visualize import get_watermarked
+        
+        original = self.load_image(source)
+        colorized_image = self.colorizer.filter.filter(
+            original, original, render_factor=render_factor or self.render_factor
+        )
+        # get_transformed_image watermarks by default; keep the output identical
+        return get_watermarked(colorized_image)
+    
+    def colorize(
+        self,
+        image_data: ImageSource,
+        mime_type: str = "image/jpeg",
+        render_factor: Optional[int] = None,
+    ) -> tuple[bytes, str]:
         """
         Colorize a black and white image.
         
         Args:
-            image_data: Raw image bytes
+            image_data: Raw image bytes (or a decoded image, see load_image)
             mime_type: MIME type of the input image
+            render_factor: Rendering factor, defaults to the instance's
             
         Returns:
             Tuple of (colorized_image_bytes, output_mime_type)
         """
-        if not DEOLDIFY_AVAILABLE:
-            raise RuntimeError("DeOldify is not available. Please install it first.")
-        
-        if self.colorizer is None:
-            raise RuntimeError("Colorizer not initialized. Call _initialize_model() first.")
-        
-        import tempfile
-        from pathlib import Path
-        
-        # DeOldify's get_transformed_image expects a file path, not a PIL Image
-        # So we need to save the image to a temporary file first
-        temp_file = None
+        self._check_ready()
         try:
-            # Create a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                temp_path = Path(temp_file.name)
-                # Write image bytes to temp file
-                temp_file.write(image_data)
-                temp_file.flush()
-            
-            # Colorize using DeOldify (it will read the file)
-            colorized_image = self.colorizer.get_transformed_image(
-                temp_path,
-                render_factor=self.render_factor
-            )
-            
-            # Convert back to bytes
-            output_buffer = io.BytesIO()
-            colorized_image.save(output_buffer, format="JPEG", quality=95)
-            colorized_bytes = output_buffer.getvalue()
-            
-            # Clean up temp file
-            if temp_path.exists():
-                temp_path.unlink()
-            
-            return colorized_bytes, "image/jpeg"
-            
+            colorized_image = self.colorize_image(image_data, render_factor)
+            return self.encode_image(colorized_image), "image/jpeg"
         except Exception as e:
             logger.error(f"Colorization failed: {e}")
-            # Clean up temp file on error
-            if temp_file and Path(temp_file.name).exists():
-                Path(temp_file.name).unlink()
             raise RuntimeError(f"Failed to colorize image: {str(e)}")
     
+    def colorize_batch(
+        self,
+        images: list[ImageSource],
+        render_factor: Optional[int] = None,
+        large: bool = False,
+    ) -> list[tuple[bytes, str]]:
+        """
+        Colorize several images with a single forward pass of the generator.
+
+        All images are scaled to the same square model input (render_factor * 16),
+        so they can be stacked into one tensor regardless of their original size.
+
+        Args:
+            images: Encoded bytes, PIL images or NumPy arrays (see load_image)
+            render_factor: Rendering factor shared by the whole batch
+            large: Use the large-image path (see _transform_batch_large)
+
+        Returns:
+            List of (colorized_image_bytes, output_mime_type), in input order
+        """
+        self._check_ready()
+
+        render_factor = render_factor or self.render_factor
+        try:
+            if large:
+                return [
+                    (data, "image/jpeg")
+                    for data in self._transform_batch_large(images, render_factor)
+                ]
+            with stage("decode"):
+                originals = [self.load_image(source) for source in images]
+            colorized_images = self.colorize_images(originals, render_factor)
+            with stage("encode"):
+                return [(self.encode_image(image), "image/jpeg") for image in colorized_images]
+        except Exception as e:
+            logger.error(f"Batch colorization failed: {e}")
+            raise RuntimeError(f"Failed to colorize image: {str(e)}")
+
+    def colorize_images(self, images: list[Image.Image], render_factor: Optional[int] = None) -> list[Image.Image]:
+        """
+        Colorize decoded images with a single forward pass, without encoding them.
+
+        Lets callers run decoding and encoding in other threads (see bulk.py).
+
+        Args:
+            images: RGB PIL images
+            render_factor: Rendering factor shared by the whole batch
+
+        Returns:
+            Colorized RGB PIL images, in input order
+        """
+        self._check_ready()
+        with stage("inference"):
+            return self._transform_batch(images, render_factor or self.render_factor)
+
+    def predict_frames(self, frames: list, render_factor: Optional[int] = None) -> list:
+        """
+        Raw colour predictions for a batch of video frames.
+
+        Only the chroma of the predictions is used (see video.py), so the
+        frames are not post-processed or encoded here.
+
+        Args:
+            frames: RGB frames as NumPy arrays
+            render_factor: Rendering factor shared by the whole batch
+
+        Returns:
+            Square RGB predictions (render_factor * 16 pixels) as uint8 arrays
+        """
+        import numpy as np
+
+        self._check_ready()
+        render_factor = render_factor or self.render_factor
+        with stage("inference"):
+            predictions = self._predict_batch([Image.fromarray(frame) for frame in frames], render_factor)
+        return [np.asarray(prediction) for prediction in predictions]
+
+    def _runner_for(self, render_factor: int):
+        """Exported generator for a render_factor, or None to run eagerly."""
+        if render_factor not in self._runners:
+            from .inference import load_runner
+            self._runners[render_factor] = load_runner(
+                self.backend, self.model_path, render_factor, self.quantized, self.device
+            )
+        return self._runners[render_factor]
+
+    def _predict_batch(self, model_inputs: list, render_factor: int, eager: bool = False) -> list:
+        """
+        Run the generator on a batch of images.
+
+        Args:
+            model_inputs: PIL images of any size (scaled to the model input here)
+            render_factor: Rendering factor
+            eager: Run the fastai model even if an exported backend is configured
+
+        Returns:
+            Raw square colour predictions (render_factor * 16 pixels) as PIL images
+        """
+        import numpy as np
+        import torch
+        from fastai.basic_data import DatasetType
+        from fastai.vision.image import pil2tensor, image2np
+        from .profiling import torch_section
+
+        colorizer_filter = self.colorizer.filter.filters[0]
+        render_sz = render_factor * colorizer_filter.render_base
+
+        inputs = []
+        for model_input in model_inputs:
+            model_image = colorizer_filter._get_model_ready_image(model_input, render_sz)
+            inputs.append(pil2tensor(model_image, np.float32).div_(255))
+        x = torch.stack(inputs).to(colorizer_filter.device)
+        x, y = colorizer_filter.norm((x, x), do_x=True)
+
+        runner = None if eager else self._runner_for(render_factor)
+        if runner is None:
+            with torch_section():
+                predictions = colorizer_filter.learn.pred_batch(
+                    ds_type=DatasetType.Valid, batch=(x, y), reconstruct=True
+                )
+            raw_outputs = [prediction.px for prediction in predictions]
+        else:
+            # Same post-processing as Learner.pred_batch(reconstruct=True)
+            learn = colorizer_filter.learn
+            with torch_section():
+                raw = runner(x).detach().cpu()
+            norm = getattr(learn.data, "norm", False)
+            if norm and norm.keywords.get("do_y", False):
+                raw = learn.data.denorm(raw, do_x=True)
+            raw_outputs = [item.float().clamp(min=0, max=1) for item in raw]
+
+        outputs = []
+        for px in raw_outputs:
+            out = colorizer_filter.denorm(px, do_x=False)
+            outputs.append(Image.fromarray(image2np(out * 255).astype(np.uint8)))
+        return outputs
+
+    def _transform_batch(self, originals: list, render_factor: int) -> list:
+        """
+        Run DeOldify's colorizer filter over a batch of PIL images.
+
+        Mirrors ColorizerFilter.filter (scale to square, predict, unsquare,
+        post-process luminance) and get_transformed_image (watermark), but
+        stacks the model inputs so the generator runs once per batch.
+        """
+        from deoldify.visualize import get_watermarked
+
+        filters = self.colorizer.filter.filters
+        if len(filters) != 1:
+            # Unknown filter chain, fall back to one image at a time
+            return [
+                get_watermarked(self.colorizer.filter.filter(orig, orig, render_factor=render_factor))
+                for orig in originals
+            ]
+
+        colorizer_filter = filters[0]
+        outputs = []
+        for orig, raw in zip(originals, self._predict_batch(originals, render_factor)):
+            raw_color = colorizer_filter._unsquare(raw, orig)
+            final = colorizer_filter._post_process(raw_color, orig)
+            outputs.append(get_watermarked(final))
+        return outputs
+
+    @staticmethod
+    def load_preview(source: ImageSource, working_size: int) -> Image.Image:
+        """
+        Decode a reduced RGB copy of an image for the model.
+
+        For JPEG input the decoder's draft mode decodes directly at a reduced
+        scale (1/2 to 1/8), so the full-size RGB image is never materialized.
+
+        Args:
+            source: Encoded bytes, PIL image or NumPy array
+            working_size: Minimum side of the preview (the model input size)
+        """
+        if not isinstance(source, (bytes, bytearray, memoryview)):
+            return ImageColorizer.load_image(source)
+        preview = Image.open(io.BytesIO(source))
+        preview.draft("RGB", (working_size, working_size))
+        return preview.convert("RGB")
+
+    @staticmethod
+    def load_luminance(source: ImageSource) -> "numpy.ndarray":
+        """
+        Decode the full-resolution luminance (Y) plane of an image.
+
+        JPEG input is decoded straight to grayscale, skipping colour conversion.
+
+        Returns:
+            uint8 array of shape (H, W)
+        """
+        import numpy as np
+
+        if not isinstance(source, (bytes, bytearray, memoryview)):
+            return np.asarray(ImageColorizer.load_image(source).convert("L"))
+        full = Image.open(io.BytesIO(source))
+        full.draft("L", full.size)
+        return np.asarray(full.convert("L"))
+
+    def _transform_batch_large(self, sources: list, render_factor: int) -> list:
+        """
+        Large-image variant of _transform_batch.
+
+        The generator runs on reduced previews; only its chroma is upsampled
+        (in row strips) and recombined with the original full-resolution
+        luminance. This matches DeOldify's own post-processing, which also
+        keeps the original luminance and takes only chroma from the model.
+        Images are finished one at a time, so at most one full-size
+        luminance/output pair is alive at once.
+
+        Returns:
+            Encoded JPEG bytes, in input order
+        """
+        import numpy as np
+        from deoldify.visualize import get_watermarked
+        from .chroma import rgb_to_chroma, transfer_chroma
+        from .config import CHROMA_STRIP_ROWS
+
+        render_sz = render_factor * self.colorizer.filter.filters[0].render_base
+        with stage("decode"):
+            previews = [self.load_preview(source, render_sz) for source in sources]
+        with stage("inference"):
+            raw_colors = self._predict_batch(previews, render_factor)
+        del previews
+
+        outputs = []
+        wall_started, started, encode_seconds = time.time(), time.perf_counter(), 0.0
+        for source, raw in zip(sources, raw_colors):
+            chroma = rgb_to_chroma(np.asarray(raw))
+            rgb = transfer_chroma(self.load_luminance(source), chroma, CHROMA_STRIP_ROWS)
+            encode_started = time.perf_counter()
+            outputs.append(self.encode_image(get_watermarked(Image.fromarray(rgb))))
+            encode_seconds += time.perf_counter() - encode_started
+            del rgb
+        postprocess_seconds = time.perf_counter() - started - encode_seconds
+        record_stage("postprocess", postprocess_seconds, wall_started)
+        record_stage("encode", encode_seconds)
+        return outputs
+
+    def warm_up(self, size: int = 64) -> None:
+        """
+        Run one dummy inference.
+
+        The first forward pass pays for lazy initialization (CUDA context,
+        cuDNN algorithm selection, allocator growth); doing it here keeps that
+        cost out of the first real job.
+        """
+        self.colorize_batch([Image.new("RGB", (size, size), (128, 128, 128))])
+
+    def memory_bytes(self) -> int:
+        """Size of the loaded generator's parameters and buffers, in bytes."""
+        self._check_ready()
+        import itertools
+
+        model = self.generator()
+        return sum(
+            tensor.numel() * tensor.element_size()
+            for tensor in itertools.chain(model.parameters(), model.buffers())
+        )
+
+    def generator(self) -> "torch.nn.Module":
+        """The underlying PyTorch generator (for export)."""
+        self._check_ready()
+        return self.colorizer.filter.filters[0].learn.model
+
+    def release(self) -> None:
+        """
+        Drop the generator so its memory can be reclaimed.
+
+        Batches already running keep their own reference and finish normally.
+        """
+        self.colorizer = None
+        self._runners.clear()
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
     def colorize_from_base64(self, base64_data: str, mime_type: str = "image/jpeg") -> str:
         """
         Colorize image from base64 string and return as base64 data URL.
@@ -226,14 +570,12 @@ class ImageColorizer:
         return f"data:{output_mime_type};base64,{colorized_base64}"
 
 
-# Global colorizer instance (lazy initialization)
-_colorizer_instance: Optional[ImageColorizer] = None
-
-
-def get_colorizer() -> ImageColorizer:
-    """Get or create the global colorizer instance."""
-    global _colorizer_instance
-    if _colorizer_instance is None:
-        _colorizer_instance = ImageColorizer()
-    return _colorizer_instance
+def get_colorizer(model: Optional[str] = None) -> ImageColorizer:
+    """
+    Get the colorizer of a model from the global model registry.
 
+    Args:
+        model: Name from MODELS (default: DEFAULT_MODEL)
+    """
+    from .registry import get_model_registry
+    return get_model_registry().get(model)
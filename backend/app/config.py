@@ -12,6 +12,15 @@ DATABASE_URL = os.getenv(
     "DATABASE_URL",
     f"sqlite:///{BASE_DIR / 'colorizer.db'}"
 )
+# Connection pool of each process (API and every worker): DB_POOL_SIZE kept
+# open, up to DB_MAX_OVERFLOW more under load, waiting at most
+# DB_POOL_TIMEOUT seconds for a free one. SQLite databases run in WAL mode so
+# readers never block on the writer; writers wait up to SQLITE_BUSY_TIMEOUT_MS
+# for the write lock instead of failing with "database is locked".
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 
 # DeOldify model
 # Default: ColorAize_weights.pth (stable model - more realistic colors)
@@ -21,16 +30,193 @@ DEOLDIFY_MODEL_PATH = os.getenv(
     str(Path(__file__).parent.parent.parent / "ml" / "models" / "ColorAize_weights.pth")
 )
 
+# Models selectable per upload, as "name=path" pairs. Weights whose file name
+# contains "artistic" run with DeOldify's artistic generator, others with the
+# stable one. Generators are loaded on first use and kept in an LRU bounded
+# by MODEL_MEMORY_BUDGET_MB (the most recently used one is always kept).
+# MODEL_DEVICE forces "cuda" or "cpu" (default: CUDA when available).
+MODELS = dict(
+    item.split("=", 1)
+    for item in os.getenv(
+        "MODELS",
+        f"stable={DEOLDIFY_MODEL_PATH},"
+        f"artistic={Path(DEOLDIFY_MODEL_PATH).parent / 'ColorizeArtistic_gen.pth'}",
+    ).split(",")
+)
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", next(iter(MODELS)))
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "4096"))
+MODEL_DEVICE = os.getenv("MODEL_DEVICE") or None
+# Replace ImageColorizer with another implementation, as "module:callable"
+# taking (weights path, artistic, device, render_factor); used by the
+# benchmarks to run the pipeline with a stub model
+COLORIZER_FACTORY = os.getenv("COLORIZER_FACTORY") or None
+
+# Inference backend: "eager" (fastai), or a graph exported with
+# `python -m app.export` into EXPORT_DIR ("torchscript" or "onnx";
+# INFERENCE_QUANTIZED selects the int8 ONNX export). INFERENCE_THREADS sets
+# intra-op threads (0 = library default).
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+INFERENCE_QUANTIZED = os.getenv("INFERENCE_QUANTIZED", "false").lower() in ("1", "true", "yes")
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", str(Path(DEOLDIFY_MODEL_PATH).parent / "exported")))
+
+# Batching: up to BATCH_MAX_SIZE images per forward pass, waiting at most
+# BATCH_MAX_WAIT_MS for a batch to fill up
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "4"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "50"))
+
+# Job queue: worker processes (0 = one worker thread inside the API process),
+# jobs in flight per worker, lease length, retry budget and admission limit
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", str(BATCH_MAX_SIZE * 2)))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.25"))
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "500"))
+JOB_RETRY_AFTER_SECONDS = int(os.getenv("JOB_RETRY_AFTER_SECONDS", "30"))
+WORKER_STATS_INTERVAL = float(os.getenv("WORKER_STATS_INTERVAL", "5"))
+# On shutdown workers stop claiming and finish their jobs for up to
+# WORKER_DRAIN_SECONDS; jobs still running then go straight back to the queue
+WORKER_DRAIN_SECONDS = float(os.getenv("WORKER_DRAIN_SECONDS", "10"))
+
+# Scheduling: jobs are claimed in order of a virtual deadline, their enqueue
+# time plus a delay. The delay grows with the estimated cost (pixels x
+# render_factor, x frames for videos) by SCHEDULER_COST_DELAY seconds per
+# megapixel-render-factor, up to SCHEDULER_MAX_COST_DELAY, and images of bulk
+# uploads get SCHEDULER_BULK_DELAY on top. Cheap interactive jobs overtake
+# expensive and bulk ones, but only those enqueued less than the delay
+# earlier, so nothing starves.
+SCHEDULER_COST_DELAY = float(os.getenv("SCHEDULER_COST_DELAY", "0.02"))
+SCHEDULER_MAX_COST_DELAY = float(os.getenv("SCHEDULER_MAX_COST_DELAY", "120"))
+SCHEDULER_BULK_DELAY = float(os.getenv("SCHEDULER_BULK_DELAY", "300"))
+# Running jobs check whether they were cancelled every CANCEL_POLL_SECONDS
+CANCEL_POLL_SECONDS = float(os.getenv("CANCEL_POLL_SECONDS", "1"))
+
+# Worker nodes: with WORKER_MODE=remote the API process starts no workers and
+# never loads a model; nodes started with `python -m app.worker` on any host
+# pull jobs from the shared queue. Every worker advertises its capacity and
+# models in the database each WORKER_STATS_INTERVAL and counts as gone after
+# NODE_TIMEOUT_SECONDS of silence. WORKER_MODELS limits the jobs a node
+# claims to some of MODELS (default: all of them).
+WORKER_MODE = os.getenv("WORKER_MODE", "embedded")
+WORKER_MODELS = tuple(filter(None, os.getenv("WORKER_MODELS", "").split(","))) or tuple(MODELS)
+NODE_TIMEOUT_SECONDS = float(os.getenv("NODE_TIMEOUT_SECONDS", str(WORKER_STATS_INTERVAL * 3)))
+
+# Image listing page size (keyset pagination)
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "50"))
+LIST_PAGE_SIZE_MAX = int(os.getenv("LIST_PAGE_SIZE_MAX", "200"))
+
+# Status push: SSE streams resynchronize from the database every
+# STATUS_RESYNC_SECONDS (queue positions, workers in other processes/hosts)
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+STATUS_RESYNC_SECONDS = float(os.getenv("STATUS_RESYNC_SECONDS", "2"))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+LONG_POLL_MAX_SECONDS = float(os.getenv("LONG_POLL_MAX_SECONDS", "30"))
+
+# Large-image mode: uploads above LARGE_IMAGE_PIXELS (with mode=auto) run the
+# model on a reduced preview and keep the full-resolution luminance;
+# chroma is upsampled CHROMA_STRIP_ROWS rows at a time
+LARGE_IMAGE_PIXELS = int(os.getenv("LARGE_IMAGE_PIXELS", str(8_000_000)))
+CHROMA_STRIP_ROWS = int(os.getenv("CHROMA_STRIP_ROWS", "256"))
+PROCESSING_MODES = ("auto", "standard", "large")
+
+# Video: clips up to MAX_VIDEO_UPLOAD_BYTES are decoded and re-encoded with
+# ffmpeg (FFMPEG_BINARY, FFPROBE_BINARY) through pipes, never as extracted
+# frames. Frames run through the model VIDEO_BATCH_SIZE at a time and are
+# encoded in segments of VIDEO_SEGMENT_FRAMES; a job interrupted by a worker
+# restart resumes after its last stored segment. Chroma is smoothed over time
+# (VIDEO_CHROMA_SMOOTHING = weight of the previous frames, 0 = off) and the
+# smoothing restarts at scene cuts (mean luminance change above VIDEO_SCENE_CUT).
+MAX_VIDEO_UPLOAD_BYTES = int(os.getenv("MAX_VIDEO_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+VIDEO_BATCH_SIZE = int(os.getenv("VIDEO_BATCH_SIZE", "8"))
+VIDEO_SEGMENT_FRAMES = int(os.getenv("VIDEO_SEGMENT_FRAMES", "240"))
+VIDEO_CHROMA_SMOOTHING = float(os.getenv("VIDEO_CHROMA_SMOOTHING", "0.6"))
+VIDEO_SCENE_CUT = float(os.getenv("VIDEO_SCENE_CUT", "30"))
+VIDEO_CRF = int(os.getenv("VIDEO_CRF", "18"))
+
+# Allowed range for the per-upload render_factor
+RENDER_FACTOR_MIN = 7
+RENDER_FACTOR_MAX = 45
+
 # Server
 PORT = int(os.getenv("PORT", "8000"))
 HOST = os.getenv("HOST", "0.0.0.0")
 
 # Storage
-STORAGE_DIR = BASE_DIR / "storage"
+STORAGE_DIR = Path(os.getenv("STORAGE_DIR", str(BASE_DIR / "storage")))
 UPLOADS_DIR = STORAGE_DIR / "uploads"
 PROCESSED_DIR = STORAGE_DIR / "processed"
+DERIVATIVES_DIR = STORAGE_DIR / "derivatives"
+PROFILES_DIR = STORAGE_DIR / "profiles"
+SEGMENTS_DIR = STORAGE_DIR / "segments"
 
 # Create storage directories if they don't exist
 UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+DERIVATIVES_DIR.mkdir(parents=True, exist_ok=True)
+PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+SEGMENTS_DIR.mkdir(parents=True, exist_ok=True)
+
+# Derivatives: downscaled variants (name -> longest side in pixels, e.g.
+# "thumb:256,preview:1024") plus "full", encoded in the formats below in
+# order of preference and chosen per request by the Accept header. JPEG is
+# always available as the fallback. Encoding runs in DERIVATIVE_WORKERS
+# processes (0, and inside worker processes: threads of the calling process).
+DERIVATIVE_SIZES = {
+    name: int(size)
+    for name, size in (
+        item.split(":") for item in os.getenv("DERIVATIVE_SIZES", "thumb:256,preview:1024").split(",")
+    )
+}
+DERIVATIVE_FORMATS = tuple(os.getenv("DERIVATIVE_FORMATS", "avif,webp,jpeg").split(","))
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", "80"))
+DERIVATIVE_WORKERS = int(os.getenv("DERIVATIVE_WORKERS", "1"))
+
+# Result cache: in-memory LRU in front of an on-disk tier. The memory budget
+# applies to each worker process; the disk budget to the whole cache
+# directory, which all worker processes on a host share.
+RESULT_CACHE_DIR = STORAGE_DIR / "cache"
+RESULT_CACHE_MEMORY_MB = int(os.getenv("RESULT_CACHE_MEMORY_MB", "256"))
+RESULT_CACHE_DISK_MB = int(os.getenv("RESULT_CACHE_DISK_MB", "2048"))
+
+# Near-duplicates (see similar.py): an image whose perceptual hash differs in
+# at most SIMILAR_MAX_DISTANCE of 64 bits from an earlier result with the same
+# model and render_factor reuses that result's colours instead of running the
+# model (-1 = off, the default). Rescans and recompressions usually stay
+# within 6 bits.
+SIMILAR_MAX_DISTANCE = int(os.getenv("SIMILAR_MAX_DISTANCE", "-1"))
+
+# HTTP caching: clients may reuse the metadata of a completed or failed image
+# for IMAGE_CACHE_MAX_AGE seconds before revalidating it with its ETag. Each
+# API process keeps the responses of up to PUBLIC_CACHE_ENTRIES finished
+# shared images (public tokens) in memory (0 = off).
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", "300"))
+PUBLIC_CACHE_ENTRIES = int(os.getenv("PUBLIC_CACHE_ENTRIES", "10000"))
+
+# Uploads: single-image uploads are streamed into blob storage and rejected
+# as soon as they pass MAX_UPLOAD_BYTES. The format and dimensions are read
+# from the first UPLOAD_HEADER_BYTES, and images of more than
+# MAX_IMAGE_PIXELS pixels (decompression bombs) are refused before decoding.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(100_000_000)))
+UPLOAD_HEADER_BYTES = int(os.getenv("UPLOAD_HEADER_BYTES", str(256 * 1024)))
+# Bulk uploads: maximum number of images per batch (files or archive entries)
+# and total size of a request, enforced while it is received
+BATCH_UPLOAD_MAX_FILES = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "1000"))
+BATCH_UPLOAD_MAX_BYTES = int(os.getenv("BATCH_UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Admin API (profiling, traces): requests must send "Authorization: Bearer
+# <ADMIN_TOKEN>"; the admin API is disabled while ADMIN_TOKEN is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+# Tracing and profiling: each process keeps its last TRACE_BUFFER_SPANS spans;
+# workers check for profiling requests every PROFILE_POLL_SECONDS
+TRACE_BUFFER_SPANS = int(os.getenv("TRACE_BUFFER_SPANS", "20000"))
+PROFILE_POLL_SECONDS = float(os.getenv("PROFILE_POLL_SECONDS", "2"))
+PROFILE_MAX_JOBS = int(os.getenv("PROFILE_MAX_JOBS", "100"))
+
+# Chunk size used when streaming blobs to clients
+BLOB_CHUNK_SIZE = int(os.getenv("BLOB_CHUNK_SIZE", str(256 * 1024)))
 
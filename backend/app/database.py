@@ -1,20 +1,73 @@
 """
 Database configuration and session management.
 """
-from sqlalchemy import create_engine
+import logging
+
+from sqlalchemy import Enum, create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
-from .config import DATABASE_URL
-
-# For SQLite, we need special configuration
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
+from .config import (
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    SQLITE_BUSY_TIMEOUT_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+
+def _configure_sqlite(dbapi_connection, connection_record) -> None:
+    """Per-connection SQLite settings for concurrent readers and writers."""
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL: readers see the last commit while a writer is active. It is a
+        # property of the database file, so this only switches it the first time.
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints rather than every commit, which is safe in WAL mode
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(url: str = DATABASE_URL):
+    """
+    Create the engine of this process.
+
+    Every thread gets its own pooled connection. SQLite used to share a
+    single connection through StaticPool, which serialized all requests
+    and let one thread's commit or rollback end another thread's
+    transaction; that is now only done for in-memory databases, which
+    exist per connection.
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+        )
+    if _is_memory_sqlite(url):
+        return create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    sqlite_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
     )
-else:
-    engine = create_engine(DATABASE_URL)
+    event.listen(sqlite_engine, "connect", _configure_sqlite)
+    return sqlite_engine
+
+
+engine = create_db_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -28,8 +81,72 @@ def get_db() -> Session:
         db.close()
 
 
+def _rebuild_sqlite_table(conn, table, existing_columns):
+    """Recreate a SQLite table from the model definition, keeping its rows."""
+    old_name = f"{table.name}_old"
+    for index in inspect(conn).get_indexes(table.name):
+        conn.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+    conn.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"'))
+    table.create(conn)
+    shared = ", ".join(f'"{c.name}"' for c in table.columns if c.name in existing_columns)
+    conn.execute(text(f'INSERT INTO "{table.name}" ({shared}) SELECT {shared} FROM "{old_name}"'))
+    conn.execute(text(f'DROP TABLE "{old_name}"'))
+
+
+def upgrade_schema():
+    """
+    Bring tables created by older versions in line with the models.
+
+    Adds missing columns, indexes and PostgreSQL enum values, and relaxes NOT
+    NULL constraints that the models no longer require. There is no migration
+    framework in this project, so only additive changes are handled here.
+    """
+    from .models import Base
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"]: c for c in inspector.get_columns(table.name)}
+            relaxed = [
+                c for c in table.columns
+                if c.name in existing and c.nullable and not existing[c.name]["nullable"]
+            ]
+
+            if relaxed and engine.dialect.name == "sqlite":
+                # SQLite cannot alter constraints in place
+                logger.info(f"Rebuilding table {table.name} to update column constraints")
+                _rebuild_sqlite_table(conn, table, existing)
+                continue
+
+            for column in relaxed:
+                conn.execute(text(
+                    f'ALTER TABLE "{table.name}" ALTER COLUMN "{column.name}" DROP NOT NULL'
+                ))
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    default = ""
+                    if column.server_default is not None:
+                        default = f" DEFAULT {column.server_default.arg}"
+                    logger.info(f"Adding column {table.name}.{column.name}")
+                    conn.execute(text(
+                        f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}{default}'
+                    ))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+            if engine.dialect.name == "postgresql":
+                for column in table.columns:
+                    if isinstance(column.type, Enum) and column.type.native_enum:
+                        for value in column.type.enums:
+                            conn.execute(text(
+                                f"ALTER TYPE {column.type.name} ADD VALUE IF NOT EXISTS '{value}'"
+                            ))
+
+
 def init_db():
     """Initialize database tables."""
     from .models import Base
     Base.metadata.create_all(bind=engine)
-
+    upgrade_schema()
@@ -0,0 +1,203 @@
+"""
+Derivative images: thumbnails, previews and re-encoded full-size results.
+
+Each derivative is identified by the blob it was made from, a variant
+(a size from DERIVATIVE_SIZES, or "full") and an output format. It is
+rendered once, stored in the derivatives blob store and recorded in the
+``derivatives`` table; later requests stream the stored file.
+
+Workers render the derivatives of every result right after the job
+completes, in a separate encoding pool so inference is not held up. The
+API only serves derivatives that exist: encoding on request would let
+anyone with a blob URL make it decode and re-encode large images.
+"""
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from PIL import Image, ImageOps, features
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .config import DERIVATIVE_FORMATS, DERIVATIVE_QUALITY, DERIVATIVE_SIZES, DERIVATIVE_WORKERS
+from .models import Derivative
+from .storage import get_blob_store, sniff_mime, DERIVATIVES_BUCKET
+
+logger = logging.getLogger(__name__)
+
+FULL_VARIANT = "full"
+
+FORMAT_MIME = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+
+
+def available_formats() -> tuple[str, ...]:
+    """Configured output formats this Pillow build can encode, in preference order."""
+    formats = tuple(
+        fmt for fmt in DERIVATIVE_FORMATS
+        if fmt in FORMAT_MIME and (fmt == "jpeg" or features.check(fmt))
+    )
+    return formats if "jpeg" in formats else formats + ("jpeg",)
+
+
+def variants() -> tuple[str, ...]:
+    """All derivative variant names."""
+    return tuple(DERIVATIVE_SIZES) + (FULL_VARIANT,)
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """
+    Pick the preferred output format the client accepts.
+
+    Browsers advertise AVIF/WebP support in the Accept header of image
+    requests; anything else gets JPEG.
+    """
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in (accept or "").split(",")
+    }
+    for fmt in available_formats():
+        if fmt == "jpeg" or FORMAT_MIME[fmt] in accepted:
+            return fmt
+    return "jpeg"
+
+
+def render_derivative(data: bytes, max_size: Optional[int], fmt: str) -> tuple[bytes, int, int]:
+    """
+    Resize and encode an image (CPU-bound, runs in the encoding pool).
+
+    Args:
+        data: Encoded source image
+        max_size: Longest side of the output, or None to keep the size
+        fmt: Output format (a key of FORMAT_MIME)
+
+    Returns:
+        (encoded bytes, width, height)
+    """
+    image = Image.open(io.BytesIO(data))
+    if max_size:
+        # JPEG sources decode directly at a reduced scale
+        image.draft("RGB", (max_size, max_size))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if max_size:
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    buffer = io.BytesIO()
+    options = {"quality": DERIVATIVE_QUALITY}
+    if fmt == "jpeg":
+        options.update(optimize=True, progressive=True)
+    elif fmt == "webp":
+        options.update(method=4)
+    image.save(buffer, format=fmt.upper(), **options)
+    return buffer.getvalue(), image.width, image.height
+
+
+# Encoding pool (lazy initialization)
+_pool: Optional[Executor] = None
+_pool_lock = threading.Lock()
+
+
+def get_encode_pool() -> Executor:
+    """Get or create the pool that runs render_derivative."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Worker processes are daemonic and may not start children
+            if DERIVATIVE_WORKERS > 0 and not multiprocessing.current_process().daemon:
+                _pool = ProcessPoolExecutor(
+                    DERIVATIVE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                _pool = ThreadPoolExecutor(1, thread_name_prefix="derivatives")
+    return _pool
+
+
+def find_derivative(db: Session, source_key: str, variant: str, fmt: str) -> Optional[Derivative]:
+    """Look up a stored derivative."""
+    return db.query(Derivative).filter(
+        Derivative.source_key == source_key,
+        Derivative.variant == variant,
+        Derivative.format == fmt,
+    ).first()
+
+
+def ensure_derivative(
+    db: Session,
+    source_bucket: str,
+    source_key: str,
+    variant: str,
+    fmt: str,
+) -> Derivative:
+    """
+    Return a derivative, rendering and storing it first if needed.
+
+    Blocks while the encoding pool renders it. Concurrent callers may render
+    the same derivative twice, but only one row is recorded.
+
+    Raises:
+        KeyError: Unknown variant
+        FileNotFoundError: Source blob does not exist
+    """
+    if variant not in variants():
+        raise KeyError(f"Unknown variant: {variant}")
+    existing = find_derivative(db, source_key, variant, fmt)
+    if existing:
+        return existing
+
+    data = get_blob_store(source_bucket).get(source_key)
+    encoded, width, height = get_encode_pool().submit(
+        render_derivative, data, DERIVATIVE_SIZES.get(variant), fmt
+    ).result()
+    key = get_blob_store(DERIVATIVES_BUCKET).put(encoded)
+
+    derivative = Derivative(
+        source_key=source_key,
+        variant=variant,
+        format=fmt,
+        key=key,
+        mime=FORMAT_MIME[fmt],
+        width=width,
+        height=height,
+        size=len(encoded),
+    )
+    db.add(derivative)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Someone else stored it meanwhile
+        db.rollback()
+        return find_derivative(db, source_key, variant, fmt)
+    return derivative
+
+
+def is_passthrough(source_bucket: str, source_key: str, variant: str, fmt: str) -> bool:
+    """Whether the full-size variant in this format is the source blob itself."""
+    if variant != FULL_VARIANT:
+        return False
+    with open(get_blob_store(source_bucket).path_for(source_key), "rb") as f:
+        return sniff_mime(f.read(16)) == FORMAT_MIME[fmt]
+
+
+def generate_derivatives(db: Session, source_bucket: str, source_key: str) -> int:
+    """
+    Render every variant of a blob in every available format.
+
+    Returns:
+        Number of derivatives rendered or already present
+    """
+    count = 0
+    for variant in variants():
+        for fmt in available_formats():
+            if is_passthrough(source_bucket, source_key, variant, fmt):
+                continue
+            ensure_derivative(db, source_bucket, source_key, variant, fmt)
+            count += 1
+    return count
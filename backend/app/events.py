@@ -0,0 +1,92 @@
+"""
+In-process fan-out of job status events to streaming clients.
+
+Workers publish status transitions and progress through the worker pool's
+message queue; the pool hands them to ``EventBroker.publish`` from its relay
+thread. Each connected client (an SSE stream or a long-poll request) owns a
+bounded asyncio queue and only receives events for its own session or image.
+"""
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .config import EVENT_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class Subscription:
+    """A client's filtered view of the event stream."""
+    session_id: Optional[str] = None
+    image_id: Optional[int] = None
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(EVENT_QUEUE_SIZE))
+
+    def matches(self, message: dict) -> bool:
+        """Whether the message belongs to this subscription."""
+        if self.session_id is not None and message.get("sessionId") != self.session_id:
+            return False
+        if self.image_id is not None and message.get("imageId") != self.image_id:
+            return False
+        return True
+
+
+class EventBroker:
+    """Routes status messages from any thread to asyncio subscribers."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscriptions: set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Attach the broker to the event loop serving the subscribers."""
+        self._loop = loop
+
+    def subscribe(self, session_id: Optional[str] = None, image_id: Optional[int] = None) -> Subscription:
+        """Register a subscriber (must be called from the event loop)."""
+        subscription = Subscription(session_id=session_id, image_id=image_id)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Remove a subscriber."""
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def subscriber_count(self) -> int:
+        """Number of connected subscribers."""
+        with self._lock:
+            return len(self._subscriptions)
+
+    def publish(self, message: dict) -> None:
+        """
+        Deliver a status message to matching subscribers.
+
+        Safe to call from any thread. Non-status messages are ignored.
+        """
+        if message.get("type") != "status" or self._loop is None:
+            return
+        with self._lock:
+            targets = [s for s in self._subscriptions if s.matches(message)]
+        for subscription in targets:
+            try:
+                self._loop.call_soon_threadsafe(self._deliver, subscription, message)
+            except RuntimeError:
+                # Event loop already closed (shutdown)
+                return
+
+    @staticmethod
+    def _deliver(subscription: Subscription, message: dict) -> None:
+        try:
+            subscription.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow client: it will resynchronize from the database
+            logger.debug(f"Dropping status event for image {message.get('imageId')}")
+
+
+# Global broker of the API process
+event_broker = EventBroker()
@@ -0,0 +1,152 @@
+"""
+Export a model's generator for the TorchScript/ONNX inference backends.
+
+Loads the model eagerly, exports its generator for each render_factor
+(see inference.py), optionally writes an int8 quantized ONNX copy, then
+runs a parity check: the same images go through the eager model and every
+exported variant, and the maximum pixel difference is reported.
+
+Usage (from backend/)::
+
+    python -m app.export --model stable --format onnx --quantize --render-factors 35
+    python -m app.export --format torchscript --check-images scan1.jpg scan2.jpg
+
+Exits with status 1 if any variant differs from the eager model by more
+than ``--max-error``.
+"""
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Optional
+
+from .inference import (
+    artifact_size,
+    export_onnx,
+    export_path,
+    export_torchscript,
+    pixel_error,
+    quantize_onnx,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def parity_images(paths: list[str], size: int = 512) -> list:
+    """Images for the parity check: the given files, or a synthetic gradient."""
+    from PIL import Image
+
+    if paths:
+        return [Image.open(path).convert("RGB") for path in paths]
+    gradient = Image.linear_gradient("L").resize((size, size))
+    return [Image.merge("RGB", (gradient, gradient.rotate(90), gradient))]
+
+
+def check_parity(colorizer, images: list, render_factor: int, backend: str, quantized: bool) -> dict:
+    """
+    Compare an exported backend against the eager model.
+
+    Raw predictions are compared, since the colorizer's post-processing
+    (original luminance, watermark) would hide part of the difference.
+    """
+    import time
+
+    started = time.perf_counter()
+    reference = colorizer._predict_batch(images, render_factor, eager=True)
+    eager_seconds = time.perf_counter() - started
+
+    colorizer.backend, colorizer.quantized = backend, quantized
+    colorizer._runners.clear()
+    colorizer._predict_batch(images[:1], render_factor)  # load and warm up
+    started = time.perf_counter()
+    candidate = colorizer._predict_batch(images, render_factor)
+    backend_seconds = time.perf_counter() - started
+
+    return {
+        **pixel_error(reference, candidate),
+        "eagerSeconds": round(eager_seconds, 3),
+        "backendSeconds": round(backend_seconds, 3),
+    }
+
+
+def export_model(
+    model: Optional[str],
+    formats: list[str],
+    render_factors: list[int],
+    quantize: bool,
+    check_images: list[str],
+) -> list[dict]:
+    """
+    Export a model and check every exported variant.
+
+    Returns:
+        One report per (format, render_factor, quantized) variant
+    """
+    import torch
+    from .colorizer import ImageColorizer
+    from .registry import get_model_registry, is_artistic
+
+    model_path = get_model_registry().weights(model)
+    colorizer = ImageColorizer(model_path, artistic=is_artistic(model_path), backend="eager")
+    generator = colorizer.generator()
+    render_base = colorizer.colorizer.filter.filters[0].render_base
+    images = parity_images(check_images)
+
+    reports = []
+    for render_factor in render_factors:
+        size = render_factor * render_base
+        example = torch.zeros(1, 3, size, size, device=colorizer.device)
+        variants = []
+        if "torchscript" in formats:
+            path = export_torchscript(generator, example, export_path(model_path, "torchscript", render_factor))
+            variants.append(("torchscript", False, path))
+        if "onnx" in formats:
+            path = export_onnx(generator, example, export_path(model_path, "onnx", render_factor))
+            variants.append(("onnx", False, path))
+            if quantize:
+                quantized = quantize_onnx(path, export_path(model_path, "onnx", render_factor, quantized=True))
+                variants.append(("onnx", True, quantized))
+
+        for backend, quantized, path in variants:
+            logger.info(f"Checking {path.name} against the eager model")
+            reports.append({
+                "backend": backend,
+                "quantized": quantized,
+                "renderFactor": render_factor,
+                "path": str(path),
+                "bytes": artifact_size(path),
+                **check_parity(colorizer, images, render_factor, backend, quantized),
+            })
+    return reports
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export a generator for CPU inference")
+    parser.add_argument("--model", help="Model name from MODELS (default: DEFAULT_MODEL)")
+    parser.add_argument(
+        "--format", dest="formats", nargs="+", choices=("torchscript", "onnx"), default=["onnx"]
+    )
+    parser.add_argument("--render-factors", type=int, nargs="+", default=[35])
+    parser.add_argument("--quantize", action="store_true", help="Also write an int8 ONNX copy")
+    parser.add_argument("--check-images", nargs="*", default=[], help="Images for the parity check")
+    parser.add_argument("--max-error", type=int, default=16, help="Allowed max pixel error (0-255)")
+    args = parser.parse_args(argv)
+    if args.quantize and "onnx" not in args.formats:
+        parser.error("--quantize only applies to the onnx format")
+
+    logging.basicConfig(level=logging.INFO)
+    reports = export_model(args.model, args.formats, args.render_factors, args.quantize, args.check_images)
+    print(json.dumps(reports, indent=2))
+
+    failed = [report for report in reports if report["maxPixelError"] > args.max_error]
+    for report in failed:
+        logger.error(
+            f"{Path(report['path']).name} differs from the eager model by up to "
+            f"{report['maxPixelError']} (allowed {args.max_error})"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+HTTP caching of stored blobs and image metadata.
+
+Blobs are content-addressed, so the bytes behind a blob URL never change:
+the key is a strong ETag and responses are marked ``immutable``. Image
+metadata gets a strong ETag computed from the serialized payload, so clients
+revalidate with ``If-None-Match`` and receive ``304 Not Modified`` while
+nothing changed. Completed and failed images never change again; the payloads
+of shared (public token) images in that state are kept in an in-process LRU
+and served without a database query.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .config import PUBLIC_CACHE_ENTRIES
+
+# Content-addressed responses: cacheable by anyone, forever
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Responses that may change: cache, but revalidate before every use
+REVALIDATE = "no-cache"
+
+
+def blob_etag(key: str) -> str:
+    """Strong ETag of a content-addressed blob (its SHA-256 key)."""
+    return f'"{key}"'
+
+
+def payload_etag(body: bytes) -> str:
+    """Strong ETag of a response body."""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Evaluate an ``If-None-Match`` header against the current ETag.
+
+    Uses the weak comparison RFC 9110 prescribes for this header, so a
+    ``W/`` prefix added by an intermediary does not defeat revalidation.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def encode_json(payload) -> bytes:
+    """Serialize a response payload the way JSONResponse does."""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def conditional_json(
+    request: Request,
+    body: bytes,
+    etag: str,
+    cache_control: str,
+    headers: Optional[dict] = None,
+) -> Response:
+    """
+    Send an encoded JSON body, or 304 if the client already has it.
+
+    Args:
+        request: Current request (for If-None-Match)
+        body: Encoded JSON
+        etag: ETag of ``body``
+        cache_control: Cache-Control header value
+        headers: Extra response headers (sent with 304 as well)
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control, **(headers or {})}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+class PayloadCache:
+    """Thread-safe LRU of encoded response bodies and their ETags."""
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: Maximum number of entries (0 disables the cache)
+        """
+        self.capacity = capacity
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable) -> Optional[tuple[bytes, str]]:
+        """Return (body, etag) for a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key: Hashable, body: bytes, etag: str) -> None:
+        """Store a body, evicting the least recently used entries."""
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Hit and miss counters and the current size."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+_public_image_cache: Optional[PayloadCache] = None
+
+
+def get_public_image_cache() -> PayloadCache:
+    """Get or create the cache of finished shared images of this process."""
+    global _public_image_cache
+    if _public_image_cache is None:
+        _public_image_cache = PayloadCache(PUBLIC_CACHE_ENTRIES)
+    return _public_image_cache
@@ -0,0 +1,198 @@
+"""
+Exported inference backends for the generator.
+
+DeOldify runs the generator eagerly through fastai. For CPU-only nodes the
+generator can be exported once (``python -m app.export``) to TorchScript or
+ONNX, optionally with int8 dynamic quantization (ONNX only), and run through
+the exported graph instead. Pre- and post-processing stay in DeOldify's
+filter, so only the forward pass changes.
+
+The generator's skip connections resize feature maps only when the input
+size is not a multiple of its total stride, so a traced graph is only valid
+for the input size it was traced with. Artifacts are therefore exported per
+render_factor; render factors without an artifact run eagerly.
+"""
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Optional
+
+from .config import EXPORT_DIR, INFERENCE_BACKEND, INFERENCE_QUANTIZED, INFERENCE_THREADS
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "torchscript", "onnx")
+
+_EXTENSIONS = {"torchscript": ".ts", "onnx": ".onnx"}
+
+# Receives a normalized NCHW float tensor and returns the raw generator output
+Runner = Callable[["torch.Tensor"], "torch.Tensor"]
+
+
+def backend_id(backend: str = INFERENCE_BACKEND, quantized: bool = INFERENCE_QUANTIZED) -> str:
+    """
+    Name of the backend that produces a node's results, e.g. ``onnx-int8``.
+
+    Backends differ slightly in their output, so results are only shared
+    (result cache, near-duplicate reuse) between nodes with the same one.
+    """
+    return f"{backend}-int8" if quantized and backend == "onnx" else backend
+
+
+def export_path(model_path: str, backend: str, render_factor: int, quantized: bool = False) -> Path:
+    """
+    Location of an exported generator.
+
+    Example: ``ColorAize_weights.rf35.int8.onnx`` in EXPORT_DIR.
+    """
+    suffix = ".int8" if quantized else ""
+    return EXPORT_DIR / f"{Path(model_path).stem}.rf{render_factor}{suffix}{_EXTENSIONS[backend]}"
+
+
+def set_threads(threads: int = INFERENCE_THREADS) -> None:
+    """Set torch's intra-op thread count (0 keeps the library default)."""
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+
+class TorchScriptRunner:
+    """Runs a TorchScript generator."""
+
+    def __init__(self, path: Path, device: "torch.device"):
+        import torch
+
+        self.module = torch.jit.load(str(path), map_location=device)
+        self.module.eval()
+
+    def __call__(self, x: "torch.Tensor") -> "torch.Tensor":
+        import torch
+
+        with torch.inference_mode():
+            return self.module(x)
+
+
+class OnnxRunner:
+    """Runs an ONNX generator through ONNX Runtime."""
+
+    def __init__(self, path: Path, threads: int = INFERENCE_THREADS, use_cuda: bool = False):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        # Batches are a single graph call, parallelism comes from intra-op threads
+        options.inter_op_num_threads = 1
+        providers = ["CPUExecutionProvider"]
+        if use_cuda and "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        self.session = onnxruntime.InferenceSession(str(path), options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x: "torch.Tensor") -> "torch.Tensor":
+        import torch
+
+        (output,) = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})
+        return torch.from_numpy(output)
+
+
+def load_runner(
+    backend: str,
+    model_path: str,
+    render_factor: int,
+    quantized: bool = False,
+    device: Optional["torch.device"] = None,
+) -> Optional[Runner]:
+    """
+    Load the exported generator for a render_factor.
+
+    Returns:
+        A runner, or None for the eager backend or when no artifact exists
+    """
+    if backend == "eager":
+        return None
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    path = export_path(model_path, backend, render_factor, quantized and backend == "onnx")
+    if not path.exists():
+        logger.warning(f"No {backend} export at {path}, running render_factor={render_factor} eagerly")
+        return None
+
+    logger.info(f"Loading {backend} generator from {path}")
+    if backend == "torchscript":
+        return TorchScriptRunner(path, device)
+    return OnnxRunner(path, use_cuda=device is not None and device.type == "cuda")
+
+
+def export_torchscript(model: "torch.nn.Module", example: "torch.Tensor", path: Path) -> Path:
+    """Trace the generator with an example input and save it."""
+    import torch
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with torch.inference_mode():
+        traced = torch.jit.trace(model.eval(), example, check_trace=False)
+    traced = torch.jit.freeze(traced)
+    traced.save(str(path))
+    return path
+
+
+def export_onnx(model: "torch.nn.Module", example: "torch.Tensor", path: Path) -> Path:
+    """Export the generator to ONNX with a dynamic batch dimension."""
+    import torch
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            model.eval(),
+            example,
+            str(path),
+            input_names=["input"],
+            output_names=["output"],
+            dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+            opset_version=17,
+        )
+    return path
+
+
+def quantize_onnx(source: Path, target: Path) -> Path:
+    """
+    Write an int8 dynamically quantized copy of an ONNX generator.
+
+    Weights are stored as int8 and activations are quantized on the fly, so
+    no calibration data is needed.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(source), str(target), weight_type=QuantType.QInt8)
+    return target
+
+
+def pixel_error(reference: list, candidate: list) -> dict:
+    """
+    Compare two lists of images pixel by pixel.
+
+    Args:
+        reference: PIL images from the eager model
+        candidate: PIL images of the same sizes from an exported backend
+
+    Returns:
+        Maximum and mean absolute error over all channels, in 0-255 units
+    """
+    import numpy as np
+
+    max_error, total, count = 0, 0.0, 0
+    for expected, actual in zip(reference, candidate):
+        diff = np.abs(np.asarray(expected, dtype=np.int16) - np.asarray(actual, dtype=np.int16))
+        max_error = max(max_error, int(diff.max()))
+        total += float(diff.sum())
+        count += diff.size
+    return {"maxPixelError": max_error, "meanPixelError": round(total / count, 3) if count else 0.0}
+
+
+def artifact_size(path: Path) -> Optional[int]:
+    """Size of an exported file, or None if it does not exist."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
@@ -0,0 +1,438 @@
+"""
+Durable job queue backed by the ``images`` table.
+
+A row in PENDING state is a queued job. Workers claim jobs by atomically
+moving them to PROCESSING together with a lease (worker id + expiry time)
+and extend the lease with heartbeats while they work. Jobs whose lease runs
+out (the worker crashed or was restarted) are put back in the queue until
+they have used up their attempts.
+
+Jobs are claimed in order of their ``queue_key``, a virtual deadline set
+when they are queued: the enqueue time plus a delay that grows with the
+estimated cost of the job and with its lane (``interactive`` single uploads,
+``bulk`` batches). A cheap interactive job thus overtakes expensive and bulk
+jobs queued shortly before it, while a job can only be overtaken by jobs
+queued less than its delay later, which bounds how long it can starve.
+
+A queued or running job can be cancelled. A cancelled job is never claimed
+and its result is never recorded; the worker running it stops at the next
+stage boundary (see worker.py).
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Collection, Optional
+
+from sqlalchemy import case, func, literal, update
+from sqlalchemy.orm import Session, aliased
+
+from .config import (
+    DEFAULT_MODEL,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    SCHEDULER_BULK_DELAY,
+    SCHEDULER_COST_DELAY,
+    SCHEDULER_MAX_COST_DELAY,
+)
+from .metrics import metrics
+from .models import Image, ImageStatus
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE_LANE = "interactive"
+BULK_LANE = "bulk"
+LANE_DELAYS = {INTERACTIVE_LANE: 0.0, BULK_LANE: SCHEDULER_BULK_DELAY}
+
+ACTIVE_STATUSES = (ImageStatus.PENDING, ImageStatus.PROCESSING)
+
+# Cost estimate of jobs without a render_factor or dimensions
+_DEFAULT_RENDER_FACTOR = 35
+_DEFAULT_PIXELS = 1_000_000
+
+# Claim order; rows queued by older versions have no key and go first
+_QUEUE_ORDER = func.coalesce(Image.queue_key, 0.0)
+
+
+def _retry_or(value, otherwise):
+    """
+    SQL expression choosing ``value`` for a job whose attempt ended without a
+    result and that has attempts left, else ``otherwise``.
+    """
+    return case((func.coalesce(Image.attempts, 0) < JOB_MAX_ATTEMPTS, value), else_=otherwise)
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when the job it is running was cancelled."""
+
+
+def utcnow() -> datetime:
+    """Current UTC time."""
+    return datetime.now(timezone.utc)
+
+
+def as_utc(value: datetime) -> datetime:
+    """Attach UTC to a timestamp read back from SQLite, which drops the zone."""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def queue_depth(db: Session) -> int:
+    """Number of jobs waiting to be claimed."""
+    return db.query(func.count(Image.id)).filter(Image.status == ImageStatus.PENDING).scalar()
+
+
+def queue_counts(db: Session) -> dict:
+    """Number of images in each status."""
+    rows = db.query(Image.status, func.count(Image.id)).group_by(Image.status).all()
+    counts = {status.value: 0 for status in ImageStatus}
+    counts.update({status.value: count for status, count in rows})
+    return counts
+
+
+def estimate_cost(
+    width: Optional[int],
+    height: Optional[int],
+    render_factor: Optional[int],
+    frames: int = 1,
+) -> float:
+    """Estimated work of a job, in megapixels x render_factor (per frame)."""
+    pixels = width * height if width and height else _DEFAULT_PIXELS
+    return pixels / 1e6 * (render_factor or _DEFAULT_RENDER_FACTOR) * max(frames, 1)
+
+
+def schedule(image: Image, lane: str = INTERACTIVE_LANE, frames: int = 1) -> float:
+    """
+    Put a new image in a lane and set the virtual deadline it is claimed by.
+
+    Args:
+        image: Image about to be inserted (dimensions and render_factor set)
+        lane: INTERACTIVE_LANE or BULK_LANE
+        frames: Number of frames of a video
+
+    Returns:
+        The delay in seconds added to the enqueue time
+    """
+    cost = estimate_cost(image.width, image.height, image.render_factor, frames)
+    delay = min(cost * SCHEDULER_COST_DELAY, SCHEDULER_MAX_COST_DELAY) + LANE_DELAYS[lane]
+    image.lane = lane
+    image.queue_key = time.time() + delay
+    metrics.observe("colorizer_scheduler_delay_seconds", delay, lane=lane)
+    return delay
+
+
+def queue_positions(db: Session, image_ids: list[int]) -> dict[int, int]:
+    """
+    1-based position in the queue of each pending image.
+
+    The position is the number of pending jobs that come before the image in
+    claim order (queue key, then ID), plus one. Jobs queued later may still
+    overtake it, within the bounds of its delay.
+
+    Returns:
+        Mapping of image ID to position; images that are not pending are omitted
+    """
+    if not image_ids:
+        return {}
+    ahead = aliased(Image)
+    own_key, ahead_key = func.coalesce(Image.queue_key, 0.0), func.coalesce(ahead.queue_key, 0.0)
+    rows = (
+        db.query(Image.id, func.count(ahead.id))
+        .join(ahead, (ahead.status == ImageStatus.PENDING) & (
+            (ahead_key < own_key) | ((ahead_key == own_key) & (ahead.id <= Image.id))
+        ))
+        .filter(Image.id.in_(image_ids), Image.status == ImageStatus.PENDING)
+        .group_by(Image.id)
+        .all()
+    )
+    return {image_id: position for image_id, position in rows}
+
+
+def claim_jobs(
+    db: Session,
+    worker_id: str,
+    limit: int,
+    models: Optional[Collection[str]] = None,
+) -> list[int]:
+    """
+    Claim up to ``limit`` queued jobs for a worker.
+
+    Each candidate is claimed with a conditional UPDATE, so concurrent
+    workers never claim the same job even without row locks. On PostgreSQL
+    the candidates are additionally selected with SKIP LOCKED to avoid
+    workers contending for the same rows.
+
+    Args:
+        models: Only claim jobs for these models (None = any model)
+
+    Returns:
+        IDs of the claimed images
+    """
+    if limit <= 0:
+        return []
+
+    query = (
+        db.query(Image.id, Image.lane, Image.created_at)
+        .filter(Image.status == ImageStatus.PENDING)
+        .order_by(_QUEUE_ORDER, Image.id)
+    )
+    if models is not None:
+        served = Image.model.in_(list(models))
+        if DEFAULT_MODEL in models:
+            served |= Image.model.is_(None)
+        query = query.filter(served)
+    if db.get_bind().dialect.name == "postgresql":
+        query = query.with_for_update(skip_locked=True)
+    candidates = query.limit(limit).all()
+
+    now = utcnow()
+    claimed = []
+    for image_id, lane, created_at in candidates:
+        result = db.execute(
+            update(Image)
+            .where(Image.id == image_id, Image.status == ImageStatus.PENDING)
+            .values(
+                status=ImageStatus.PROCESSING,
+                worker_id=worker_id,
+                lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                attempts=Image.attempts + 1,
+                started_at=now,
+            )
+        )
+        if result.rowcount == 1:
+            claimed.append(image_id)
+            lane = lane or INTERACTIVE_LANE
+            metrics.inc("colorizer_scheduler_claims_total", lane=lane)
+            metrics.observe(
+                "colorizer_queue_wait_seconds", (now - as_utc(created_at)).total_seconds(), lane=lane
+            )
+    db.commit()
+    return claimed
+
+
+def extend_leases(db: Session, worker_id: str, image_ids: list[int]) -> int:
+    """
+    Heartbeat: push back the lease expiry of jobs a worker is still running.
+
+    Returns:
+        Number of leases extended (jobs that were requeued meanwhile are skipped)
+    """
+    if not image_ids:
+        return 0
+    result = db.execute(
+        update(Image)
+        .where(
+            Image.id.in_(image_ids),
+            Image.worker_id == worker_id,
+            Image.status == ImageStatus.PROCESSING,
+        )
+        .values(lease_expires_at=utcnow() + timedelta(seconds=JOB_LEASE_SECONDS))
+    )
+    db.commit()
+    return result.rowcount
+
+
+def complete_jobs(db: Session, worker_id: str, results: list[tuple[int, str, str]]) -> set[int]:
+    """
+    Mark several jobs as completed in one transaction.
+
+    Only the worker holding the lease may complete a job; a worker whose
+    lease expired and was requeued loses the race silently.
+
+    Args:
+        results: (image ID, colorized key, colorized MIME type) of each job
+
+    Returns:
+        IDs of the jobs that were updated
+    """
+    now = utcnow()
+    completed = set()
+    for image_id, colorized_key, colorized_mime in results:
+        result = db.execute(
+            update(Image)
+            .where(
+                Image.id == image_id,
+                Image.worker_id == worker_id,
+                Image.status == ImageStatus.PROCESSING,
+            )
+            .values(
+                status=ImageStatus.COMPLETED,
+                colorized_key=colorized_key,
+                colorized_mime=colorized_mime,
+                error_message=None,
+                lease_expires_at=None,
+                finished_at=now,
+            )
+        )
+        if result.rowcount == 1:
+            completed.add(image_id)
+    db.commit()
+    return completed
+
+
+def complete_job(
+    db: Session,
+    image_id: int,
+    worker_id: str,
+    colorized_key: str,
+    colorized_mime: str,
+) -> bool:
+    """
+    Mark a job as completed (see complete_jobs).
+
+    Returns:
+        True if the job was updated
+    """
+    return image_id in complete_jobs(db, worker_id, [(image_id, colorized_key, colorized_mime)])
+
+
+def fail_job(db: Session, image_id: int, worker_id: str, error: str) -> Optional[ImageStatus]:
+    """
+    Record a failed attempt.
+
+    The job goes back to the queue while it has attempts left, otherwise it
+    is marked FAILED.
+
+    Returns:
+        New status of the job, or None if the worker no longer held the lease
+    """
+    result = db.execute(
+        update(Image)
+        .where(
+            Image.id == image_id,
+            Image.worker_id == worker_id,
+            Image.status == ImageStatus.PROCESSING,
+        )
+        .values(
+            status=_retry_or(
+                literal(ImageStatus.PENDING, Image.status.type),
+                literal(ImageStatus.FAILED, Image.status.type),
+            ),
+            worker_id=_retry_or(None, Image.worker_id),
+            finished_at=_retry_or(Image.finished_at, utcnow()),
+            error_message=error,
+            lease_expires_at=None,
+        )
+    )
+    if result.rowcount == 0:
+        db.rollback()
+        return None
+    # Read back before committing, while the row is still locked by the update
+    status = db.query(Image.status).filter(Image.id == image_id).scalar()
+    db.commit()
+    return status
+
+
+def release_jobs(db: Session, worker_id: str, image_ids: Collection[int]) -> int:
+    """
+    Give up the leases of jobs a stopping worker did not finish.
+
+    The jobs go straight back to the queue instead of waiting for their
+    leases to expire, and the interrupted attempt is not counted.
+
+    Returns:
+        Number of jobs released
+    """
+    if not image_ids:
+        return 0
+    result = db.execute(
+        update(Image)
+        .where(
+            Image.id.in_(list(image_ids)),
+            Image.worker_id == worker_id,
+            Image.status == ImageStatus.PROCESSING,
+        )
+        .values(
+            status=ImageStatus.PENDING,
+            worker_id=None,
+            lease_expires_at=None,
+            attempts=Image.attempts - 1,
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def cancel_jobs(db: Session, image_ids: Collection[int]) -> dict[int, ImageStatus]:
+    """
+    Cancel queued and running jobs.
+
+    Queued jobs are never claimed; running ones are stopped by their worker
+    at the next stage boundary, and their results would not be recorded.
+
+    Returns:
+        Status each cancelled job had before (finished jobs are left alone
+        and omitted)
+    """
+    if not image_ids:
+        return {}
+    before = dict(
+        db.query(Image.id, Image.status)
+        .filter(Image.id.in_(list(image_ids)), Image.status.in_(ACTIVE_STATUSES))
+        .all()
+    )
+    if not before:
+        return {}
+    db.execute(
+        update(Image)
+        .where(Image.id.in_(list(before)), Image.status.in_(ACTIVE_STATUSES))
+        .values(
+            status=ImageStatus.CANCELLED,
+            error_message="Cancelled",
+            lease_expires_at=None,
+            finished_at=utcnow(),
+        )
+    )
+    db.commit()
+    # Jobs that finished between the two statements were not cancelled
+    cancelled = {
+        row.id for row in db.query(Image.id).filter(
+            Image.id.in_(list(before)), Image.status == ImageStatus.CANCELLED
+        )
+    }
+    for image_id in cancelled:
+        metrics.inc("colorizer_cancellations_total", state=before[image_id].value)
+    return {image_id: before[image_id] for image_id in cancelled}
+
+
+def cancelled_jobs(db: Session, image_ids: Collection[int]) -> set[int]:
+    """Which of the given jobs have been cancelled."""
+    if not image_ids:
+        return set()
+    return {
+        row.id for row in db.query(Image.id).filter(
+            Image.id.in_(list(image_ids)), Image.status == ImageStatus.CANCELLED
+        )
+    }
+
+
+def requeue_expired(db: Session) -> int:
+    """
+    Put back jobs whose lease has expired.
+
+    Also picks up PROCESSING rows without any lease, which were left behind by
+    versions that ran jobs as in-process tasks.
+
+    Returns:
+        Number of jobs requeued or failed
+    """
+    now = utcnow()
+    result = db.execute(
+        update(Image)
+        .where(
+            Image.status == ImageStatus.PROCESSING,
+            (Image.lease_expires_at == None) | (Image.lease_expires_at < now),  # noqa: E711
+        )
+        .values(
+            status=_retry_or(
+                literal(ImageStatus.PENDING, Image.status.type),
+                literal(ImageStatus.FAILED, Image.status.type),
+            ),
+            error_message=_retry_or(Image.error_message, "Processing did not finish (worker lost)"),
+            finished_at=_retry_or(Image.finished_at, now),
+            worker_id=None,
+            lease_expires_at=None,
+        )
+    )
+    db.commit()
+    if result.rowcount:
+        logger.warning(f"Requeued or failed {result.rowcount} job(s) with expired leases")
+    return result.rowcount
@@ -1,21 +1,111 @@
 """
 FastAPI application for image colorization.
+
+The API process never imports torch: inference runs in the workers (see
+worker.py), which load and warm up the model in the background while the
+API already serves requests. ``/readyz`` reports when that is done. With
+``WORKER_MODE=remote`` the API starts no workers at all and the jobs are run
+by worker nodes on other hosts (see nodes.py).
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from typing import List
-import base64
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session, load_only
+from datetime import datetime
+from typing import Optional
 import os
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import base64
+import json
 import logging
+import socket
+import zipfile
 
-from .database import get_db, init_db
-from .models import Image, ImageStatus
-from .colorizer import get_colorizer
-from .auth import get_session_id, generate_session_id
+from .database import get_db, init_db, SessionLocal
+from .models import Batch, Image, ImageStatus, Profile
+from .batches import archive_name, ingest_uploads, stream_zip
+from .jobs import (
+    ACTIVE_STATUSES,
+    BULK_LANE,
+    cancel_jobs,
+    queue_counts,
+    queue_depth,
+    queue_positions,
+    requeue_expired,
+    schedule,
+)
+from .nodes import cluster_summary, live_nodes
+from .worker import WorkerPool
+from .events import event_broker
+from .startup import StartupTimer
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, merge, metrics, render
+from .registry import is_artistic
+from .auth import get_session_id, get_stream_session_id, generate_session_id, require_admin
+from .profiling import ARTIFACT_SUFFIX, PROFILE_TARGETS, ProfileSession, available_modes, store_artifact
+from .schemas import ProfileRequest
+from .video import VideoError, probe as probe_video, tools_available as video_tools_available
+from .http_cache import (
+    IMMUTABLE,
+    REVALIDATE,
+    blob_etag,
+    conditional_json,
+    encode_json,
+    etag_matches,
+    get_public_image_cache,
+    payload_etag,
+)
+from .uploads import (
+    ImageInspector,
+    StreamedForm,
+    UploadInspector,
+    UploadRejected,
+    read_bulk_form,
+    read_upload_form,
+)
+from .tracing import chrome_trace, current_trace_id, current_traces, new_trace_id, parse_trace_id, stage, tracer
+from .config import (
+    BATCH_UPLOAD_MAX_BYTES,
+    MAX_UPLOAD_BYTES,
+    MAX_VIDEO_UPLOAD_BYTES,
+    LIST_PAGE_SIZE,
+    LIST_PAGE_SIZE_MAX,
+    LONG_POLL_MAX_SECONDS,
+    SSE_KEEPALIVE_SECONDS,
+    STATUS_RESYNC_SECONDS,
+    RENDER_FACTOR_MIN,
+    RENDER_FACTOR_MAX,
+    JOB_QUEUE_LIMIT,
+    JOB_RETRY_AFTER_SECONDS,
+    PROCESSING_MODES,
+    MODELS,
+    DEFAULT_MODEL,
+    PROFILE_MAX_JOBS,
+    IMAGE_CACHE_MAX_AGE,
+    WORKER_MODE,
+    SIMILAR_MAX_DISTANCE,
+)
+from .storage import (
+    get_blob_store,
+    is_valid_key,
+    migrate_data_urls,
+    parse_range_header,
+    sniff_mime,
+    UPLOADS_BUCKET,
+    PROCESSED_BUCKET,
+    DERIVATIVES_BUCKET,
+    PROFILES_BUCKET,
+)
+from .derivatives import (
+    find_derivative,
+    is_passthrough,
+    negotiate_format,
+    variants as derivative_variants,
+)
 import secrets
 import string
 
@@ -47,8 +137,54 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Trace-ID"],
 )
 
+# Profiling session of API requests (see POST /api/admin/profiles)
+request_profile: Optional[ProfileSession] = None
+
+
+def _finish_request_profile(session: ProfileSession) -> None:
+    db = SessionLocal()
+    try:
+        store_artifact(db, session)
+    finally:
+        db.close()
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Run every request under a trace ID (the client's X-Trace-ID or a new one).
+
+    Uploads store the ID on their images, so the worker's spans for the job
+    land in the same trace. While a request profiling session is active, the
+    next requests outside the admin API are profiled one at a time.
+    """
+    global request_profile
+    trace_id = parse_trace_id(request.headers.get("x-trace-id")) or new_trace_id()
+    token = current_traces.set((trace_id,))
+    session = request_profile
+    profiled = (
+        session is not None
+        and not request.url.path.startswith("/api/admin/")
+        and session.claim(exclusive=True)
+    )
+    try:
+        with tracer.span("request", method=request.method, path=request.url.path):
+            if profiled:
+                with session.section():
+                    response = await call_next(request)
+            else:
+                response = await call_next(request)
+    finally:
+        current_traces.reset(token)
+        if profiled and session.job_done():
+            request_profile = None
+            await run_in_threadpool(_finish_request_profile, session)
+    response.headers["X-Trace-ID"] = trace_id
+    return response
+
 # Serve static files (frontend build)
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
@@ -78,49 +214,416 @@ if os.path.exists(frontend_dist):
     if assets_dir:
         # Mount assets at /assets so Vite paths like /assets/xxx.js work
         app.mount("/assets", StaticFiles(directory=assets_dir), name="assets")
-    
-    @app.get("/{full_path:path}")
-    async def serve_frontend(full_path: str):
-        """Serve frontend SPA."""
-        # Don't serve API routes
-        if full_path.startswith("api/") or full_path.startswith("docs") or full_path.startswith("openapi.json"):
-            raise HTTPException(status_code=404, detail="Not found")
-        
-        # Serve index.html for all routes (SPA routing)
-        # Check multiple possible locations for index.html
-        index_paths = [
-            os.path.join(frontend_dist, "index.html"),
-            os.path.join(frontend_dist, "public", "index.html"),
-        ]
-        
-        for index_path in index_paths:
-            if os.path.exists(index_path):
-                return FileResponse(index_path)
-        
-        raise HTTPException(status_code=404, detail="Frontend not found")
 
-# Thread pool for async colorization
-executor = ThreadPoolExecutor(max_workers=2)
+
+def frontend_index() -> Optional[str]:
+    """Path of the built frontend's index.html, or None without a build."""
+    # Check multiple possible locations for index.html
+    index_paths = [
+        os.path.join(frontend_dist, "index.html"),
+        os.path.join(frontend_dist, "public", "index.html"),
+    ]
+    for index_path in index_paths:
+        if os.path.exists(index_path):
+            return index_path
+    return None
+
+
+def _migrate_legacy_rows():
+    """Move base64 data URLs left by older versions into blob storage."""
+    db = SessionLocal()
+    try:
+        migrate_data_urls(db)
+    except Exception as e:
+        logger.error(f"Data URL migration failed: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+# Inference workers (model is loaded in the workers, not in the API process);
+# not started with WORKER_MODE=remote
+worker_pool = WorkerPool()
+worker_pool.add_listener(event_broker.publish)
+
+startup_timer = StartupTimer("API")
+startup_timer.record("imports", time.perf_counter() - _IMPORT_STARTED)
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database and colorizer on startup."""
-    init_db()
+    """
+    Initialize database and start the inference workers on startup.
+    Nothing here waits for the model: workers load it in the background.
+    """
+    with startup_timer.phase("database"):
+        init_db()
+    event_broker.bind(asyncio.get_running_loop())
     logger.info("Database initialized")
+
+    # Legacy rows keep working through their data URLs until migrated,
+    # so the migration runs in the background instead of delaying startup
+    asyncio.get_event_loop().run_in_executor(None, _migrate_legacy_rows)
+    
+    # Jobs left in PROCESSING by a crashed or restarted process go back to the queue
+    with startup_timer.phase("requeue"):
+        db = SessionLocal()
+        try:
+            requeued = requeue_expired(db)
+            if requeued:
+                logger.info(f"Requeued {requeued} interrupted jobs")
+        finally:
+            db.close()
     
-    # Try to initialize colorizer (will fail gracefully if DeOldify not available)
+    with startup_timer.phase("workers"):
+        if WORKER_MODE == "remote":
+            logger.info("WORKER_MODE=remote: no local workers, jobs are run by worker nodes")
+        else:
+            worker_pool.start()
+    startup_timer.log()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the inference workers."""
+    worker_pool.stop()
+
+
+def blob_url(request: Request, bucket: str, key: Optional[str]) -> Optional[str]:
+    """Build the download URL for a stored blob."""
+    if not key:
+        return None
+    return str(request.url_for("download_blob", bucket=bucket, key=key))
+
+
+def derivative_url(request: Request, image: Image, variant: str) -> Optional[str]:
+    """Build the URL of a derivative of the result (None until there is a result)."""
+    if variant not in derivative_variants() or image.kind == "video" or not image.colorized_key:
+        return None
+    return str(request.url_for(
+        "download_derivative", bucket=PROCESSED_BUCKET, key=image.colorized_key, variant=variant
+    ))
+
+
+# Response fields of an image and the columns each one needs. Legacy data
+# URLs are only read (lazily, they are deferred) for rows not migrated yet.
+IMAGE_FIELDS = {
+    "id": ((Image.id,), lambda image, request: image.id),
+    "originalUrl": (
+        (Image.original_key,),
+        lambda image, request: blob_url(request, UPLOADS_BUCKET, image.original_key) or image.original_url,
+    ),
+    "colorizedUrl": (
+        (Image.colorized_key,),
+        lambda image, request: blob_url(request, PROCESSED_BUCKET, image.colorized_key) or image.colorized_url,
+    ),
+    "thumbnailUrl": (
+        (Image.original_key, Image.colorized_key, Image.kind),
+        lambda image, request: derivative_url(request, image, "thumb"),
+    ),
+    "previewUrl": (
+        (Image.original_key, Image.colorized_key, Image.kind),
+        lambda image, request: derivative_url(request, image, "preview"),
+    ),
+    "status": ((Image.status,), lambda image, request: image.status.value),
+    "errorMessage": ((Image.error_message,), lambda image, request: image.error_message),
+    "createdAt": ((Image.created_at,), lambda image, request: image.created_at.isoformat()),
+    "filename": ((Image.filename,), lambda image, request: image.filename),
+    "batchId": ((Image.batch_id,), lambda image, request: image.batch_id),
+    "model": ((Image.model,), lambda image, request: image.model or DEFAULT_MODEL),
+    "kind": ((Image.kind,), lambda image, request: image.kind or "image"),
+    "publicToken": ((Image.public_token,), lambda image, request: image.public_token),
+}
+
+
+def serialize_image(
+    image: Image,
+    request: Request,
+    include_token: bool = True,
+    fields: Optional[list[str]] = None,
+) -> dict:
+    """
+    Convert an image row to the API response format.
+
+    Rows that predate blob storage still carry data URLs, which are returned
+    unchanged until the background migration has moved them.
+
+    Args:
+        image: Image row
+        request: Current request, for building URLs
+        include_token: Include the public sharing token
+        fields: Subset of IMAGE_FIELDS to return (default: all)
+    """
+    names = fields or list(IMAGE_FIELDS)
+    if not include_token:
+        names = [name for name in names if name != "publicToken"]
+    return {name: IMAGE_FIELDS[name][1](image, request) for name in names}
+
+
+def encode_cursor(image: Image) -> str:
+    """Opaque keyset cursor pointing after ``image`` in the listing order."""
+    raw = f"{image.created_at.isoformat()}|{image.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    created_at, image_id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(created_at), int(image_id)
+
+
+TERMINAL_STATUSES = (ImageStatus.COMPLETED.value, ImageStatus.FAILED.value, ImageStatus.CANCELLED.value)
+
+
+def image_cache_control(status: ImageStatus, scope: str) -> str:
+    """Cache-Control of image metadata: finished images no longer change."""
+    if status.value in TERMINAL_STATUSES:
+        return f"{scope}, max-age={IMAGE_CACHE_MAX_AGE}"
+    return REVALIDATE
+
+
+def serialize_status(image: Image, request: Request, queue_position: Optional[int] = None) -> dict:
+    """
+    Status-only view of an image, for the streaming and long-poll endpoints.
+
+    ``progress`` is only known while a worker reports it, so it is None for
+    rows read back in PROCESSING state.
+    """
+    progress = {ImageStatus.PENDING: 0.0, ImageStatus.COMPLETED: 1.0}.get(image.status)
+    return {
+        "id": image.id,
+        "status": image.status.value,
+        "queuePosition": queue_position,
+        "progress": progress,
+        "errorMessage": image.error_message,
+        "colorizedUrl": blob_url(request, PROCESSED_BUCKET, image.colorized_key),
+    }
+
+
+def status_from_event(message: dict, request: Request) -> dict:
+    """
+    Convert a worker status event to the format of serialize_status.
+
+    Progress events of videos also carry ``frame`` (frames done) and ``frames``.
+    """
+    status = {
+        "id": message["imageId"],
+        "status": message["status"],
+        "queuePosition": None,
+        "progress": message.get("progress"),
+        "errorMessage": message.get("errorMessage"),
+        "colorizedUrl": blob_url(request, PROCESSED_BUCKET, message.get("colorizedKey")),
+    }
+    if "frames" in message:
+        status.update(frame=message.get("frame"), frames=message["frames"])
+    return status
+
+
+def load_statuses(
+    request: Request,
+    session_id: str,
+    image_id: Optional[int] = None,
+    include: tuple = (),
+) -> list[dict]:
+    """
+    Read the status of a session's active images (blocking, run in a thread).
+
+    Args:
+        request: Current request, for building URLs
+        session_id: Owner of the images
+        image_id: Restrict to one image, whatever its status
+        include: IDs to read even if no longer active (to observe their transition)
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(Image).options(
+            load_only(Image.id, Image.status, Image.error_message, Image.colorized_key)
+        ).filter(Image.session_id == session_id)
+        if image_id is not None:
+            query = query.filter(Image.id == image_id)
+        else:
+            query = query.filter(Image.status.in_(ACTIVE_STATUSES) | Image.id.in_(include))
+        images = query.order_by(Image.id).all()
+        positions = queue_positions(
+            db, [image.id for image in images if image.status == ImageStatus.PENDING]
+        )
+        return [serialize_status(image, request, positions.get(image.id)) for image in images]
+    finally:
+        db.close()
+
+
+def format_sse(payload: dict, event: str = "status") -> str:
+    """Encode one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def load_nodes() -> list[dict]:
+    """Live worker nodes (see nodes.py), or none if the database cannot be read."""
+    db = SessionLocal()
     try:
-        get_colorizer()
-        logger.info("Colorizer initialized")
+        return live_nodes(db)
     except Exception as e:
-        logger.warning(f"Colorizer initialization failed: {e}")
+        logger.warning(f"Failed to read worker nodes: {e}")
+        return []
+    finally:
+        db.close()
+
+
+def workers_ready(nodes: list[dict]) -> bool:
+    """Whether a local worker or a worker node has a warmed-up model."""
+    return worker_pool.ready_workers() > 0 or any(node["ready"] for node in nodes)
 
 
 @app.get("/")
 async def root():
-    """Health check endpoint."""
-    return {"message": "Image Colorizer API", "status": "running"}
+    """Frontend SPA when built, otherwise service info; see /healthz and /readyz for probes."""
+    index_path = frontend_index()
+    if index_path:
+        return FileResponse(index_path)
+    return {
+        "message": "Image Colorizer API",
+        "status": "running",
+        "ready": workers_ready(await run_in_threadpool(load_nodes)),
+    }
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+def check_database() -> Optional[str]:
+    """Run a trivial query; return the error message if the database is unusable."""
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT 1"))
+        return None
+    except Exception as e:
+        return str(e)
+    finally:
+        db.close()
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness probe: the database answers and at least one worker (local,
+    or a worker node on any host) has loaded and warmed up the model.
+    Returns 503 until then, with the per-worker state (including load
+    errors), the live worker nodes and startup timings.
+    """
+    database_error = await run_in_threadpool(check_database)
+    nodes = await run_in_threadpool(load_nodes)
+    ready_workers = worker_pool.ready_workers()
+    ready = database_error is None and workers_ready(nodes)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "database": {"ok": database_error is None, "error": database_error},
+            "workers": {
+                "alive": worker_pool.alive_workers(),
+                "ready": ready_workers,
+                "states": worker_pool.worker_readiness,
+            },
+            "nodes": nodes,
+            "startup": startup_timer.summary(),
+        },
+    )
+
+
+@app.get("/api/stats")
+def get_stats(db: Session = Depends(get_db)):
+    """Runtime statistics of the processing pipeline."""
+    nodes = live_nodes(db)
+    return {
+        "queue": queue_counts(db),
+        "cluster": cluster_summary(nodes),
+        "nodes": nodes,
+        "workers": {
+            "alive": worker_pool.alive_workers(),
+            "reports": {
+                worker_id: {k: v for k, v in stats.items() if k != "metrics"}
+                for worker_id, stats in worker_pool.worker_stats.items()
+            },
+        },
+        "publicCache": get_public_image_cache().stats(),
+    }
+
+
+@app.get("/metrics")
+async def get_metrics(db: Session = Depends(get_db)):
+    """Prometheus metrics of the API process and all workers."""
+    counts = await run_in_threadpool(queue_counts, db)
+    cluster = cluster_summary(await run_in_threadpool(live_nodes, db))
+    reports = dict(worker_pool.worker_stats)
+    models = [
+        ({"worker": worker_id, "model": name}, 1)
+        for worker_id, stats in reports.items()
+        for name in (stats.get("models") or {}).get("loaded", [])
+    ]
+    gauges = [
+        (
+            "colorizer_queue_jobs",
+            "Images per status",
+            [({"status": status}, count) for status, count in counts.items()],
+        ),
+        ("colorizer_workers_alive", "Running workers", [({}, worker_pool.alive_workers())]),
+        ("colorizer_workers_ready", "Workers with a warmed-up model", [({}, worker_pool.ready_workers())]),
+        (
+            "colorizer_nodes",
+            "Worker nodes reporting to the cluster, by readiness",
+            [({"ready": "true"}, cluster["ready"]), ({"ready": "false"}, cluster["nodes"] - cluster["ready"])],
+        ),
+        ("colorizer_cluster_capacity", "Job slots of the ready worker nodes", [({}, cluster["capacity"])]),
+        (
+            "colorizer_jobs_in_flight",
+            "Jobs being processed per worker",
+            [({"worker": worker_id}, stats.get("inFlight", 0)) for worker_id, stats in reports.items()],
+        ),
+        (
+            "colorizer_executor_saturation",
+            "In-flight jobs relative to the worker's concurrency (1 = no free slots)",
+            [
+                ({"worker": worker_id}, stats.get("inFlight", 0) / stats["concurrency"])
+                for worker_id, stats in reports.items() if stats.get("concurrency")
+            ],
+        ),
+        (
+            "colorizer_similar_max_distance",
+            "Hash distance up to which near-duplicates reuse earlier results (-1 = off)",
+            [({}, SIMILAR_MAX_DISTANCE)],
+        ),
+        ("colorizer_model_loaded", "Generators loaded per worker", models),
+        (
+            "colorizer_model_memory_bytes",
+            "Memory of the loaded generators per worker",
+            [
+                ({"worker": worker_id}, stats["models"]["memoryBytes"])
+                for worker_id, stats in reports.items() if stats.get("models")
+            ],
+        ),
+    ]
+    snapshot = merge([metrics.snapshot(), *worker_pool.worker_metrics()])
+    return Response(render(snapshot, gauges), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/api/models")
+async def list_models():
+    """Models an upload can choose with the ``model`` form field."""
+    return {
+        "default": DEFAULT_MODEL,
+        "models": [
+            {"name": name, "artistic": is_artistic(path)}
+            for name, path in MODELS.items()
+        ],
+    }
 
 
 @app.post("/api/session")
@@ -138,40 +641,74 @@ async def create_session():
 
 
 @app.get("/api/images")
-async def list_images(
+def list_images(
+    request: Request,
+    response: Response,
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    batch: Optional[str] = None,
     db: Session = Depends(get_db),
     session_id: str = Depends(get_session_id)
 ):
     """
-    Get all images for the current session.
+    Get a page of images for the current session, newest first.
     Only returns images that belong to the session_id.
     
+    Pagination is keyset-based on (created_at, id): pass the ``X-Next-Cursor``
+    response header back as ``cursor`` to get the next page; the header is
+    absent on the last page. ``fields`` is a comma-separated subset of the
+    response fields (e.g. ``id,status,createdAt,colorizedUrl``); only the
+    columns those fields need are loaded. ``batch`` restricts the listing
+    to one bulk upload.
+    
     Security: This endpoint filters images by session_id, ensuring users can only
     see their own images. Images from other sessions are never returned.
     """
+    selected = None
+    if fields:
+        selected = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in selected if name not in IMAGE_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(IMAGE_FIELDS)}"
+            )
+    
     # Security: Filter images by session_id - privacy by default
     # Users can only see images they created with their session
-    images = db.query(Image).filter(
+    columns = {Image.id, Image.created_at}
+    for name in selected or IMAGE_FIELDS:
+        columns.update(IMAGE_FIELDS[name][0])
+    query = db.query(Image).options(load_only(*columns)).filter(
         Image.session_id == session_id
-    ).order_by(Image.created_at.desc()).all()
-    
-    return [
-        {
-            "id": img.id,
-            "originalUrl": img.original_url,
-            "colorizedUrl": img.colorized_url,
-            "status": img.status.value,
-            "errorMessage": img.error_message,
-            "createdAt": img.created_at.isoformat(),
-            "publicToken": img.public_token,
-        }
-        for img in images
-    ]
+    )
+    if batch:
+        query = query.filter(Image.batch_id == batch)
+    
+    if cursor:
+        try:
+            created_at, image_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(
+            (Image.created_at < created_at)
+            | ((Image.created_at == created_at) & (Image.id < image_id))
+        )
+    
+    # One extra row tells whether there is a next page
+    images = query.order_by(Image.created_at.desc(), Image.id.desc()).limit(limit + 1).all()
+    if len(images) > limit:
+        images = images[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(images[-1])
+    
+    return [serialize_image(img, request, fields=selected) for img in images]
 
 
 @app.get("/api/images/{image_id}")
-async def get_image(
+def get_image(
     image_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     session_id: str = Depends(get_session_id)
 ):
@@ -201,91 +738,466 @@ async def get_image(
         logger.warning(f"Access denied: Image {image_id} requested by session {session_id[:8]}...")
         raise HTTPException(status_code=404, detail="Image not found")
     
-    return {
-        "id": image.id,
-        "originalUrl": image.original_url,
-        "colorizedUrl": image.colorized_url,
-        "status": image.status.value,
-        "errorMessage": image.error_message,
-        "createdAt": image.created_at.isoformat(),
-        "publicToken": image.public_token,
-    }
+    body = encode_json(serialize_image(image, request))
+    return conditional_json(
+        request,
+        body,
+        payload_etag(body),
+        image_cache_control(image.status, "private"),
+        {"Vary": "X-Session-ID"},
+    )
+
+
+def publish_cancelled(image_ids, session_id: str) -> None:
+    """Tell status subscribers that jobs were cancelled."""
+    for image_id in image_ids:
+        event_broker.publish({
+            "type": "status",
+            "imageId": image_id,
+            "sessionId": session_id,
+            "status": ImageStatus.CANCELLED.value,
+            "errorMessage": "Cancelled",
+        })
+
+
+@app.post("/api/images/{image_id}/cancel")
+def cancel_image(
+    image_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    session_id: str = Depends(get_session_id)
+):
+    """
+    Cancel the colorization of an image.
+
+    A queued job is dropped; a running one is stopped by its worker at the
+    next stage boundary (decode, inference, storage; between frame batches
+    of a video). Returns the status view of the image, or 409 if it had
+    already finished.
+    """
+    image = db.query(Image).filter(Image.id == image_id, Image.session_id == session_id).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if not cancel_jobs(db, [image_id]):
+        db.refresh(image)
+        raise HTTPException(status_code=409, detail=f"Image is already {image.status.value}")
+    logger.info(f"Image {image_id} cancelled")
+    publish_cancelled([image_id], session_id)
+    db.refresh(image)
+    return serialize_status(image, request)
+
+
+@app.get("/api/images/{image_id}/status")
+async def get_image_status(
+    image_id: int,
+    request: Request,
+    wait: float = Query(0, ge=0),
+    known: Optional[str] = None,
+    session_id: str = Depends(get_session_id)
+):
+    """
+    Cheap status-only view of an image, with optional long-polling.
+
+    With ``wait`` > 0 and ``known`` set to the status the client already has,
+    the request is held until the status changes, the worker reports
+    progress, or ``wait`` seconds (capped) have passed. This is the fallback
+    for clients that cannot use the event stream.
+    """
+    subscription = event_broker.subscribe(image_id=image_id) if wait else None
+    try:
+        statuses = await run_in_threadpool(load_statuses, request, session_id, image_id)
+        if not statuses:
+            raise HTTPException(status_code=404, detail="Image not found")
+        payload = statuses[0]
+
+        deadline = time.monotonic() + min(wait, LONG_POLL_MAX_SECONDS)
+        while subscription and payload["status"] == known and known not in TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(
+                    subscription.queue.get(), min(remaining, STATUS_RESYNC_SECONDS)
+                )
+                return status_from_event(message, request)
+            except asyncio.TimeoutError:
+                # The worker may run in another process that does not publish to us
+                statuses = await run_in_threadpool(load_statuses, request, session_id, image_id)
+                payload = statuses[0]
+        return payload
+    finally:
+        if subscription:
+            event_broker.unsubscribe(subscription)
+
+
+@app.get("/api/events")
+async def stream_events(
+    request: Request,
+    image_id: Optional[int] = Query(None, alias="image"),
+    session_id: str = Depends(get_stream_session_id)
+):
+    """
+    Server-Sent Events stream of status changes for the session's images.
+
+    The stream starts with the current status of every active image (or of
+    ``image`` only) and then pushes transitions, worker progress and queue
+    positions. Every STATUS_RESYNC_SECONDS the active images are re-read in
+    one query, which updates queue positions and catches changes made by
+    workers whose events do not reach this process. When following a single
+    image the stream ends once it is completed or failed.
+    """
+    subscription = event_broker.subscribe(session_id=session_id, image_id=image_id)
+
+    async def stream():
+        # Last payload sent per image that is still active
+        active: dict[int, dict] = {}
+
+        def changed(payload: dict) -> bool:
+            previous = active.get(payload["id"])
+            if previous and payload["status"] == previous["status"] == ImageStatus.PROCESSING.value:
+                # Rows read back from the database do not carry progress
+                if payload["progress"] is None:
+                    payload["progress"] = previous["progress"]
+            if payload["status"] in TERMINAL_STATUSES:
+                active.pop(payload["id"], None)
+                return previous is not None or image_id is not None
+            active[payload["id"]] = payload
+            return payload != previous
+
+        async def resync() -> list[dict]:
+            return await run_in_threadpool(
+                load_statuses, request, session_id, image_id, tuple(active)
+            )
+
+        try:
+            for payload in await resync():
+                if changed(payload):
+                    yield format_sse(payload)
+            last_write = next_resync = time.monotonic()
+            next_resync += STATUS_RESYNC_SECONDS
+
+            while not (image_id is not None and not active):
+                if await request.is_disconnected():
+                    break
+                try:
+                    message = await asyncio.wait_for(
+                        subscription.queue.get(), max(0.0, next_resync - time.monotonic())
+                    )
+                    updates = [status_from_event(message, request)]
+                except asyncio.TimeoutError:
+                    updates = await resync()
+                    next_resync = time.monotonic() + STATUS_RESYNC_SECONDS
+
+                for payload in updates:
+                    if changed(payload):
+                        yield format_sse(payload)
+                        last_write = time.monotonic()
+                if time.monotonic() - last_write >= SSE_KEEPALIVE_SECONDS:
+                    yield ": keepalive\n\n"
+                    last_write = time.monotonic()
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/api/public/{public_token}")
-async def get_image_by_token(public_token: str, db: Session = Depends(get_db)):
-    """Get image by public token (for sharing)."""
+def get_image_by_token(public_token: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Get image by public token (for sharing).
+    
+    Finished images never change, so their response is kept in memory
+    (per API process) and popular shared links are answered without a
+    database query. Responses carry an ETag for conditional requests.
+    """
+    cache = get_public_image_cache()
+    cache_key = (public_token, str(request.base_url))
+    cached = cache.get(cache_key)
+    metrics.inc("colorizer_public_cache_total", result="miss" if cached is None else "hit")
+    if cached is not None:
+        body, etag = cached
+        return conditional_json(request, body, etag, image_cache_control(ImageStatus.COMPLETED, "public"))
+    
     image = db.query(Image).filter(Image.public_token == public_token).first()
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
     
-    return {
-        "id": image.id,
-        "originalUrl": image.original_url,
-        "colorizedUrl": image.colorized_url,
-        "status": image.status.value,
-        "errorMessage": image.error_message,
-        "createdAt": image.created_at.isoformat(),
+    body = encode_json(serialize_image(image, request, include_token=False))
+    etag = payload_etag(body)
+    if image.status.value in TERMINAL_STATUSES:
+        cache.put(cache_key, body, etag)
+    return conditional_json(request, body, etag, image_cache_control(image.status, "public"))
+
+
+def stream_blob(
+    store,
+    key: str,
+    request: Request,
+    headers: Optional[dict] = None,
+    media_type: Optional[str] = None,
+    cache_control: str = IMMUTABLE,
+):
+    """
+    Stream a stored blob, honouring a single byte range and conditional requests.
+
+    The blob key is the ETag: a matching ``If-None-Match`` gets 304, and a
+    range is only served while ``If-Range`` (if sent) still names this blob.
+
+    Args:
+        store: Blob store holding the blob
+        key: Blob key
+        request: Current request (for the Range and conditional headers)
+        headers: Extra response headers
+        media_type: Content type (default: sniffed from the image header)
+        cache_control: Cache-Control header value
+    """
+    etag = blob_etag(key)
+    headers = {"ETag": etag, "Cache-Control": cache_control, **(headers or {})}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    size = store.size(key)
+    if media_type is None:
+        with open(store.path_for(key), "rb") as f:
+            media_type = sniff_mime(f.read(16))
+
+    headers["Accept-Ranges"] = "bytes"
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        # The client's partial copy is of another version: send it all
+        range_header = None
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except ValueError:
+        return JSONResponse(
+            status_code=416,
+            content={"detail": "Requested range not satisfiable"},
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(store.iter_range(key), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        store.iter_range(key, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+@app.get("/api/blobs/{bucket}/{key}", name="download_blob")
+async def download_blob(bucket: str, key: str, request: Request):
+    """
+    Stream a stored image.
+
+    Blobs are addressed by the SHA-256 of their content, so the key doubles as
+    an unguessable capability. Single byte ranges are supported for resumable
+    downloads and progressive loading.
+    """
+    if bucket not in (UPLOADS_BUCKET, PROCESSED_BUCKET) or not is_valid_key(key):
+        raise HTTPException(status_code=404, detail="Not found")
+    store = get_blob_store(bucket)
+    if not store.exists(key):
+        raise HTTPException(status_code=404, detail="Not found")
+    return stream_blob(store, key, request)
+
+
+@app.get("/api/blobs/{bucket}/{key}/{variant}", name="download_derivative")
+async def download_derivative(bucket: str, key: str, variant: str, request: Request):
+    """
+    Stream a resized or re-encoded rendition of a colorized result.
+
+    ``variant`` is a size from DERIVATIVE_SIZES (e.g. ``thumb``, ``preview``)
+    or ``full``. The format (AVIF, WebP or JPEG) is chosen from the Accept
+    header. Derivatives are rendered by the worker after colorization; this
+    unauthenticated route never encodes anything. While a derivative is
+    missing, the result itself is served, marked for revalidation so the
+    derivative replaces it once it exists.
+    """
+    if bucket != PROCESSED_BUCKET or not is_valid_key(key):
+        raise HTTPException(status_code=404, detail="Not found")
+    if variant not in derivative_variants():
+        raise HTTPException(status_code=404, detail="Unknown variant")
+    store = get_blob_store(bucket)
+    if not store.exists(key):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    fmt = negotiate_format(request.headers.get("accept"))
+    headers = {"Vary": "Accept"}
+    if is_passthrough(bucket, key, variant, fmt):
+        return stream_blob(store, key, request, headers)
+
+    def load() -> Optional[str]:
+        db = SessionLocal()
+        try:
+            derivative = find_derivative(db, key, variant, fmt)
+            return derivative.key if derivative else None
+        finally:
+            db.close()
+
+    derivative_key = await run_in_threadpool(load)
+    if derivative_key is None:
+        return stream_blob(store, key, request, headers, cache_control="no-cache")
+    return stream_blob(get_blob_store(DERIVATIVES_BUCKET), derivative_key, request, headers)
+
+
+def validate_processing_options(render_factor: Optional[int], mode: str, model: Optional[str] = None) -> None:
+    """Reject out-of-range processing options of an upload."""
+    if render_factor is not None and not RENDER_FACTOR_MIN <= render_factor <= RENDER_FACTOR_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"render_factor must be between {RENDER_FACTOR_MIN} and {RENDER_FACTOR_MAX}"
+        )
+    
+    if mode not in PROCESSING_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"mode must be one of: {', '.join(PROCESSING_MODES)}"
+        )
+    
+    if model is not None and model not in MODELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"model must be one of: {', '.join(MODELS)}"
+        )
+
+
+def check_admission(db: Session) -> None:
+    """Admission control: shed load instead of growing an unbounded backlog."""
+    if queue_depth(db) >= JOB_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many images are waiting to be processed. Please retry later.",
+            headers={"Retry-After": str(JOB_RETRY_AFTER_SECONDS)},
+        )
+
+
+def upload_form_schema(mode: bool = True) -> dict:
+    """OpenAPI request body of the streamed single-file upload endpoints."""
+    properties = {
+        "file": {"type": "string", "format": "binary"},
+        "render_factor": {"type": "integer", "minimum": RENDER_FACTOR_MIN, "maximum": RENDER_FACTOR_MAX},
+        "model": {"type": "string", "enum": list(MODELS)},
     }
+    if mode:
+        properties["mode"] = {"type": "string", "enum": list(PROCESSING_MODES), "default": "auto"}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"], "properties": properties,
+    }}}}}
+
+
+def batch_form_schema() -> dict:
+    """OpenAPI request body of the streamed bulk upload endpoint."""
+    schema = upload_form_schema()
+    body = schema["requestBody"]["content"]["multipart/form-data"]["schema"]
+    body["properties"]["files"] = {"type": "array", "items": {"type": "string", "format": "binary"}}
+    del body["properties"]["file"]
+    body["required"] = ["files"]
+    return schema
+
+
+def upload_options(fields: dict) -> tuple[Optional[int], str, Optional[str]]:
+    """Read (render_factor, mode, model) from the text fields of a streamed upload."""
+    render_factor = fields.get("render_factor") or None
+    if render_factor is not None:
+        try:
+            render_factor = int(render_factor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="render_factor must be an integer")
+    return render_factor, fields.get("mode") or "auto", fields.get("model") or None
+
+
+async def receive_upload(request: Request, max_bytes: int, inspect) -> StreamedForm:
+    """Stream a single-file upload into the uploads store (see uploads.read_upload_form)."""
+    try:
+        return await read_upload_form(request, get_blob_store(UPLOADS_BUCKET), max_bytes, inspect)
+    except UploadRejected as e:
+        logger.info(f"Upload rejected ({e.status_code}): {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+def discard_upload(db: Session, key: str) -> None:
+    """Delete a just-stored original unless another image uses the same content."""
+    if not db.query(Image.id).filter(Image.original_key == key).first():
+        get_blob_store(UPLOADS_BUCKET).delete(key)
+
+
+def insert_image(db: Session, image: Image) -> None:
+    """Insert an uploaded image, which queues it as a job (blocking, run in a thread)."""
+    db.add(image)
+    with stage("db_commit"):
+        db.commit()
+    db.refresh(image)
 
 
-@app.post("/api/images")
+@app.post("/api/images", openapi_extra=upload_form_schema())
 async def upload_image(
-    file: UploadFile = File(...),
+    request: Request,
     db: Session = Depends(get_db),
     session_id: str = Depends(get_session_id)
 ):
     """
     Upload and colorize an image.
     Image is automatically linked to the current session_id for privacy.
+    
+    The multipart body (``file`` plus the optional ``render_factor``,
+    ``mode`` and ``model`` fields) is streamed into blob storage while it is
+    received. Uploads over the size limit are cut off with 413 as soon as
+    they cross it, and the format and dimensions are sniffed from the first
+    bytes, so non-images (400) and oversized images (413) never get decoded.
     """
-    # Validate file type
-    if not file.content_type or not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    await run_in_threadpool(check_admission, db)
     
     try:
-        # Read file content
-        file_content = await file.read()
+        with stage("upload_read"):
+            form = await receive_upload(request, MAX_UPLOAD_BYTES, ImageInspector)
+        upload = form.file
         
-        # Convert to base64 data URL
-        base64_data = base64.b64encode(file_content).decode("utf-8")
-        original_url = f"data:{file.content_type};base64,{base64_data}"
-        
-        # Validate file size (max 10MB)
-        if len(file_content) > 10 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
+        render_factor, mode, model = upload_options(form.fields)
+        try:
+            validate_processing_options(render_factor, mode, model)
+        except HTTPException:
+            await run_in_threadpool(discard_upload, db, upload.key)
+            raise
         
         # Create database record with secure public token and session_id
         public_token = generate_public_token()
         db_image = Image(
-            original_url=original_url,
+            original_key=upload.key,
+            original_mime=upload.mime,
+            filename=upload.filename,
+            model=model,
+            render_factor=render_factor,
+            processing_mode=mode,
+            width=upload.width,
+            height=upload.height,
             status=ImageStatus.PENDING,  # Start with PENDING, not PROCESSING
             public_token=public_token,
-            session_id=session_id  # Link image to session for privacy
+            session_id=session_id,  # Link image to session for privacy
+            trace_id=current_trace_id(),
         )
-        db.add(db_image)
-        db.commit()
-        db.refresh(db_image)
+        schedule(db_image)
+        await run_in_threadpool(insert_image, db, db_image)
+        event_broker.publish({
+            "type": "status",
+            "imageId": db_image.id,
+            "sessionId": session_id,
+            "status": ImageStatus.PENDING.value,
+            "progress": 0.0,
+        })
         
-        # Process image asynchronously (don't await - let it run in background)
-        try:
-            asyncio.create_task(process_image_async(db_image.id, file_content, file.content_type or "image/jpeg"))
-        except Exception as task_error:
-            logger.error(f"Failed to start processing task: {task_error}")
-            # Update status to failed
-            db_image.status = ImageStatus.FAILED
-            db_image.error_message = f"Failed to start processing: {str(task_error)}"
-            db.commit()
-        
-        return {
-            "id": db_image.id,
-            "originalUrl": db_image.original_url,
-            "colorizedUrl": db_image.colorized_url,
-            "status": db_image.status.value,
-            "errorMessage": db_image.error_message,
-            "createdAt": db_image.created_at.isoformat(),
-            "publicToken": db_image.public_token,
-        }
+        # The row itself is the queued job; a worker will claim it
+        return serialize_image(db_image, request)
         
     except HTTPException:
         raise
@@ -294,50 +1206,370 @@ async def upload_image(
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-async def process_image_async(image_id: int, image_data: bytes, mime_type: str):
-    """Process image colorization asynchronously."""
-    from .database import SessionLocal
-    db = SessionLocal()
+@app.post("/api/videos", openapi_extra=upload_form_schema(mode=False))
+async def upload_video(
+    request: Request,
+    db: Session = Depends(get_db),
+    session_id: str = Depends(get_session_id)
+):
+    """
+    Upload a video clip for colorization.
+    
+    The clip is streamed into blob storage while it is received, like an
+    image upload, and queued as a job of kind ``video``. Progress events
+    carry the number of frames done (``frame``) and in total (``frames``).
+    The result is an H.264 MP4 with the original audio.
+    """
+    if not video_tools_available():
+        raise HTTPException(status_code=503, detail="Video processing is not available (ffmpeg not installed)")
+    await run_in_threadpool(check_admission, db)
+    
+    with stage("upload_read"):
+        form = await receive_upload(request, MAX_VIDEO_UPLOAD_BYTES, lambda: UploadInspector("video"))
+    upload = form.file
+    render_factor, _, model = upload_options(form.fields)
     try:
-        # Update status to processing
-        image = db.query(Image).filter(Image.id == image_id).first()
-        if not image:
-            logger.error(f"Image {image_id} not found")
-            return
-        
-        image.status = ImageStatus.PROCESSING
-        db.commit()
-        
-        # Run colorization in thread pool (blocking operation)
-        loop = asyncio.get_event_loop()
-        colorizer = get_colorizer()
-        
-        # Use the image_data bytes directly (already read from file)
-        colorized_data_url = await loop.run_in_executor(
-            executor,
-            lambda: colorizer.colorize_from_base64(
-                base64.b64encode(image_data).decode("utf-8"),
-                mime_type
-            )
+        validate_processing_options(render_factor, "auto", model)
+        info = await run_in_threadpool(probe_video, str(get_blob_store(UPLOADS_BUCKET).path_for(upload.key)))
+    except HTTPException:
+        await run_in_threadpool(discard_upload, db, upload.key)
+        raise
+    except VideoError as e:
+        await run_in_threadpool(discard_upload, db, upload.key)
+        raise HTTPException(status_code=400, detail=f"Could not read video: {e}")
+    
+    db_image = Image(
+        kind="video",
+        original_key=upload.key,
+        original_mime=upload.mime,
+        filename=upload.filename,
+        model=model,
+        render_factor=render_factor,
+        width=info.width,
+        height=info.height,
+        status=ImageStatus.PENDING,
+        public_token=generate_public_token(),
+        session_id=session_id,
+        trace_id=current_trace_id(),
+    )
+    schedule(db_image, frames=info.frames)
+    await run_in_threadpool(insert_image, db, db_image)
+    logger.info(f"Video {db_image.id} queued ({info.width}x{info.height}, {info.frames} frames)")
+    event_broker.publish({
+        "type": "status",
+        "imageId": db_image.id,
+        "sessionId": session_id,
+        "status": ImageStatus.PENDING.value,
+        "progress": 0.0,
+    })
+    return serialize_image(db_image, request)
+
+
+@app.post("/api/batches", openapi_extra=batch_form_schema())
+async def upload_batch(
+    request: Request,
+    db: Session = Depends(get_db),
+    session_id: str = Depends(get_session_id)
+):
+    """
+    Upload many images at once: several ``files`` parts, ZIP/TAR archives, or both.
+    
+    Admission is checked before the body is read, and the body is streamed
+    with the total size capped at BATCH_UPLOAD_MAX_BYTES (413 as soon as it
+    is crossed). Archives are extracted entry by entry; non-image entries and
+    files over the size limit are skipped and listed in the response. All
+    images are inserted in one transaction and queued as one batch, whose
+    progress is available from ``GET /api/batches/{id}``.
+    """
+    await run_in_threadpool(check_admission, db)
+    
+    try:
+        with stage("upload_read"):
+            form = await read_bulk_form(request, BATCH_UPLOAD_MAX_BYTES)
+    except UploadRejected as e:
+        logger.info(f"Batch upload rejected ({e.status_code}): {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    try:
+        render_factor, mode, model = upload_options(form.fields)
+        validate_processing_options(render_factor, mode, model)
+        parts = [(part.filename, part.content_type, part.file) for part in form.parts]
+        with stage("batch_ingest"):
+            result = await run_in_threadpool(ingest_uploads, parts, get_blob_store(UPLOADS_BUCKET))
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read archive: {e}")
+    finally:
+        form.close()
+    if not result.files:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "No images found in the upload", "skipped": result.skipped},
         )
-        
-        # Update database with result
-        image.colorized_url = colorized_data_url
-        image.status = ImageStatus.COMPLETED
-        db.commit()
-        
-        logger.info(f"Image {image_id} colorized successfully")
-        
-    except Exception as e:
-        logger.error(f"Colorization failed for image {image_id}: {e}", exc_info=True)
-        # Update database with error
-        image = db.query(Image).filter(Image.id == image_id).first()
-        if image:
-            image.status = ImageStatus.FAILED
-            image.error_message = str(e)
+    
+    batch = Batch(id=generate_public_token(), session_id=session_id, total=len(result.files))
+    images = [
+        Image(
+            original_key=item.key,
+            original_mime=item.mime,
+            filename=item.filename,
+            model=model,
+            render_factor=render_factor,
+            processing_mode=mode,
+            width=item.width,
+            height=item.height,
+            status=ImageStatus.PENDING,
+            public_token=generate_public_token(),
+            session_id=session_id,
+            batch_id=batch.id,
+            trace_id=current_trace_id(),
+        )
+        for item in result.files
+    ]
+    for image in images:
+        schedule(image, BULK_LANE)
+    
+    def insert() -> list[dict]:
+        db.add(batch)
+        db.add_all(images)
+        db.flush()
+        created = [{"id": image.id, "filename": image.filename} for image in images]
+        with stage("db_commit"):
             db.commit()
-    finally:
-        db.close()
+        return created
+    
+    created = await run_in_threadpool(insert)
+    logger.info(f"Batch {batch.id[:8]}... queued {len(created)} images, skipped {len(result.skipped)}")
+    
+    return {
+        "id": batch.id,
+        "total": len(created),
+        "images": created,
+        "skipped": result.skipped,
+        "statusUrl": str(request.url_for("get_batch", batch_id=batch.id)),
+    }
+
+
+@app.get("/api/batches/{batch_id}", name="get_batch")
+def get_batch(
+    batch_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    session_id: str = Depends(get_session_id)
+):
+    """
+    Progress of a batch: image counts per status and the download link.
+    Images of the batch are listed with ``GET /api/images?batch={id}``.
+    """
+    batch = db.query(Batch).filter(Batch.id == batch_id, Batch.session_id == session_id).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    rows = db.query(Image.status, func.count(Image.id)).filter(
+        Image.batch_id == batch_id
+    ).group_by(Image.status).all()
+    counts = {status.value: 0 for status in ImageStatus}
+    counts.update({status.value: count for status, count in rows})
+    done = sum(counts[status] for status in TERMINAL_STATUSES)
+    
+    return {
+        "id": batch.id,
+        "total": batch.total,
+        "createdAt": batch.created_at.isoformat(),
+        "counts": counts,
+        "progress": done / batch.total if batch.total else 1.0,
+        "finished": done >= batch.total,
+        "downloadUrl": str(request.url_for("download_batch", batch_id=batch.id)),
+    }
+
+
+@app.post("/api/batches/{batch_id}/cancel")
+def cancel_batch(
+    batch_id: str,
+    db: Session = Depends(get_db),
+    session_id: str = Depends(get_session_id)
+):
+    """Cancel every image of a batch that is still queued or running."""
+    batch = db.query(Batch).filter(Batch.id == batch_id, Batch.session_id == session_id).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    active = [
+        row.id for row in db.query(Image.id).filter(
+            Image.batch_id == batch_id, Image.status.in_(ACTIVE_STATUSES)
+        )
+    ]
+    cancelled = cancel_jobs(db, active)
+    logger.info(f"Batch {batch_id[:8]}... cancelled {len(cancelled)} images")
+    publish_cancelled(cancelled, session_id)
+    return {"id": batch.id, "cancelled": len(cancelled)}
+
+
+@app.get("/api/batches/{batch_id}/download", name="download_batch")
+def download_batch(
+    batch_id: str,
+    db: Session = Depends(get_db),
+    session_id: str = Depends(get_stream_session_id)
+):
+    """
+    Download the results of a batch as a ZIP archive, generated while streaming.
+    Only completed images are included, named after the uploaded files.
+    The session may be passed as ``session`` query parameter for plain links.
+    """
+    batch = db.query(Batch).filter(Batch.id == batch_id, Batch.session_id == session_id).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    rows = db.query(Image.id, Image.filename, Image.colorized_key, Image.colorized_mime).filter(
+        Image.batch_id == batch_id,
+        Image.status == ImageStatus.COMPLETED,
+        Image.colorized_key != None,  # noqa: E711
+    ).order_by(Image.id).all()
+    
+    store = get_blob_store(PROCESSED_BUCKET)
+    used_names: set = set()
+    entries = (
+        (archive_name(row.filename, row.id, row.colorized_mime, used_names), store, row.colorized_key)
+        for row in rows
+    )
+    return StreamingResponse(
+        stream_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="batch-{batch_id[:8]}.zip"'},
+    )
+
+
+def serialize_profile(profile: Profile, request: Request) -> dict:
+    """Serialize a profiling request for the admin API."""
+    return {
+        "id": profile.id,
+        "mode": profile.mode,
+        "target": profile.target,
+        "jobs": profile.jobs,
+        "profiled": profile.profiled,
+        "status": profile.status,
+        "workerId": profile.worker_id,
+        "errorMessage": profile.error_message,
+        "artifactUrl": (
+            str(request.url_for("download_profile", profile_id=profile.id))
+            if profile.artifact_key else None
+        ),
+        "createdAt": profile.created_at.isoformat() if profile.created_at else None,
+        "finishedAt": profile.finished_at.isoformat() if profile.finished_at else None,
+    }
+
+
+@app.post("/api/admin/profiles", dependencies=[Depends(require_admin)])
+async def create_profile(body: ProfileRequest, request: Request, db: Session = Depends(get_db)):
+    """
+    Profile the next ``jobs`` jobs of a worker, or the next API requests.
+
+    With target ``jobs`` the first worker to poll (or the one named in
+    ``worker``) takes the request; with target ``requests`` this API
+    process profiles its next requests itself, one at a time. The artifact
+    is available from ``artifactUrl`` once the session is finished.
+    """
+    global request_profile
+    if body.mode not in available_modes():
+        raise HTTPException(
+            status_code=400,
+            detail=f"mode must be one of: {', '.join(available_modes())}",
+        )
+    if body.target not in PROFILE_TARGETS:
+        raise HTTPException(status_code=400, detail=f"target must be one of: {', '.join(PROFILE_TARGETS)}")
+    if body.target == "requests" and body.mode == "torch":
+        raise HTTPException(status_code=400, detail="The API process does not run the model")
+    if not 1 <= body.jobs <= PROFILE_MAX_JOBS:
+        raise HTTPException(status_code=400, detail=f"jobs must be between 1 and {PROFILE_MAX_JOBS}")
+
+    profile = Profile(
+        id=generate_public_token(),
+        mode=body.mode,
+        target=body.target,
+        jobs=body.jobs,
+        worker_id=body.worker,
+    )
+    if body.target == "requests":
+        if request_profile is not None:
+            raise HTTPException(status_code=409, detail="API requests are already being profiled")
+        profile.status = "running"
+        profile.worker_id = f"api-{socket.gethostname()}-{os.getpid()}"
+        request_profile = ProfileSession(profile.id, profile.mode, profile.jobs)
+
+    def save() -> None:
+        db.add(profile)
+        db.commit()
+        db.refresh(profile)
+
+    # The check-and-set of request_profile above stays on the event loop
+    await run_in_threadpool(save)
+    logger.info(f"Profiling of the next {profile.jobs} {profile.target} requested ({profile.mode})")
+    return serialize_profile(profile, request)
+
+
+@app.get("/api/admin/profiles", dependencies=[Depends(require_admin)])
+def list_profiles(request: Request, db: Session = Depends(get_db)):
+    """Recent profiling requests, newest first."""
+    profiles = db.query(Profile).order_by(Profile.created_at.desc(), Profile.id).limit(100).all()
+    return [serialize_profile(profile, request) for profile in profiles]
+
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+def get_profile(profile_id: str, request: Request, db: Session = Depends(get_db)):
+    """State of one profiling request."""
+    profile = db.query(Profile).filter(Profile.id == profile_id).first()
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return serialize_profile(profile, request)
+
+
+@app.get(
+    "/api/admin/profiles/{profile_id}/artifact",
+    name="download_profile",
+    dependencies=[Depends(require_admin)],
+)
+def download_profile(profile_id: str, request: Request, db: Session = Depends(get_db)):
+    """Download the artifact of a finished profiling request."""
+    profile = db.query(Profile).filter(Profile.id == profile_id).first()
+    if not profile or not profile.artifact_key:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    filename = f"profile-{profile.id[:8]}-{profile.mode}{ARTIFACT_SUFFIX[profile.mode]}"
+    return stream_blob(
+        get_blob_store(PROFILES_BUCKET),
+        profile.artifact_key,
+        request,
+        {"Content-Disposition": f'attachment; filename="{filename}"'},
+        media_type=profile.artifact_mime,
+        cache_control="private, no-store",
+    )
+
+
+@app.get("/api/admin/traces", dependencies=[Depends(require_admin)])
+async def get_traces(
+    trace: Optional[str] = Query(None, description="Only spans of this trace ID"),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    """
+    Buffered trace spans of the API process and the workers, in the Chrome
+    trace event format (load into chrome://tracing or ui.perfetto.dev).
+
+    Worker spans arrive with their periodic statistics, so the most recent
+    few seconds of worker activity may be missing.
+    """
+    return chrome_trace(tracer.spans(trace, limit))
+
+
+
+# Registered last so the SPA fallback never shadows the API, probes or /metrics
+@app.get("/{full_path:path}")
+async def serve_frontend(full_path: str):
+    """Serve frontend SPA."""
+    # Don't serve API routes
+    if full_path.startswith("api/") or full_path.startswith("docs") or full_path.startswith("openapi.json"):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    # Serve index.html for all routes (SPA routing)
+    index_path = frontend_index()
+    if index_path:
+        return FileResponse(index_path)
+    raise HTTPException(status_code=404, detail="Frontend not found")
 
 
 if __name__ == "__main__":
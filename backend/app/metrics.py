@@ -0,0 +1,217 @@
+"""
+Prometheus metrics.
+
+Every process (the API and each worker) records latency histograms and
+counters in its own ``metrics`` registry. Workers ship a snapshot of theirs
+with their periodic stats message; ``GET /metrics`` merges the snapshots with
+the API's own registry and adds gauges read at scrape time (queue depth,
+in-flight jobs, loaded models), then renders the Prometheus text format.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+
+# Seconds; covers both a few-millisecond DB commit and a long CPU inference
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Metric name -> {"type", "help", "labelnames", "buckets", "samples"}, where
+# samples maps label values to a counter value or histogram
+# [bucket counts..., sum, count]; picklable, so it can cross process queues
+Snapshot = dict[str, dict]
+
+
+class MetricsRegistry:
+    """Thread-safe collection of counters and histograms of one process."""
+
+    def __init__(self):
+        self._families: Snapshot = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        """Declare a counter (idempotent)."""
+        self._declare(name, "counter", help, labelnames, None)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        """Declare a histogram (idempotent)."""
+        self._declare(name, "histogram", help, labelnames, tuple(sorted(buckets)))
+
+    def _declare(self, name, kind, help, labelnames, buckets) -> None:
+        with self._lock:
+            self._families.setdefault(name, {
+                "type": kind,
+                "help": help,
+                "labelnames": tuple(labelnames),
+                "buckets": buckets,
+                "samples": {},
+            })
+
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        """Increment a counter."""
+        with self._lock:
+            family = self._families[name]
+            key = tuple(str(labels.get(label, "")) for label in family["labelnames"])
+            family["samples"][key] = family["samples"].get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record an observation in a histogram."""
+        with self._lock:
+            family = self._families[name]
+            buckets = family["buckets"]
+            key = tuple(str(labels.get(label, "")) for label in family["labelnames"])
+            sample = family["samples"].get(key)
+            if sample is None:
+                sample = family["samples"][key] = [0] * len(buckets) + [0.0, 0]
+            # Buckets are stored non-cumulatively and summed when rendered
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                sample[index] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    @contextmanager
+    def time(self, name: str, **labels) -> Iterator[None]:
+        """Observe the duration of the enclosed block (also when it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Snapshot:
+        """Copy of all metrics, safe to send to another process."""
+        with self._lock:
+            return {
+                name: {
+                    **family,
+                    "samples": {
+                        key: list(value) if isinstance(value, list) else value
+                        for key, value in family["samples"].items()
+                    },
+                }
+                for name, family in self._families.items()
+            }
+
+
+def merge(snapshots: Iterable[Snapshot]) -> Snapshot:
+    """Sum counters and histograms of several processes."""
+    merged: Snapshot = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.items():
+            target = merged.setdefault(name, {**family, "samples": {}})
+            for key, value in family["samples"].items():
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    target["samples"][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target["samples"][key] = current + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: Optional[tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot: Snapshot, gauges: Iterable[tuple[str, str, list[tuple[dict, float]]]] = ()) -> str:
+    """
+    Render metrics in the Prometheus text exposition format.
+
+    Args:
+        snapshot: Counters and histograms (see merge)
+        gauges: (name, help, [(labels, value), ...]) of each gauge
+    """
+    lines = []
+    for name, family in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        labelnames = family["labelnames"]
+        for key, value in sorted(family["samples"].items()):
+            if family["type"] == "counter":
+                lines.append(f"{name}{_labels(labelnames, key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(family["buckets"], value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labelnames, key, ('le', _number(float(bound))))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labelnames, key, ('le', '+Inf'))} {value[-1]}")
+            lines.append(f"{name}_sum{_labels(labelnames, key)} {_number(float(value[-2]))}")
+            lines.append(f"{name}_count{_labels(labelnames, key)} {value[-1]}")
+    for name, help, samples in gauges:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(float(value))}")
+    return "\n".join(lines) + "\n"
+
+
+# Registry of this process
+metrics = MetricsRegistry()
+metrics.histogram(
+    "colorizer_stage_seconds",
+    "Duration of pipeline stages (decode, inference, postprocess and encode are per batch)",
+    ("stage",),
+)
+metrics.histogram("colorizer_job_seconds", "Time from claiming a job to its outcome", ("status",))
+metrics.histogram(
+    "colorizer_completion_batch_size",
+    "Finished jobs recorded per database commit of a worker",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+metrics.counter("colorizer_jobs_total", "Jobs by outcome (completed, failed, requeued, cancelled)", ("status",))
+metrics.counter("colorizer_job_errors_total", "Job failures by exception class", ("error",))
+metrics.counter("colorizer_result_cache_total", "Result cache lookups by outcome", ("result",))
+metrics.counter(
+    "colorizer_similar_total",
+    "Near-duplicate lookups by outcome (hit, miss, unhashable)",
+    ("result",),
+)
+metrics.histogram(
+    "colorizer_similar_distance",
+    "Hamming distance of the perceptual hashes of reused near-duplicates",
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16),
+)
+metrics.counter(
+    "colorizer_public_cache_total", "Shared-image response cache lookups by outcome", ("result",)
+)
+# Scheduling delays and queue waits run into minutes for bulk jobs
+QUEUE_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+metrics.counter("colorizer_scheduler_claims_total", "Jobs claimed by workers per lane", ("lane",))
+metrics.histogram(
+    "colorizer_scheduler_delay_seconds",
+    "Delay added to the enqueue time of new jobs for their cost and lane",
+    ("lane",),
+    buckets=QUEUE_BUCKETS,
+)
+metrics.histogram(
+    "colorizer_queue_wait_seconds",
+    "Time from upload to a worker claiming the job",
+    ("lane",),
+    buckets=QUEUE_BUCKETS,
+)
+metrics.counter(
+    "colorizer_cancellations_total", "Cancelled jobs by the state they were in (pending, processing)", ("state",)
+)
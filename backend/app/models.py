@@ -1,32 +1,161 @@
 """
 Database models for the image colorization application.
 """
-from sqlalchemy import Column, Integer, String, DateTime, Enum as SQLEnum
+from sqlalchemy import Boolean, Column, Float, Integer, JSON, String, DateTime, Index, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 import enum
 
 Base = declarative_base()
 
 
+# On SQLite, datetimes are stored as text and the server default
+# (CURRENT_TIMESTAMP) has no fractional seconds. Bind parameters must use the
+# same format, or comparisons such as keyset pagination go wrong.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite",
+)
+
+
 class ImageStatus(str, enum.Enum):
     """Image processing status enum."""
     PENDING = "pending"
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 
 class Image(Base):
     """Image model for storing image metadata."""
     __tablename__ = "images"
+    __table_args__ = (
+        # Keyset pagination of a session's listing (newest first)
+        Index("ix_images_session_created", "session_id", "created_at", "id"),
+        # Claiming the next job (see jobs.py)
+        Index("ix_images_status_queue_key", "status", "queue_key", "id"),
+        # Loading new results into the near-duplicate index (see similar.py)
+        Index("ix_images_status_finished", "status", "finished_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    original_url = Column(String, nullable=False)  # Base64 data URL or file path
-    colorized_url = Column(String, nullable=True)   # Base64 data URL or file path
-    status = Column(SQLEnum(ImageStatus), default=ImageStatus.PENDING, nullable=False)
+    # Legacy base64 data URLs (migrated to blob storage). Deferred: they can be
+    # megabytes each and are only loaded when accessed
+    original_url = deferred(Column(String, nullable=True))
+    colorized_url = deferred(Column(String, nullable=True))
+    original_key = Column(String(64), nullable=True)  # SHA-256 key in the uploads blob store
+    original_mime = Column(String, nullable=True)
+    colorized_key = Column(String(64), nullable=True)  # SHA-256 key in the processed blob store
+    colorized_mime = Column(String, nullable=True)
+    model = Column(String(64), nullable=True)  # Name from MODELS (None = DEFAULT_MODEL)
+    render_factor = Column(Integer, nullable=True)  # Per-upload render factor (None = model default)
+    processing_mode = Column(String(16), nullable=True)  # auto / standard / large (None = auto)
+    width = Column(Integer, nullable=True)   # Original dimensions, read from the file header
+    height = Column(Integer, nullable=True)
+    phash = Column(String(16), nullable=True)  # Perceptual hash, hex (see similar.py)
+    inference_backend = Column(String(32), nullable=True)  # Backend behind the result (see inference.backend_id)
+    status = Column(SQLEnum(ImageStatus), default=ImageStatus.PENDING, nullable=False, index=True)
     error_message = Column(String, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False)
+    # Job queue bookkeeping (see jobs.py)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    worker_id = Column(String, nullable=True)  # Worker currently holding the lease
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(Timestamp, nullable=True)
+    lane = Column(String(16), nullable=True)  # interactive / bulk (None = interactive)
+    queue_key = Column(Float, nullable=True)  # Virtual deadline jobs are claimed by (None = first)
     public_token = Column(String, nullable=True, index=True)  # Secure public access token (unique via index)
     session_id = Column(String, nullable=False, index=True)  # Session ID for privacy - links image to user session
+    batch_id = Column(String(32), nullable=True, index=True)  # Bulk upload the image came from (see Batch)
+    filename = Column(String, nullable=True)  # Name of the uploaded file or archive entry
+    trace_id = Column(String(32), nullable=True)  # Trace of the upload, continued by the worker (see tracing.py)
+    kind = Column(String(16), nullable=True)  # image / video (None = image)
+
+
+class Batch(Base):
+    """A group of images uploaded together (see batches.py)."""
+    __tablename__ = "batches"
+
+    id = Column(String(32), primary_key=True)  # Random public ID
+    session_id = Column(String, nullable=False, index=True)
+    total = Column(Integer, nullable=False)
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False)
+
+
+class Derivative(Base):
+    """Resized and/or re-encoded rendition of a stored blob (see derivatives.py)."""
+    __tablename__ = "derivatives"
+    __table_args__ = (
+        UniqueConstraint("source_key", "variant", "format", name="uq_derivatives_source_variant_format"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    source_key = Column(String(64), nullable=False)  # Blob the derivative was made from
+    variant = Column(String(16), nullable=False)  # thumb / preview / full (see DERIVATIVE_SIZES)
+    format = Column(String(8), nullable=False)  # jpeg / webp / avif
+    key = Column(String(64), nullable=False)  # SHA-256 key in the derivatives blob store
+    mime = Column(String, nullable=False)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False)
+
 
+class VideoSegment(Base):
+    """
+    An encoded run of frames of a video job (see video.py).
+
+    A job that is interrupted resumes after its last stored segment.
+    """
+    __tablename__ = "video_segments"
+    __table_args__ = (
+        UniqueConstraint("image_id", "index", name="uq_video_segments_image_index"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    image_id = Column(Integer, nullable=False, index=True)
+    index = Column(Integer, nullable=False)  # 0-based position in the video
+    start_frame = Column(Integer, nullable=False)
+    frames = Column(Integer, nullable=False)
+    key = Column(String(64), nullable=False)  # SHA-256 key in the segments blob store
+    state_key = Column(String(64), nullable=False)  # Chroma smoothing state after the last frame
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False)
+
+
+class WorkerNode(Base):
+    """A worker advertising its capacity and models (see nodes.py)."""
+    __tablename__ = "worker_nodes"
+
+    id = Column(String, primary_key=True)  # Worker ID recorded on the jobs it claims
+    hostname = Column(String, nullable=False)
+    capacity = Column(Integer, nullable=False)  # Jobs it runs at once (JOB_CONCURRENCY)
+    in_flight = Column(Integer, nullable=False, default=0, server_default="0")
+    models = Column(JSON, nullable=False)  # Models it claims jobs for (WORKER_MODELS)
+    loaded = Column(JSON, nullable=True)  # Models currently loaded in memory
+    ready = Column(Boolean, nullable=False, default=False)
+    started_at = Column(Timestamp, server_default=func.now(), nullable=False)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class Profile(Base):
+    """An on-demand profiling request and its artifact (see profiling.py)."""
+    __tablename__ = "profiles"
+
+    id = Column(String(32), primary_key=True)  # Random public ID
+    mode = Column(String(16), nullable=False)  # cprofile / pyinstrument / torch
+    target = Column(String(16), nullable=False)  # jobs (a worker) / requests (the API process)
+    jobs = Column(Integer, nullable=False)  # Number of jobs or requests to profile
+    profiled = Column(Integer, nullable=False, default=0, server_default="0")
+    status = Column(String(16), nullable=False, default="pending", server_default="pending", index=True)
+    worker_id = Column(String, nullable=True)  # Requested worker, then the process that took it
+    artifact_key = Column(String(64), nullable=True)  # SHA-256 key in the profiles blob store
+    artifact_mime = Column(String, nullable=True)
+    error_message = Column(String, nullable=True)
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False)
+    finished_at = Column(Timestamp, nullable=True)
@@ -0,0 +1,106 @@
+"""
+Registry of the worker nodes sharing the job queue.
+
+Workers pull jobs from the database (see jobs.py), so any number of them can
+run on any number of hosts next to a single API tier. They cannot be reached
+from the API directly; instead every worker upserts a ``worker_nodes`` row
+with its capacity, the models it claims jobs for and the models it has
+loaded, refreshed with its periodic statistics. A node whose row was not
+refreshed for ``NODE_TIMEOUT_SECONDS`` is considered gone; its jobs come back
+through the lease expiry of the queue, and its row is pruned by the next
+node that reports.
+"""
+import socket
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from .config import NODE_TIMEOUT_SECONDS
+from .jobs import as_utc, utcnow
+from .models import WorkerNode
+
+
+def advertise(
+    db: Session,
+    worker_id: str,
+    capacity: int,
+    in_flight: int,
+    models: list[str],
+    loaded: Optional[list[str]],
+    ready: bool,
+) -> None:
+    """
+    Record (or refresh) the state of a worker and prune silent nodes.
+
+    Args:
+        worker_id: ID the worker records on the jobs it claims
+        capacity: Jobs the worker runs at once
+        in_flight: Jobs it is running now
+        models: Models it claims jobs for
+        loaded: Models loaded in memory (None before the registry exists)
+        ready: Whether its model is loaded and warmed up
+    """
+    now = utcnow()
+    node = db.get(WorkerNode, worker_id)
+    if node is None:
+        node = WorkerNode(id=worker_id, hostname=socket.gethostname())
+        db.add(node)
+    node.capacity = capacity
+    node.in_flight = in_flight
+    node.models = list(models)
+    node.loaded = list(loaded) if loaded is not None else None
+    node.ready = ready
+    node.heartbeat_at = now
+    db.query(WorkerNode).filter(
+        WorkerNode.id != worker_id,
+        WorkerNode.heartbeat_at < now - timedelta(seconds=NODE_TIMEOUT_SECONDS),
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def withdraw(db: Session, worker_id: str) -> None:
+    """Remove the row of a worker that shuts down."""
+    db.query(WorkerNode).filter(WorkerNode.id == worker_id).delete(synchronize_session=False)
+    db.commit()
+
+
+def live_nodes(db: Session) -> list[dict]:
+    """
+    Nodes that reported within ``NODE_TIMEOUT_SECONDS``.
+
+    Returns:
+        One entry per node, ordered by ID
+    """
+    now = utcnow()
+    nodes = (
+        db.query(WorkerNode)
+        .filter(WorkerNode.heartbeat_at >= now - timedelta(seconds=NODE_TIMEOUT_SECONDS))
+        .order_by(WorkerNode.id)
+        .all()
+    )
+    return [
+        {
+            "id": node.id,
+            "hostname": node.hostname,
+            "ready": node.ready,
+            "capacity": node.capacity,
+            "inFlight": node.in_flight,
+            "models": node.models,
+            "loaded": node.loaded,
+            "lastSeenSeconds": round((now - as_utc(node.heartbeat_at)).total_seconds(), 1),
+        }
+        for node in nodes
+    ]
+
+
+def cluster_summary(nodes: list[dict]) -> dict:
+    """Totals over live nodes: how many are ready, job slots, and models served."""
+    ready = [node for node in nodes if node["ready"]]
+    return {
+        "nodes": len(nodes),
+        "ready": len(ready),
+        "capacity": sum(node["capacity"] for node in ready),
+        "inFlight": sum(node["inFlight"] for node in nodes),
+        "models": sorted({model for node in ready for model in node["models"]}),
+    }
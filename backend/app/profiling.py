@@ -0,0 +1,279 @@
+"""
+On-demand profiling of live workers and of the API process.
+
+An admin asks for the next N jobs (or API requests) to be profiled with one
+of ``PROFILE_MODES``:
+
+- ``cprofile``: deterministic profile of every Python call (pstats file,
+  open with ``python -m pstats`` or snakeviz);
+- ``pyinstrument``: sampling profiler with low overhead (HTML report;
+  optional dependency);
+- ``torch``: torch.profiler around the generator's forward passes only
+  (Chrome trace JSON with operator and CUDA kernel timings).
+
+Requests are rows of the ``profiles`` table: workers cannot be reached from
+the API directly, so each worker polls the table and claims a pending
+request for itself. The profiled job's thread and the batch scheduler's
+forward pass both record into the worker's session, which is rendered and
+stored in the profiles blob store once N jobs are done.
+"""
+import cProfile
+import importlib.util
+import json
+import logging
+import os
+import pstats
+import tempfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "pyinstrument", "torch")
+PROFILE_TARGETS = ("jobs", "requests")
+
+# Artifact file extension per mode
+ARTIFACT_SUFFIX = {"cprofile": ".prof", "pyinstrument": ".html", "torch": ".json"}
+
+# Session the current job or batch records into (None: not profiled)
+current_profile: ContextVar[Optional["ProfileSession"]] = ContextVar("current_profile", default=None)
+
+
+def available_modes() -> tuple[str, ...]:
+    """Profiling modes usable in this environment."""
+    modes = ["cprofile"]
+    if importlib.util.find_spec("pyinstrument") is not None:
+        modes.append("pyinstrument")
+    if importlib.util.find_spec("torch") is not None:
+        modes.append("torch")
+    return tuple(modes)
+
+
+class ProfileSession:
+    """Collects profiles of up to ``limit`` jobs and renders them into one artifact."""
+
+    def __init__(self, profile_id: str, mode: str, limit: int):
+        """
+        Args:
+            profile_id: ID of the profiles row
+            mode: One of PROFILE_MODES
+            limit: Number of jobs (or requests) to profile
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.profile_id = profile_id
+        self.mode = mode
+        self.limit = max(1, limit)
+        self.claimed = 0
+        self.done = 0
+        self._active = 0
+        self._open = 0
+        self._cond = threading.Condition()
+        self._stats: Optional[pstats.Stats] = None
+        self._sessions: list = []
+        self._events: list[dict] = []
+
+    def claim(self, exclusive: bool = False) -> bool:
+        """
+        Reserve a slot for one job.
+
+        Args:
+            exclusive: Only if no other claimed job is still running (profilers
+                hooked into one thread, e.g. the event loop, cannot overlap)
+
+        Returns:
+            False if the session is full; the job then runs unprofiled
+        """
+        with self._cond:
+            if self.claimed >= self.limit or (exclusive and self._active):
+                return False
+            self.claimed += 1
+            self._active += 1
+            return True
+
+    def job_done(self) -> bool:
+        """Release a claimed slot. Returns True once all ``limit`` jobs are done."""
+        with self._cond:
+            self._active -= 1
+            self.done += 1
+            return self.done >= self.limit
+
+    @contextmanager
+    def section(self) -> Iterator[None]:
+        """Profile the enclosed block on the current thread (not in torch mode)."""
+        if self.mode == "torch":
+            yield
+            return
+        with self._cond:
+            self._open += 1
+        try:
+            if self.mode == "cprofile":
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    yield
+                finally:
+                    profiler.disable()
+                    with self._cond:
+                        if self._stats is None:
+                            self._stats = pstats.Stats(profiler)
+                        else:
+                            self._stats.add(profiler)
+            else:
+                from pyinstrument import Profiler
+
+                profiler = Profiler(async_mode="disabled")
+                profiler.start()
+                try:
+                    yield
+                finally:
+                    session = profiler.stop()
+                    with self._cond:
+                        self._sessions.append(session)
+        finally:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def torch_section(self) -> Iterator[None]:
+        """Run torch.profiler around the enclosed forward pass."""
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        with self._cond:
+            self._open += 1
+        try:
+            with profile(activities=activities, record_shapes=True) as prof:
+                yield
+            fd, path = tempfile.mkstemp(suffix=".json")
+            os.close(fd)
+            try:
+                prof.export_chrome_trace(path)
+                with open(path) as f:
+                    events = json.load(f).get("traceEvents", [])
+            finally:
+                os.unlink(path)
+            with self._cond:
+                self._events.extend(events)
+        finally:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify_all()
+
+    def render(self, timeout: float = 30.0) -> tuple[bytes, str]:
+        """
+        Render everything recorded so far.
+
+        Waits up to ``timeout`` for sections still running on other threads
+        (the batch of the last job may still be finishing).
+
+        Returns:
+            (artifact bytes, MIME type)
+
+        Raises:
+            RuntimeError: Nothing was recorded
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._open == 0, timeout)
+            if self.mode == "cprofile":
+                if self._stats is None:
+                    raise RuntimeError("No profile was recorded")
+                fd, path = tempfile.mkstemp(suffix=".prof")
+                os.close(fd)
+                try:
+                    self._stats.dump_stats(path)
+                    with open(path, "rb") as f:
+                        return f.read(), "application/octet-stream"
+                finally:
+                    os.unlink(path)
+            if self.mode == "pyinstrument":
+                if not self._sessions:
+                    raise RuntimeError("No profile was recorded")
+                from pyinstrument.renderers import HTMLRenderer
+                from pyinstrument.session import Session as PyinstrumentSession
+
+                combined = self._sessions[0]
+                for session in self._sessions[1:]:
+                    combined = PyinstrumentSession.combine(combined, session)
+                return HTMLRenderer().render(combined).encode(), "text/html"
+            if not self._events:
+                raise RuntimeError("No forward pass was recorded")
+            return json.dumps({"traceEvents": self._events}).encode(), "application/json"
+
+
+@contextmanager
+def torch_section() -> Iterator[None]:
+    """Profile a forward pass if the current batch belongs to a torch-mode session."""
+    session = current_profile.get()
+    if session is None or session.mode != "torch":
+        yield
+        return
+    with session.torch_section():
+        yield
+
+
+def claim_profile(db: Session, worker_id: str, target: str = "jobs") -> Optional[ProfileSession]:
+    """
+    Take the oldest pending profiling request addressed to this process (or to any).
+
+    Returns:
+        The session to record into, or None if there is nothing to do
+    """
+    from .models import Profile
+
+    pending = (
+        db.query(Profile)
+        .filter(
+            Profile.status == "pending",
+            Profile.target == target,
+            or_(Profile.worker_id.is_(None), Profile.worker_id == worker_id),
+        )
+        .order_by(Profile.created_at)
+        .first()
+    )
+    if pending is None:
+        db.rollback()
+        return None
+    profile_id, mode, jobs = pending.id, pending.mode, pending.jobs
+    # Conditional update: another worker may have taken it in the meantime
+    taken = (
+        db.query(Profile)
+        .filter(Profile.id == profile_id, Profile.status == "pending")
+        .update({"status": "running", "worker_id": worker_id}, synchronize_session=False)
+    )
+    db.commit()
+    if not taken:
+        return None
+    logger.info(f"Profiling the next {jobs} {target} with {mode} ({profile_id[:8]}...)")
+    return ProfileSession(profile_id, mode, jobs)
+
+
+def store_artifact(db: Session, session: ProfileSession) -> None:
+    """Render a finished session into the profiles blob store and complete its row."""
+    from .models import Profile
+    from .storage import PROFILES_BUCKET, get_blob_store
+
+    values = {"profiled": session.done, "finished_at": datetime.now(timezone.utc)}
+    try:
+        data, mime = session.render()
+        values.update(
+            status="completed",
+            artifact_key=get_blob_store(PROFILES_BUCKET).put(data),
+            artifact_mime=mime,
+        )
+        logger.info(f"Profile {session.profile_id[:8]}... stored ({len(data)} bytes)")
+    except Exception as e:
+        logger.warning(f"Profile {session.profile_id[:8]}... failed: {e}")
+        values.update(status="failed", error_message=str(e))
+    db.query(Profile).filter(Profile.id == session.profile_id).update(values, synchronize_session=False)
+    db.commit()
@@ -0,0 +1,206 @@
+"""
+Registry of colorization models.
+
+Uploads pick a model by name (see ``MODELS`` in config.py). Generators are
+loaded on first use and shared by every name that resolves to the same
+weights, generator type and device. Loaded generators are kept in an LRU
+bounded by a memory budget: loading one that does not fit unloads the least
+recently used ones first. The most recently used generator is never
+evicted, even if it alone exceeds the budget.
+"""
+import importlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from .config import COLORIZER_FACTORY, DEFAULT_MODEL, MODEL_DEVICE, MODEL_MEMORY_BUDGET_MB, MODELS
+
+logger = logging.getLogger(__name__)
+
+# (weights path, artistic, device)
+ModelKey = tuple[str, bool, Optional[str]]
+
+
+def is_artistic(model_path: str) -> bool:
+    """Whether weights are for DeOldify's artistic generator (judged by file name)."""
+    return "artistic" in os.path.basename(model_path).lower()
+
+
+def _load_colorizer(model_path: str, artistic: bool, device: Optional[str], render_factor: int):
+    from .colorizer import ImageColorizer
+    return ImageColorizer(model_path, render_factor, artistic=artistic, device=device)
+
+
+def import_factory(spec: str) -> Callable:
+    """
+    Resolve a "module:callable" colorizer factory.
+
+    Raises:
+        ValueError: Malformed spec
+        ImportError, AttributeError: The callable does not exist
+    """
+    module_name, sep, attribute = spec.partition(":")
+    if not sep or not attribute:
+        raise ValueError(f"Colorizer factory must look like 'module:callable', got {spec!r}")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class ModelRegistry:
+    """Loads colorizers on demand and keeps them within a memory budget."""
+
+    def __init__(
+        self,
+        models: dict[str, str],
+        default: str,
+        budget_bytes: int,
+        device: Optional[str] = None,
+        render_factor: int = 35,
+        loader: Callable = _load_colorizer,
+    ):
+        """
+        Initialize the registry (nothing is loaded yet).
+
+        Args:
+            models: Model name -> weights path
+            default: Name used when an upload does not choose a model
+            budget_bytes: Memory budget for loaded generators
+            device: "cuda" or "cpu", None to pick automatically
+            render_factor: Default rendering factor of every model
+            loader: Callable (path, artistic, device, render_factor) returning a
+                colorizer (see COLORIZER_FACTORY)
+        """
+        if default not in models:
+            raise ValueError(f"Default model {default!r} is not one of: {', '.join(models)}")
+        self.models = dict(models)
+        self.default = default
+        self.budget = budget_bytes
+        self.device = device
+        self.render_factor = render_factor
+        self._loader = loader
+        self._loaded: OrderedDict[ModelKey, tuple[object, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"loads": 0, "evictions": 0, "hits": 0}
+
+    def resolve(self, name: Optional[str] = None) -> str:
+        """
+        Normalize a model name (None selects the default).
+
+        Raises:
+            KeyError: Unknown model
+        """
+        name = name or self.default
+        if name not in self.models:
+            raise KeyError(f"Unknown model: {name}")
+        return name
+
+    def weights(self, name: Optional[str] = None) -> str:
+        """Weights path of a model (for cache keys; does not load anything)."""
+        return self.models[self.resolve(name)]
+
+    def key_for(self, name: Optional[str] = None) -> ModelKey:
+        """Identity of the generator a model name resolves to."""
+        path = self.weights(name)
+        return (os.path.abspath(path), is_artistic(path), self.device)
+
+    def get(self, name: Optional[str] = None):
+        """
+        Return the colorizer of a model, loading it if necessary.
+
+        Raises:
+            KeyError: Unknown model
+            Exception: Whatever loading the weights raised
+        """
+        key = self.key_for(name)
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                self._counters["hits"] += 1
+                return self._loaded[key][0]
+
+            # Make room for the new generator before loading it, so two large
+            # models never coexist when the budget only fits one
+            path, artistic, device = key
+            self._evict(self._estimate(path))
+            logger.info(f"Loading model {name or self.default} ({os.path.basename(path)}, artistic={artistic})")
+            colorizer = self._loader(path, artistic, device, self.render_factor)
+            size = self._measure(colorizer, path)
+            self._loaded[key] = (colorizer, size)
+            self._counters["loads"] += 1
+            self._evict(0)
+            return colorizer
+
+    def loaded(self) -> list[str]:
+        """Names of the models whose generator is currently loaded."""
+        with self._lock:
+            keys = set(self._loaded)
+        return [name for name in self.models if self.key_for(name) in keys]
+
+    def stats(self) -> dict:
+        """Return load/eviction counters and memory use."""
+        with self._lock:
+            used = sum(size for _, size in self._loaded.values())
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "loaded": self.loaded(),
+            "memoryBytes": used,
+            "budgetBytes": self.budget,
+        }
+
+    @staticmethod
+    def _estimate(path: str) -> int:
+        """Expected memory of a generator before it is loaded (its weights file size)."""
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _measure(self, colorizer, path: str) -> int:
+        """Memory of a loaded generator, as reported by the colorizer if it can."""
+        memory_bytes = getattr(colorizer, "memory_bytes", None)
+        if memory_bytes is not None:
+            try:
+                return int(memory_bytes())
+            except Exception as e:
+                logger.debug(f"Could not measure model memory: {e}")
+        return self._estimate(path)
+
+    def _evict(self, incoming: int) -> None:
+        """Unload least recently used generators until ``incoming`` more bytes fit."""
+        used = sum(size for _, size in self._loaded.values())
+        # With incoming == 0 the newest entry was just added and must stay
+        keep = 0 if incoming else 1
+        while len(self._loaded) > keep and used + incoming > self.budget:
+            key, (colorizer, size) = self._loaded.popitem(last=False)
+            used -= size
+            self._counters["evictions"] += 1
+            logger.info(f"Unloading model {os.path.basename(key[0])} ({size / 2**20:.0f} MB)")
+            release = getattr(colorizer, "release", None)
+            if release is not None:
+                release()
+
+
+# Global registry instance (lazy initialization)
+_registry_instance: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Get or create the global model registry."""
+    global _registry_instance
+    with _registry_lock:
+        if _registry_instance is None:
+            loader = import_factory(COLORIZER_FACTORY) if COLORIZER_FACTORY else _load_colorizer
+            _registry_instance = ModelRegistry(
+                MODELS, DEFAULT_MODEL, MODEL_MEMORY_BUDGET_MB * 1024 * 1024, MODEL_DEVICE, loader=loader
+            )
+    return _registry_instance
+
+
+def get_registry_stats() -> Optional[dict]:
+    """Return registry statistics, or None if it has not been created."""
+    if _registry_instance is None:
+        return None
+    return _registry_instance.stats()
@@ -24,3 +24,10 @@ class ImageListResponse(BaseModel):
     """List of images response schema."""
     images: list[ImageResponse]
 
+
+class ProfileRequest(BaseModel):
+    """Request to profile the next jobs or API requests."""
+    mode: str = "cprofile"
+    target: str = "jobs"
+    jobs: int = 10
+    worker: Optional[str] = None
@@ -0,0 +1,315 @@
+"""
+Reuse of earlier colorizations for near-duplicate images.
+
+The same photograph often comes back rescanned, resized or recompressed, so
+its SHA-256 (and the result cache keyed by it) differs while the picture does
+not. Each image job is fingerprinted with a 64-bit perceptual hash (pHash:
+the signs of the lowest frequencies of the DCT of a 32x32 grayscale copy),
+which survives such changes with only a few flipped bits.
+
+Workers keep an in-memory BK-tree of the hashes of completed images, filled
+incrementally from the database, and look up every new image within
+``SIMILAR_MAX_DISTANCE`` bits. When an earlier result with the same model,
+inference backend, render_factor and aspect ratio is found, its chroma is
+transferred onto the new image's luminance (see chroma.py) instead of
+running the model.
+
+Reuse is off unless SIMILAR_MAX_DISTANCE is set: a close enough hash is not
+proof of the same photograph, so deployments opt in knowingly.
+"""
+import io
+import logging
+import threading
+from datetime import timedelta
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+from PIL import Image as PILImage
+from sqlalchemy.orm import Session
+
+from .config import CHROMA_STRIP_ROWS, DEFAULT_MODEL, SIMILAR_MAX_DISTANCE
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_HASH_SIDE = 8  # Lowest frequencies kept per axis (8 x 8 = 64 bits)
+_DCT_SIDE = 32  # Side of the grayscale copy the DCT runs on
+
+# Images whose low frequencies are this flat (e.g. blank pages) are not
+# hashed: any noise would decide their bits, so they would match each other
+_MIN_SPREAD = 0.5
+
+# Largest relative difference of aspect ratios between a match and the image
+_ASPECT_TOLERANCE = 0.02
+
+# Chroma is smooth; reused colours are taken from a copy this large
+_CHROMA_SIDE = 512
+
+# Rows finished shortly before the last refresh are read again, so commits
+# that land out of timestamp order are not missed
+_REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+@lru_cache(maxsize=None)
+def _dct_matrix(size: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix; ``M @ x`` transforms the columns of x."""
+    k = np.arange(size, dtype=np.float64)[:, None]
+    n = np.arange(size, dtype=np.float64)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+def perceptual_hash(source: bytes) -> Optional[str]:
+    """
+    Compute the pHash of an encoded image.
+
+    JPEG input is decoded in draft mode at a reduced scale, so hashing costs
+    a fraction of a full decode.
+
+    Returns:
+        16 hex digits, or None for featureless images
+    """
+    image = PILImage.open(io.BytesIO(source))
+    image.draft("L", (_DCT_SIDE * 2, _DCT_SIDE * 2))
+    gray = image.convert("L").resize((_DCT_SIDE, _DCT_SIDE), PILImage.Resampling.BOX)
+    dct = _dct_matrix(_DCT_SIDE)
+    coefficients = dct @ np.asarray(gray, dtype=np.float32) @ dct.T
+    low = coefficients[:_HASH_SIDE, :_HASH_SIDE].ravel()
+    # The DC term only encodes brightness and is left out of the threshold
+    ac = low[1:]
+    if ac.std() < _MIN_SPREAD:
+        return None
+    bits = low > np.median(ac)
+    return np.packbits(bits).tobytes().hex()
+
+
+def hamming_distance(a: str, b: str) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of hashes under the Hamming distance.
+
+    Every child edge is labelled with the distance of the child to its
+    parent, so by the triangle inequality a search within ``d`` of a query
+    only descends into edges labelled within ``d`` of the query's distance to
+    the node. Hashes are kept as integers; each node carries the items that
+    share its hash.
+    """
+
+    def __init__(self):
+        self._root: Optional[list] = None  # [hash, items, {distance: child}]
+        self.size = 0
+
+    def add(self, value: int, item) -> None:
+        """Insert an item under its hash."""
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = bin(node[0] ^ value).count("1")
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, object]]:
+        """
+        Items whose hash is within ``max_distance`` bits of ``value``.
+
+        Returns:
+            (distance, item) pairs, nearest first
+        """
+        found = []
+        pending = [self._root] if self._root is not None else []
+        while pending:
+            node = pending.pop()
+            distance = bin(node[0] ^ value).count("1")
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    pending.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+class SimilarIndex:
+    """Per-process index of the perceptual hashes of completed images."""
+
+    def __init__(self, max_distance: int = SIMILAR_MAX_DISTANCE):
+        """
+        Args:
+            max_distance: Largest Hamming distance of a match (negative = off)
+        """
+        self.max_distance = max_distance
+        self._tree = BKTree()
+        self._indexed: set[int] = set()
+        self._watermark = None  # Latest finished_at read from the database
+        self._lock = threading.Lock()
+        self._counters = {"hit": 0, "miss": 0, "unhashable": 0}
+
+    @property
+    def enabled(self) -> bool:
+        """Whether near-duplicates are looked up at all."""
+        return self.max_distance >= 0
+
+    def refresh(self, db: Session) -> int:
+        """
+        Add the images completed since the last refresh.
+
+        Returns:
+            Number of images added
+        """
+        from .models import Image, ImageStatus
+
+        with self._lock:
+            query = db.query(Image.id, Image.phash, Image.finished_at).filter(
+                Image.status == ImageStatus.COMPLETED, Image.phash.isnot(None)
+            )
+            if self._watermark is not None:
+                query = query.filter(Image.finished_at >= self._watermark - _REFRESH_OVERLAP)
+            added = 0
+            for image_id, phash, finished_at in query.yield_per(1000):
+                if finished_at is not None and (self._watermark is None or finished_at > self._watermark):
+                    self._watermark = finished_at
+                if image_id in self._indexed:
+                    continue
+                self._indexed.add(image_id)
+                self._tree.add(int(phash, 16), image_id)
+                added += 1
+            return added
+
+    def find(
+        self,
+        db: Session,
+        phash: str,
+        model: Optional[str],
+        backend: str,
+        render_factor: int,
+        default_render_factor: int,
+        aspect: float,
+    ) -> Optional[tuple[int, str, int]]:
+        """
+        Find the nearest completed image that can lend its colours.
+
+        Args:
+            phash: Hash of the new image
+            model: Model of the new job (None = DEFAULT_MODEL)
+            backend: Inference backend of this node (see inference.backend_id)
+            render_factor: Render factor of the new job
+            default_render_factor: Render factor of jobs that did not set one
+            aspect: Width / height of the new image
+
+        Returns:
+            (image ID, colorized key, distance), or None
+        """
+        from .models import Image, ImageStatus
+
+        self.refresh(db)
+        with self._lock:
+            candidates = self._tree.search(int(phash, 16), self.max_distance)
+        distances = {image_id: distance for distance, image_id in reversed(candidates)}
+        rows = []
+        if distances:
+            rows = db.query(
+                Image.id, Image.colorized_key, Image.model, Image.inference_backend,
+                Image.render_factor, Image.width, Image.height,
+            ).filter(
+                Image.id.in_(list(distances)),
+                Image.status == ImageStatus.COMPLETED,
+                Image.colorized_key.isnot(None),
+            ).all()
+
+        matches = [
+            (distances[row.id], -row.id, row.colorized_key)
+            for row in rows
+            if (row.model or DEFAULT_MODEL) == (model or DEFAULT_MODEL)
+            and row.inference_backend == backend
+            and (row.render_factor or default_render_factor) == render_factor
+            and row.width and row.height
+            and abs(row.width / row.height / aspect - 1) <= _ASPECT_TOLERANCE
+        ]
+        if not matches:
+            self.record("miss")
+            return None
+        distance, image_id, colorized_key = min(matches)
+        self.record("hit", distance)
+        return -image_id, colorized_key, distance
+
+    def record(self, result: str, distance: Optional[int] = None) -> None:
+        """Count a lookup: hit, miss or unhashable."""
+        with self._lock:
+            self._counters[result] += 1
+        metrics.inc("colorizer_similar_total", result=result)
+        if distance is not None:
+            metrics.observe("colorizer_similar_distance", distance)
+
+    def stats(self) -> dict:
+        """Threshold, index size and hit rate."""
+        with self._lock:
+            hits, misses = self._counters["hit"], self._counters["miss"]
+            return {
+                "maxDistance": self.max_distance,
+                "entries": self._tree.size,
+                "hits": hits,
+                "misses": misses,
+                "unhashable": self._counters["unhashable"],
+                "hitRate": hits / (hits + misses) if hits + misses else 0.0,
+            }
+
+
+def reuse_colors(source: bytes, colorized: bytes, quality: int = 95) -> bytes:
+    """
+    Colour an image with the chroma of an earlier colorization.
+
+    The luminance (and thus every detail) is the new image's own; only the
+    chroma planes are taken from the earlier result, which may differ in
+    size, compression and small shifts.
+
+    Args:
+        source: Encoded new image
+        colorized: Encoded colorized result of a near-duplicate
+
+    Returns:
+        Encoded JPEG bytes
+    """
+    from .chroma import rgb_to_chroma, transfer_chroma
+
+    original = PILImage.open(io.BytesIO(source))
+    original.draft("L", original.size)
+    luma = np.asarray(original.convert("L"))
+
+    colors = PILImage.open(io.BytesIO(colorized))
+    colors.draft("RGB", (_CHROMA_SIDE, _CHROMA_SIDE))
+    colors = colors.convert("RGB")
+    colors.thumbnail((_CHROMA_SIDE, _CHROMA_SIDE), PILImage.Resampling.BOX)
+    rgb = transfer_chroma(luma, rgb_to_chroma(np.asarray(colors)), CHROMA_STRIP_ROWS)
+
+    output = io.BytesIO()
+    PILImage.fromarray(rgb).save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+# Global index instance (lazy initialization)
+_index_instance: Optional[SimilarIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_similar_index() -> SimilarIndex:
+    """Get or create the index of this process."""
+    global _index_instance
+    with _index_lock:
+        if _index_instance is None:
+            _index_instance = SimilarIndex()
+    return _index_instance
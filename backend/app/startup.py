@@ -0,0 +1,49 @@
+"""
+Startup phase timing.
+
+The API process and every worker log how long each startup phase took
+(imports, database, model load, warm-up, ...), and expose the breakdown on
+``/readyz``, so cold-start regressions show up in logs and probes.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Records the duration of named startup phases."""
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Component being started, used in the log line
+        """
+        self.name = name
+        self.phases: dict[str, float] = {}
+
+    def record(self, phase: str, seconds: float) -> None:
+        """Record a phase measured elsewhere."""
+        self.phases[phase] = seconds
+
+    @contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        """Time the enclosed block as ``phase`` (recorded even if it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - started)
+
+    def summary(self) -> dict:
+        """Phase durations in seconds, plus their total."""
+        summary = {phase: round(seconds, 3) for phase, seconds in self.phases.items()}
+        summary["total"] = round(sum(self.phases.values()), 3)
+        return summary
+
+    def log(self) -> None:
+        """Log the breakdown on one line."""
+        breakdown = ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in self.phases.items())
+        logger.info(f"{self.name} startup: {breakdown}, total={sum(self.phases.values()):.2f}s")
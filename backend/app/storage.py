@@ -0,0 +1,431 @@
+"""
+Content-addressed blob storage for original and colorized images.
+
+Files are stored under their SHA-256 digest in sharded directories
+(``ab/cd/abcd...``) so no single directory grows unbounded. Writes go to a
+temporary file in the same filesystem and are moved into place with
+``os.replace``, so readers never observe a partially written blob.
+"""
+import base64
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from .config import UPLOADS_DIR, PROCESSED_DIR, DERIVATIVES_DIR, PROFILES_DIR, SEGMENTS_DIR, BLOB_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Magic byte signatures used to recover a MIME type from stored bytes
+_MAGIC_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+)
+
+
+def sniff_mime(header: bytes, default: str = "application/octet-stream") -> str:
+    """
+    Guess the MIME type of a file from its first bytes.
+
+    Args:
+        header: Leading bytes of the file (16 bytes is enough)
+        default: Value returned when no signature matches
+
+    Returns:
+        MIME type string
+    """
+    for signature, mime in _MAGIC_SIGNATURES:
+        if header.startswith(signature):
+            return mime
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:8] == b"ftyp" and header[8:12] in (b"avif", b"avis"):
+        return "image/avif"
+    if header[4:8] == b"ftyp":
+        return "video/quicktime" if header[8:12] == b"qt  " else "video/mp4"
+    if header.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    return default
+
+
+def read_image_size(data: bytes) -> tuple[Optional[int], Optional[int]]:
+    """Read image dimensions from the header, or (None, None) if unreadable."""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as header:
+            return header.size
+    except Exception:
+        return None, None
+
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a single-range HTTP ``Range`` header.
+
+    Multi-range requests are treated as absent, which RFC 7233 allows, so the
+    caller falls back to sending the whole file.
+
+    Args:
+        header: Value of the Range header (may be None)
+        size: Total size of the resource in bytes
+
+    Returns:
+        Inclusive (start, end) byte offsets, or None to serve the full body
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_str, _, end_str = header[len("bytes="):].strip().partition("-")
+    if not (start_str + end_str).isdigit():
+        # Malformed ranges are ignored rather than rejected
+        return None
+    if not start_str:
+        # Suffix range: the last N bytes
+        length = int(end_str)
+        if length == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - length, 0), size - 1
+    start = int(start_str)
+    end = int(end_str) if end_str else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def is_valid_key(key: str) -> bool:
+    """Check that a key looks like a SHA-256 hex digest."""
+    return bool(_KEY_RE.match(key))
+
+
+class BlobWriter:
+    """
+    A blob written chunk by chunk, for content that arrives as a stream.
+
+    The content is hashed while it is written to a temporary file, so its
+    key is only known once ``commit`` moves it into place. Used as a context
+    manager, a writer that was not committed is aborted on exit.
+    """
+
+    def __init__(self, store: "BlobStore"):
+        self._store = store
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self._finished = False
+        fd, self._tmp_name = tempfile.mkstemp(dir=store._tmp_dir)
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        """Append a chunk of content."""
+        self._digest.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def content_path(self) -> str:
+        """Temporary file holding the content written so far (flushed, for reading back)."""
+        self._file.flush()
+        return self._tmp_name
+
+    def commit(self) -> str:
+        """
+        Finish the blob and move it into place.
+
+        Returns:
+            SHA-256 hex digest identifying the blob
+        """
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            key = self._digest.hexdigest()
+            target = self._store.path_for(key)
+            if target.exists():
+                os.unlink(self._tmp_name)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(self._tmp_name, target)
+        except Exception:
+            self.abort()
+            raise
+        self._finished = True
+        return key
+
+    def abort(self) -> None:
+        """Discard the content written so far."""
+        self._finished = True
+        self._file.close()
+        if os.path.exists(self._tmp_name):
+            os.unlink(self._tmp_name)
+
+    def __enter__(self) -> "BlobWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if not self._finished:
+            self.abort()
+
+
+class BlobStore:
+    """Content-addressed file store rooted at a directory."""
+
+    def __init__(self, root: Path, shard_levels: int = 2, shard_width: int = 2):
+        """
+        Initialize the store.
+
+        Args:
+            root: Directory that holds the blobs
+            shard_levels: Number of nested shard directories
+            shard_width: Hex characters of the digest used per shard level
+        """
+        self.root = Path(root)
+        self.shard_levels = shard_levels
+        self.shard_width = shard_width
+        self._tmp_dir = self.root / ".tmp"
+        self._tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key: str) -> Path:
+        """Return the on-disk path of a blob (whether or not it exists)."""
+        if not is_valid_key(key):
+            raise ValueError(f"Invalid blob key: {key!r}")
+        parts = [
+            key[i * self.shard_width:(i + 1) * self.shard_width]
+            for i in range(self.shard_levels)
+        ]
+        return self.root.joinpath(*parts, key)
+
+    def exists(self, key: str) -> bool:
+        """Check whether a blob is stored."""
+        return self.path_for(key).is_file()
+
+    def size(self, key: str) -> int:
+        """Return the size of a stored blob in bytes."""
+        return self.path_for(key).stat().st_size
+
+    def put(self, data: bytes) -> str:
+        """
+        Store bytes and return their key.
+
+        Storing the same content twice is a no-op and returns the same key.
+
+        Args:
+            data: Raw file content
+
+        Returns:
+            SHA-256 hex digest identifying the blob
+        """
+        key = hashlib.sha256(data).hexdigest()
+        target = self.path_for(key)
+        if target.exists():
+            return key
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self._tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_name, target)
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+        return key
+
+    def put_stream(
+        self,
+        stream: BinaryIO,
+        max_bytes: Optional[int] = None,
+        chunk_size: int = BLOB_CHUNK_SIZE,
+    ) -> str:
+        """
+        Store the content of a file object without reading it into memory.
+
+        The content is hashed while it is copied to a temporary file.
+
+        Args:
+            stream: Readable binary file object (read until EOF)
+            max_bytes: Reject content larger than this
+            chunk_size: Size of the reads
+
+        Returns:
+            SHA-256 hex digest identifying the blob
+
+        Raises:
+            ValueError: The content exceeds ``max_bytes``
+        """
+        with self.writer() as writer:
+            while chunk := stream.read(chunk_size):
+                if max_bytes is not None and writer.size + len(chunk) > max_bytes:
+                    raise ValueError(f"Content exceeds {max_bytes} bytes")
+                writer.write(chunk)
+            return writer.commit()
+
+    def writer(self) -> "BlobWriter":
+        """Start a blob whose content is written incrementally (see BlobWriter)."""
+        return BlobWriter(self)
+
+    def get(self, key: str) -> bytes:
+        """Read a whole blob into memory."""
+        return self.path_for(key).read_bytes()
+
+    def iter_range(
+        self,
+        key: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_size: int = BLOB_CHUNK_SIZE,
+    ) -> Iterator[bytes]:
+        """
+        Stream a byte range of a blob.
+
+        Args:
+            key: Blob key
+            start: First byte offset (inclusive)
+            end: Last byte offset (inclusive). Defaults to the end of the blob.
+            chunk_size: Size of the yielded chunks
+
+        Yields:
+            Chunks of the requested range
+        """
+        path = self.path_for(key)
+        if end is None:
+            end = path.stat().st_size - 1
+        remaining = end - start + 1
+        with open(path, "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key: str) -> None:
+        """Remove a blob if it exists."""
+        try:
+            self.path_for(key).unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Buckets (the download endpoint only serves uploads and processed)
+UPLOADS_BUCKET = "uploads"
+PROCESSED_BUCKET = "processed"
+DERIVATIVES_BUCKET = "derivatives"
+PROFILES_BUCKET = "profiles"
+SEGMENTS_BUCKET = "segments"
+
+_stores: dict[str, BlobStore] = {}
+
+
+def get_blob_store(bucket: str) -> BlobStore:
+    """Get or create the store for a bucket."""
+    if bucket not in _stores:
+        roots = {
+            UPLOADS_BUCKET: UPLOADS_DIR,
+            PROCESSED_BUCKET: PROCESSED_DIR,
+            DERIVATIVES_BUCKET: DERIVATIVES_DIR,
+            PROFILES_BUCKET: PROFILES_DIR,
+            SEGMENTS_BUCKET: SEGMENTS_DIR,
+        }
+        if bucket not in roots:
+            raise KeyError(f"Unknown bucket: {bucket}")
+        _stores[bucket] = BlobStore(roots[bucket])
+    return _stores[bucket]
+
+
+def decode_data_url(data_url: str) -> tuple[bytes, str]:
+    """
+    Decode a ``data:<mime>;base64,<payload>`` URL.
+
+    Returns:
+        Tuple of (raw_bytes, mime_type)
+    """
+    header, payload = data_url.split(",", 1)
+    mime_type = header[len("data:"):].split(";", 1)[0] or "application/octet-stream"
+    return base64.b64decode(payload), mime_type
+
+
+def migrate_data_urls(db, batch_size: int = 50) -> int:
+    """
+    Move legacy base64 data URLs from the ``images`` table into blob storage.
+
+    Rows are processed in batches and committed per batch, so the migration
+    can be interrupted and resumed safely.
+
+    Args:
+        db: SQLAlchemy session
+        batch_size: Rows per transaction
+
+    Returns:
+        Number of migrated rows
+    """
+    from sqlalchemy.orm import undefer
+    from .models import Image
+
+    uploads = get_blob_store(UPLOADS_BUCKET)
+    processed = get_blob_store(PROCESSED_BUCKET)
+    migrated = 0
+    skipped: list[int] = []
+
+    while True:
+        query = db.query(Image).options(
+            undefer(Image.original_url), undefer(Image.colorized_url)
+        ).filter(
+            Image.original_url.like("data:%") | Image.colorized_url.like("data:%")
+        )
+        if skipped:
+            query = query.filter(Image.id.notin_(skipped))
+        rows = query.order_by(Image.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        for image in rows:
+            try:
+                if image.original_url and image.original_url.startswith("data:"):
+                    data, mime_type = decode_data_url(image.original_url)
+                    image.original_key = uploads.put(data)
+                    image.original_mime = mime_type
+                    image.original_url = None
+                if image.colorized_url and image.colorized_url.startswith("data:"):
+                    data, mime_type = decode_data_url(image.colorized_url)
+                    image.colorized_key = processed.put(data)
+                    image.colorized_mime = mime_type
+                    image.colorized_url = None
+                migrated += 1
+            except (ValueError, OSError) as e:
+                # Leave malformed rows untouched so they can be inspected
+                logger.warning(f"Skipping image {image.id} during migration: {e}")
+                skipped.append(image.id)
+        db.commit()
+
+    if migrated:
+        logger.info(f"Migrated {migrated} data-URL rows to blob storage")
+    return migrated
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal, init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    session = SessionLocal()
+    try:
+        count = migrate_data_urls(session)
+        print(f"Migrated {count} rows")
+    finally:
+        session.close()
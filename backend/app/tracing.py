@@ -0,0 +1,167 @@
+"""
+Lightweight always-on trace spans.
+
+Every upload gets a trace ID (from the ``X-Trace-ID`` request header or a
+new one), which is stored on the image row and picked up by the worker that
+runs the job, so one trace covers the upload request, the job and the batch
+the image was colorized in. Spans are kept in a bounded in-memory buffer
+per process; workers ship theirs to the API with their periodic stats, and
+``GET /api/admin/traces`` dumps them as Chrome trace JSON (chrome://tracing,
+Perfetto).
+
+Recording a span costs two clock reads and a deque append.
+"""
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Iterator, Optional
+
+from .config import TRACE_BUFFER_SPANS
+from .metrics import metrics
+
+# Trace IDs the current code runs on behalf of: one for a request or job,
+# all of the batch's jobs inside the batch scheduler
+current_traces: ContextVar[tuple[str, ...]] = ContextVar("current_traces", default=())
+
+_TRACE_ID = re.compile(r"^[0-9a-f]{8,32}$")
+
+
+def new_trace_id() -> str:
+    """Generate a random 16-hex-digit trace ID."""
+    return secrets.token_hex(8)
+
+
+def current_trace_id() -> Optional[str]:
+    """The first trace ID of the current context, if any."""
+    traces = current_traces.get()
+    return traces[0] if traces else None
+
+
+def parse_trace_id(value: Optional[str]) -> Optional[str]:
+    """Accept a client-supplied trace ID if it is 8-32 lowercase hex digits."""
+    if value and _TRACE_ID.match(value.lower()):
+        return value.lower()
+    return None
+
+
+class Tracer:
+    """Bounded buffer of finished spans of one process."""
+
+    def __init__(self, capacity: int = TRACE_BUFFER_SPANS, process: str = "api"):
+        """
+        Args:
+            capacity: Maximum number of spans kept (oldest are dropped)
+            process: Name of this process in the trace viewer
+        """
+        self.process = process
+        self.shipping = False
+        self._spans: deque = deque(maxlen=capacity)
+        self._outbox: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: float, duration: float, traces: tuple = (), **args) -> None:
+        """
+        Record a finished span.
+
+        Args:
+            name: Span name
+            start: Start time (time.time() seconds)
+            duration: Duration in seconds
+            traces: Trace IDs the span belongs to
+        """
+        span = {
+            "name": name,
+            "ts": int(start * 1e6),
+            "dur": int(duration * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "process": self.process,
+            "traces": list(traces),
+            "args": args,
+        }
+        with self._lock:
+            self._spans.append(span)
+            if self.shipping:
+                self._outbox.append(span)
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[None]:
+        """Record the enclosed block as a span of the current traces."""
+        start, started = time.time(), time.perf_counter()
+        try:
+            yield
+        finally:
+            # Read at the end: a job learns its trace ID once its row is loaded
+            self.record(name, start, time.perf_counter() - started, current_traces.get(), **args)
+
+    def drain(self) -> list[dict]:
+        """Spans recorded since the last drain (for shipping to the API)."""
+        with self._lock:
+            spans = list(self._outbox)
+            self._outbox.clear()
+        return spans
+
+    def add(self, spans: Iterable[dict]) -> None:
+        """Store spans recorded by another process."""
+        with self._lock:
+            self._spans.extend(spans)
+
+    def spans(self, trace_id: Optional[str] = None, limit: Optional[int] = None) -> list[dict]:
+        """Buffered spans, optionally of one trace only, newest last."""
+        with self._lock:
+            spans = list(self._spans)
+        if trace_id:
+            spans = [span for span in spans if trace_id in span["traces"]]
+        return spans[-limit:] if limit else spans
+
+
+def chrome_trace(spans: list[dict]) -> dict:
+    """Convert spans to the Chrome trace event format."""
+    events = []
+    processes = {}
+    for span in spans:
+        processes[span["pid"]] = span["process"]
+        events.append({
+            "name": span["name"],
+            "cat": "colorizer",
+            "ph": "X",
+            "ts": span["ts"],
+            "dur": span["dur"],
+            "pid": span["pid"],
+            "tid": span["tid"],
+            "args": {**span["args"], "traces": span["traces"]},
+        })
+    for pid, name in processes.items():
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+# Tracer of this process
+tracer = Tracer()
+
+
+@contextmanager
+def stage(name: str, **args) -> Iterator[None]:
+    """Time a pipeline stage: a colorizer_stage_seconds observation plus a span."""
+    with tracer.span(name, **args), metrics.time("colorizer_stage_seconds", stage=name):
+        yield
+
+
+def record_stage(name: str, duration: float, start: Optional[float] = None) -> None:
+    """
+    Record a stage that was timed by hand.
+
+    Args:
+        name: Stage name
+        duration: Seconds spent in the stage
+        start: time.time() at the start (default: ``duration`` ago)
+    """
+    if start is None:
+        start = time.time() - duration
+    metrics.observe("colorizer_stage_seconds", duration, stage=name)
+    tracer.record(name, start, duration, current_traces.get())
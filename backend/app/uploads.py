@@ -0,0 +1,444 @@
+"""
+Streaming ingestion of uploads.
+
+Starlette's form parser spools a whole file part to a temporary file before
+the endpoint runs, so limits can only be enforced once the full body has
+been received. The upload endpoints parse the multipart body themselves as
+it arrives instead: the file content goes straight into the blob store,
+hashed as it is written, and the request is rejected as soon as it crosses
+the size limit. The first bytes of an image are inspected for the format
+and the dimensions from the header, so non-images and decompression bombs
+are rejected before anything is decoded. Memory per upload is bounded by
+the header buffer plus one network chunk, whatever the size of the file.
+
+Bulk uploads (several files and archives, see batches.py) are parsed the
+same way, but their file parts are spooled to temporary files, since
+archives are read with random access; the total size is capped while the
+body arrives.
+"""
+import io
+import tempfile
+import warnings
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Optional
+
+from python_multipart import MultipartParser
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import parse_options_header
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from .config import MAX_IMAGE_PIXELS, UPLOAD_HEADER_BYTES
+from .storage import BlobStore, BlobWriter, sniff_mime
+
+# Allowance for the form fields and multipart framing around the file
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadRejected(Exception):
+    """An upload was refused; carries the HTTP status and message for the client."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class UploadInspector:
+    """
+    Checks a file part while it is received.
+
+    The base class only checks the declared content type of the part;
+    subclasses look at the content as well.
+    """
+
+    def __init__(self, kind: str):
+        """
+        Args:
+            kind: Top-level MIME type the part must declare ("image", "video")
+        """
+        self.kind = kind
+        self.mime: Optional[str] = None
+        self.width: Optional[int] = None
+        self.height: Optional[int] = None
+
+    def start(self, content_type: Optional[str]) -> None:
+        """Check the part headers before any content is read."""
+        if not content_type or not content_type.startswith(f"{self.kind}/"):
+            article = "an" if self.kind[0] in "aeiou" else "a"
+            raise UploadRejected(400, f"File must be {article} {self.kind}")
+        self.mime = content_type
+
+    def feed(self, chunk: bytes) -> None:
+        """Look at the next chunk of content."""
+
+    def finish(self, source=None) -> None:
+        """
+        Called once the whole part has been received.
+
+        Args:
+            source: Path or file object with the whole content, for checks
+                the streamed bytes could not settle
+        """
+
+
+class ImageInspector(UploadInspector):
+    """
+    Sniffs the format and dimensions of an image from its first bytes.
+
+    Up to ``header_bytes`` are buffered until the magic bytes identify an
+    image format and PIL can read the size from the header. Images with more
+    than ``max_pixels`` pixels are rejected, as is content that is not an
+    image whatever its declared type. If the buffered header is not enough
+    (e.g. large metadata blocks), the size is read from the whole content
+    once it is received; images whose size cannot be read are rejected.
+    """
+
+    def __init__(self, max_pixels: int = MAX_IMAGE_PIXELS, header_bytes: int = UPLOAD_HEADER_BYTES):
+        super().__init__("image")
+        self.max_pixels = max_pixels
+        self.header_bytes = header_bytes
+        self._header: Optional[bytearray] = bytearray()
+        self._sniffed = False
+
+    def feed(self, chunk: bytes) -> None:
+        if self._header is None:
+            return
+        self._header += chunk[:self.header_bytes - len(self._header)]
+        if not self._sniffed and len(self._header) >= 16:
+            self._sniff()
+        if self._sniffed:
+            self._read_size(final=len(self._header) >= self.header_bytes)
+
+    def finish(self, source=None) -> None:
+        if self._header is not None:
+            if not self._sniffed:
+                self._sniff()
+            self._read_size(final=True)
+        if self.width is None and source is not None:
+            try:
+                self._measure(source)
+            except UploadRejected:
+                raise
+            except Exception:
+                pass
+        if self.width is None:
+            raise UploadRejected(400, "Could not read the image dimensions")
+
+    def _sniff(self) -> None:
+        mime = sniff_mime(bytes(self._header[:16]), "")
+        if not mime.startswith("image/"):
+            raise UploadRejected(400, "File is not a supported image")
+        self.mime = mime
+        self._sniffed = True
+
+    def _read_size(self, final: bool) -> None:
+        try:
+            self._measure(io.BytesIO(self._header))
+        except UploadRejected:
+            raise
+        except Exception:
+            # The header may continue in the next chunk
+            if final:
+                self._header = None
+            return
+        self._header = None
+
+    def _measure(self, source) -> None:
+        """Read the dimensions with PIL (which only parses the header) and check them."""
+        from PIL import Image
+
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+                with Image.open(source) as header:
+                    width, height = header.size
+        except Image.DecompressionBombError:
+            raise UploadRejected(413, "Image has too many pixels")
+        if width * height > self.max_pixels:
+            raise UploadRejected(
+                413, f"Image is {width}x{height}, more than {self.max_pixels} pixels"
+            )
+        self.width, self.height = width, height
+
+
+@dataclass
+class UploadedFile:
+    """A file part, stored in the blob store while it was received."""
+    filename: Optional[str]
+    key: str
+    size: int
+    mime: Optional[str]
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+@dataclass
+class SpooledPart:
+    """A file part of a bulk upload, spooled to a temporary file."""
+    filename: Optional[str]
+    content_type: Optional[str]
+    file: BinaryIO
+
+
+@dataclass
+class StreamedForm:
+    """Fields and the file (or, for bulk uploads, the spooled parts) of a streamed multipart form."""
+    fields: dict[str, str] = field(default_factory=dict)
+    file: Optional[UploadedFile] = None
+    parts: list[SpooledPart] = field(default_factory=list)
+
+    def close(self) -> None:
+        """Delete the temporary files of spooled parts."""
+        for part in self.parts:
+            part.file.close()
+
+
+class _FormReader:
+    """
+    Feeds a multipart body to python-multipart and routes the parts.
+
+    Text fields are collected; the single file part is inspected and
+    written to the blob store (subclasses handle file parts differently).
+    """
+
+    def __init__(
+        self,
+        boundary: bytes,
+        store: BlobStore,
+        max_bytes: int,
+        inspect: Callable[[], UploadInspector],
+        file_field: str,
+    ):
+        self.form = StreamedForm()
+        self._store = store
+        self._max_bytes = max_bytes
+        self._inspect = inspect
+        self._file_field = file_field
+        self._field_bytes = 0
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._name: Optional[str] = None
+        self._filename: Optional[str] = None
+        self._value: Optional[bytearray] = None
+        self._in_file = False
+        self._writer: Optional[BlobWriter] = None
+        self._inspector: Optional[UploadInspector] = None
+        self._file_name: Optional[str] = None
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def feed(self, chunk: bytes) -> None:
+        self._parser.write(chunk)
+
+    def finish(self) -> StreamedForm:
+        self._parser.finalize()
+        if self._name is not None:
+            raise UploadRejected(400, "Incomplete multipart body")
+        if self._writer is not None:
+            # Committed only once the whole form is accepted, so a rejected
+            # form never leaves a blob behind
+            writer, self._writer = self._writer, None
+            self.form.file = UploadedFile(
+                filename=self._file_name,
+                key=writer.commit(),
+                size=writer.size,
+                mime=self._inspector.mime,
+                width=self._inspector.width,
+                height=self._inspector.height,
+            )
+        return self.form
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+        self.form.close()
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise UploadRejected(400, "Multipart part without a name")
+        self._name = options[b"name"].decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        self._filename = filename.decode("utf-8", "replace") if filename is not None else None
+        self._in_file = self._filename is not None
+        if not self._in_file:
+            self._value = bytearray()
+            return
+        content_type = self._headers.get(b"content-type")
+        self._open_file(content_type.decode("latin-1") if content_type else None)
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        chunk = data[start:end]
+        if not self._in_file:
+            self._field_bytes += len(chunk)
+            if self._field_bytes > FORM_OVERHEAD_BYTES:
+                raise UploadRejected(400, "Form fields are too large")
+            self._value += chunk
+            return
+        self._write_file(chunk)
+
+    def _on_part_end(self) -> None:
+        if self._in_file:
+            self._close_file()
+        else:
+            self.form.fields[self._name] = self._value.decode("utf-8", "replace")
+        self._name = None
+        self._in_file = False
+
+    def _open_file(self, content_type: Optional[str]) -> None:
+        if self._name != self._file_field or self._writer is not None:
+            raise UploadRejected(400, f"Expected a single file in the '{self._file_field}' field")
+        self._inspector = self._inspect()
+        self._inspector.start(content_type)
+        self._writer = self._store.writer()
+
+    def _write_file(self, chunk: bytes) -> None:
+        if self._writer.size + len(chunk) > self._max_bytes:
+            raise UploadRejected(
+                413, f"File size exceeds {self._max_bytes // (1024 * 1024)}MB limit"
+            )
+        self._inspector.feed(chunk)
+        self._writer.write(chunk)
+
+    def _close_file(self) -> None:
+        self._inspector.finish(self._writer.content_path())
+        self._file_name = self._filename
+
+
+class _SpoolingFormReader(_FormReader):
+    """Spools every file part to a temporary file, capping their total size."""
+
+    # Parts up to this size stay in memory
+    SPOOL_MEMORY_BYTES = 1024 * 1024
+
+    def __init__(self, boundary: bytes, max_bytes: int, file_field: str):
+        super().__init__(boundary, None, max_bytes, None, file_field)
+        self._received = 0
+
+    def _open_file(self, content_type: Optional[str]) -> None:
+        if self._name != self._file_field:
+            raise UploadRejected(400, f"Files must be sent in the '{self._file_field}' field")
+        self.form.parts.append(SpooledPart(
+            self._filename, content_type, tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MEMORY_BYTES)
+        ))
+
+    def _write_file(self, chunk: bytes) -> None:
+        self._received += len(chunk)
+        if self._received > self._max_bytes:
+            raise UploadRejected(
+                413, f"Upload size exceeds {self._max_bytes // (1024 * 1024)}MB limit"
+            )
+        self.form.parts[-1].file.write(chunk)
+
+    def _close_file(self) -> None:
+        self.form.parts[-1].file.seek(0)
+
+
+async def read_upload_form(
+    request: Request,
+    store: BlobStore,
+    max_bytes: int,
+    inspect: Callable[[], UploadInspector],
+    file_field: str = "file",
+) -> StreamedForm:
+    """
+    Parse a multipart upload with one file while it is received.
+
+    Args:
+        request: Incoming request whose body has not been read
+        store: Blob store the file content is written to
+        max_bytes: Largest accepted file
+        inspect: Factory of the inspector that checks the file part
+        file_field: Name of the form field holding the file
+
+    Returns:
+        The text fields and the stored file
+
+    Raises:
+        UploadRejected: The body is not a valid upload or breaks a limit;
+            nothing is left in the store in that case
+    """
+    boundary = _boundary(request, max_bytes, "File")
+    form = await _read_form(request, _FormReader(boundary, store, max_bytes, inspect, file_field))
+    if form.file is None:
+        raise UploadRejected(400, f"No file in the '{file_field}' field")
+    return form
+
+
+async def read_bulk_form(request: Request, max_bytes: int, file_field: str = "files") -> StreamedForm:
+    """
+    Parse a multipart upload with any number of files while it is received.
+
+    The file parts are spooled to temporary files (see SpooledPart); the
+    caller closes the form when done with them.
+
+    Args:
+        request: Incoming request whose body has not been read
+        max_bytes: Largest accepted total size of the files
+        file_field: Name of the form field holding the files
+
+    Returns:
+        The text fields and the spooled file parts
+
+    Raises:
+        UploadRejected: The body is not a valid upload or breaks the limit
+    """
+    boundary = _boundary(request, max_bytes, "Upload")
+    form = await _read_form(request, _SpoolingFormReader(boundary, max_bytes, file_field))
+    if not form.parts:
+        form.close()
+        raise UploadRejected(400, f"No files in the '{file_field}' field")
+    return form
+
+
+def _boundary(request: Request, max_bytes: int, what: str) -> bytes:
+    """Multipart boundary of a request, refusing bodies declared too large."""
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise UploadRejected(400, "Expected a multipart/form-data body")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > max_bytes + FORM_OVERHEAD_BYTES:
+        raise UploadRejected(413, f"{what} size exceeds {max_bytes // (1024 * 1024)}MB limit")
+    return options[b"boundary"]
+
+
+async def _read_form(request: Request, reader: _FormReader) -> StreamedForm:
+    """Feed the body of a request to a form reader as it arrives."""
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                # Blob writes are file I/O, so parsing runs off the event loop
+                await run_in_threadpool(reader.feed, chunk)
+        return reader.finish()
+    except MultipartParseError as e:
+        reader.abort()
+        raise UploadRejected(400, f"Malformed multipart body: {e}")
+    except BaseException:
+        reader.abort()
+        raise
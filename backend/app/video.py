@@ -0,0 +1,446 @@
+"""
+Video colorization with streamed frame processing.
+
+Clips are decoded by an ffmpeg process that writes raw RGB frames to a pipe,
+so frames are never extracted to disk and only one batch of them is held in
+memory at a time. Frames go through the batch scheduler (and therefore the
+same loaded generator as image jobs) ``VIDEO_BATCH_SIZE`` at a time. As with
+large images, only the model's chroma is used: it is smoothed over time to
+avoid flicker and combined with each frame's full-resolution luminance.
+
+Colorized frames are piped into an encoder as soon as they are ready. The
+output is written in segments of ``VIDEO_SEGMENT_FRAMES`` frames, each
+stored in the segments blob store together with the smoothing state after
+its last frame. A job that is interrupted (worker restart, lost lease)
+resumes decoding after its last stored segment. When all frames are done
+the segments are joined without re-encoding and the original audio is
+added back.
+
+Requires the ``ffmpeg`` and ``ffprobe`` binaries (``FFMPEG_BINARY``,
+``FFPROBE_BINARY``).
+"""
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import Future
+from dataclasses import dataclass
+from fractions import Fraction
+from itertools import islice
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .chroma import rgb_to_chroma, rgb_to_luma, transfer_chroma
+from .config import (
+    CHROMA_STRIP_ROWS,
+    FFMPEG_BINARY,
+    FFPROBE_BINARY,
+    VIDEO_BATCH_SIZE,
+    VIDEO_CHROMA_SMOOTHING,
+    VIDEO_CRF,
+    VIDEO_SCENE_CUT,
+    VIDEO_SEGMENT_FRAMES,
+)
+from .models import VideoSegment
+from .storage import SEGMENTS_BUCKET, get_blob_store
+
+logger = logging.getLogger(__name__)
+
+VIDEO_MIME = "video/mp4"
+
+# Side of the luminance thumbnail compared between frames to detect scene cuts
+_SIGNATURE_SIZE = 32
+
+
+class VideoError(RuntimeError):
+    """ffmpeg could not read or write a video."""
+
+
+@dataclass
+class VideoInfo:
+    """Properties of a video stream, as reported by ffprobe."""
+    width: int
+    height: int
+    fps: Fraction
+    frames: int
+    has_audio: bool
+
+
+def tools_available() -> bool:
+    """Whether the ffmpeg and ffprobe binaries can be found."""
+    return bool(shutil.which(FFMPEG_BINARY) and shutil.which(FFPROBE_BINARY))
+
+
+def _run(args: list[str]) -> bytes:
+    """Run an ffmpeg tool and return its output."""
+    try:
+        result = subprocess.run(args, capture_output=True, check=False)
+    except FileNotFoundError:
+        raise VideoError(f"{args[0]} is not installed")
+    if result.returncode != 0:
+        raise VideoError(result.stderr.decode(errors="replace").strip() or f"{args[0]} failed")
+    return result.stdout
+
+
+def probe(path: str) -> VideoInfo:
+    """
+    Read the dimensions, frame rate and length of a video.
+
+    Raises:
+        VideoError: No video stream, or ffprobe failed
+    """
+    output = _run([
+        FFPROBE_BINARY, "-v", "error", "-show_streams", "-show_format", "-of", "json", str(path),
+    ])
+    data = json.loads(output)
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise VideoError("No video stream found")
+
+    width, height = int(video["width"]), int(video["height"])
+    # ffmpeg applies rotation metadata when decoding, so frames come out turned
+    rotation = int(video.get("tags", {}).get("rotate", 0))
+    for side_data in video.get("side_data_list", []):
+        rotation = int(side_data.get("rotation", rotation))
+    if rotation % 180:
+        width, height = height, width
+
+    fps = Fraction(video.get("avg_frame_rate") or "0/1")
+    if not fps:
+        fps = Fraction(video.get("r_frame_rate") or "25/1")
+    frames = int(video.get("nb_frames") or 0)
+    if not frames:
+        duration = float(video.get("duration") or data.get("format", {}).get("duration") or 0)
+        frames = round(duration * fps)
+    return VideoInfo(
+        width=width,
+        height=height,
+        fps=fps,
+        frames=frames,
+        has_audio=any(s.get("codec_type") == "audio" for s in streams),
+    )
+
+
+def iter_frames(path: str, info: VideoInfo, start_frame: int = 0) -> Iterator[np.ndarray]:
+    """
+    Decode frames of a video one at a time.
+
+    Args:
+        path: Video file
+        info: Result of probe()
+        start_frame: Index of the first frame to decode (seeks without
+            decoding the frames before it)
+
+    Yields:
+        RGB frames, uint8 arrays of shape (height, width, 3)
+
+    Raises:
+        VideoError: ffmpeg failed while decoding
+    """
+    args = [FFMPEG_BINARY, "-v", "error", "-nostdin"]
+    if start_frame:
+        args += ["-ss", f"{float(start_frame / info.fps):.6f}"]
+    args += ["-i", str(path), "-map", "0:v:0", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+    frame_size = info.width * info.height * 3
+
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=stderr)
+        except FileNotFoundError:
+            raise VideoError(f"{FFMPEG_BINARY} is not installed")
+        try:
+            while True:
+                data = process.stdout.read(frame_size)
+                if len(data) < frame_size:
+                    break
+                yield np.frombuffer(data, dtype=np.uint8).reshape(info.height, info.width, 3)
+            process.stdout.close()
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise VideoError(stderr.read().decode(errors="replace").strip() or "ffmpeg failed")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+
+class SegmentEncoder:
+    """Encodes frames into an H.264 file as they are written."""
+
+    def __init__(self, path: str, info: VideoInfo, crf: int = VIDEO_CRF):
+        """
+        Start the encoder.
+
+        Args:
+            path: Output file (MP4)
+            info: Frame size and rate of the frames that will be written
+            crf: x264 quality (lower is better)
+        """
+        self.path = path
+        self.frames = 0
+        self._stderr = tempfile.TemporaryFile()
+        args = [
+            FFMPEG_BINARY, "-v", "error", "-nostdin", "-y",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{info.width}x{info.height}", "-r", str(info.fps), "-i", "-",
+            # yuv420p needs even dimensions
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-an", "-c:v", "libx264", "-pix_fmt", "yuv420p", "-crf", str(crf),
+            str(path),
+        ]
+        try:
+            self._process = subprocess.Popen(args, stdin=subprocess.PIPE, stderr=self._stderr)
+        except FileNotFoundError:
+            self._stderr.close()
+            raise VideoError(f"{FFMPEG_BINARY} is not installed")
+
+    def write(self, frame: np.ndarray) -> None:
+        """Queue one RGB frame for encoding."""
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+        except BrokenPipeError:
+            self.close()
+        self.frames += 1
+
+    def close(self) -> None:
+        """
+        Finish encoding.
+
+        Raises:
+            VideoError: ffmpeg failed
+        """
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._process.wait()
+        self._stderr.seek(0)
+        error = self._stderr.read().decode(errors="replace").strip()
+        self._stderr.close()
+        if returncode != 0:
+            raise VideoError(error or "ffmpeg failed")
+
+    def abort(self) -> None:
+        """Stop the encoder, discarding its output."""
+        if self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        self._stderr.close()
+
+
+def concat_segments(segment_paths: list[str], source_path: str, info: VideoInfo, output_path: str) -> None:
+    """
+    Join encoded segments without re-encoding and add the source's audio.
+
+    Raises:
+        VideoError: ffmpeg failed
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as listing:
+        for path in segment_paths:
+            listing.write(f"file '{os.path.abspath(path)}'\n")
+    try:
+        args = [FFMPEG_BINARY, "-v", "error", "-nostdin", "-y", "-f", "concat", "-safe", "0", "-i", listing.name]
+        if info.has_audio:
+            args += ["-i", str(source_path), "-map", "0:v:0", "-map", "1:a:0", "-c:a", "aac", "-shortest"]
+        args += ["-c:v", "copy", "-movflags", "+faststart", str(output_path)]
+        _run(args)
+    finally:
+        os.unlink(listing.name)
+
+
+def _signature(luma: np.ndarray) -> np.ndarray:
+    """Tiny luminance thumbnail used to compare consecutive frames."""
+    rows = np.linspace(0, luma.shape[0] - 1, _SIGNATURE_SIZE).astype(np.intp)
+    cols = np.linspace(0, luma.shape[1] - 1, _SIGNATURE_SIZE).astype(np.intp)
+    return luma[np.ix_(rows, cols)].astype(np.float32)
+
+
+class ChromaSmoother:
+    """
+    Exponential moving average of the predicted chroma over frames.
+
+    The generator colours each frame independently, so the same object can
+    change hue from one frame to the next. Blending each frame's chroma with
+    that of the previous frames removes the flicker; the average restarts
+    at scene cuts so colours do not bleed into the next shot.
+    """
+
+    def __init__(self, smoothing: float = VIDEO_CHROMA_SMOOTHING, scene_cut: float = VIDEO_SCENE_CUT):
+        """
+        Args:
+            smoothing: Weight of the previous frames (0 disables smoothing)
+            scene_cut: Mean absolute luminance change (0-255) treated as a cut
+        """
+        self.smoothing = smoothing
+        self.scene_cut = scene_cut
+        self.chroma: Optional[np.ndarray] = None
+        self.signature: Optional[np.ndarray] = None
+
+    def __call__(self, chroma: np.ndarray, luma: np.ndarray) -> np.ndarray:
+        """
+        Smooth the chroma of the next frame.
+
+        Args:
+            chroma: Cb/Cr planes predicted for the frame (rgb_to_chroma)
+            luma: Luminance of the frame (for scene cut detection)
+        """
+        signature = _signature(luma)
+        cut = (
+            self.signature is None
+            or self.chroma is None
+            or self.chroma.shape != chroma.shape
+            or float(np.abs(signature - self.signature).mean()) > self.scene_cut
+        )
+        if not cut and self.smoothing > 0:
+            chroma = self.smoothing * self.chroma + (1 - self.smoothing) * chroma
+        self.chroma, self.signature = chroma, signature
+        return chroma
+
+    def state(self) -> bytes:
+        """Serialize the state after the last frame."""
+        buffer = io.BytesIO()
+        if self.chroma is not None:
+            np.savez(buffer, chroma=self.chroma, signature=self.signature)
+        return buffer.getvalue()
+
+    def restore(self, state: bytes) -> None:
+        """Continue from a state returned by state()."""
+        if not state:
+            return
+        with np.load(io.BytesIO(state)) as saved:
+            self.chroma, self.signature = saved["chroma"], saved["signature"]
+
+
+def colorize_frames(
+    frames: list[np.ndarray],
+    predictions: list[np.ndarray],
+    smoother: ChromaSmoother,
+) -> Iterator[np.ndarray]:
+    """
+    Combine frames with their (smoothed) predicted chroma.
+
+    Args:
+        frames: Original RGB frames
+        predictions: Raw colour predictions of the generator, in frame order
+        smoother: Temporal smoothing state, updated frame by frame
+    """
+    for frame, prediction in zip(frames, predictions):
+        luma = rgb_to_luma(frame)
+        chroma = smoother(rgb_to_chroma(prediction), luma)
+        yield transfer_chroma(luma, chroma, CHROMA_STRIP_ROWS)
+
+
+def delete_segments(db: Session, image_id: int) -> None:
+    """Remove the segments of a video job and their blobs (unless shared with another job)."""
+    store = get_blob_store(SEGMENTS_BUCKET)
+    segments = db.query(VideoSegment).filter(VideoSegment.image_id == image_id).all()
+    keys = {key for segment in segments for key in (segment.key, segment.state_key)}
+    for segment in segments:
+        db.delete(segment)
+    db.commit()
+    for key in keys:
+        shared = db.query(VideoSegment.id).filter(
+            (VideoSegment.key == key) | (VideoSegment.state_key == key)
+        ).first()
+        if not shared:
+            store.delete(key)
+
+
+def colorize_video(
+    db: Session,
+    image_id: int,
+    source_path: str,
+    predict: Callable[[list[np.ndarray]], Future],
+    report: Callable[[int, int], None],
+    output_path: str,
+) -> int:
+    """
+    Colorize a video, resuming after the segments stored by earlier attempts.
+
+    Args:
+        db: Database session (segments are committed as they are finished)
+        image_id: ID of the job
+        source_path: Uploaded video file
+        predict: Submits a list of frames to the generator; the future resolves
+            to their raw colour predictions
+        report: Called with (frames done, total frames) after every batch
+        output_path: Where to write the finished video
+
+    Returns:
+        Number of frames in the output
+
+    Raises:
+        VideoError: ffmpeg failed
+        Exception: Whatever the generator raised
+    """
+    store = get_blob_store(SEGMENTS_BUCKET)
+    info = probe(source_path)
+    segments = (
+        db.query(VideoSegment)
+        .filter(VideoSegment.image_id == image_id)
+        .order_by(VideoSegment.index)
+        .all()
+    )
+    done = sum(segment.frames for segment in segments)
+    keys = [segment.key for segment in segments]
+    smoother = ChromaSmoother()
+    if segments:
+        smoother.restore(store.get(segments[-1].state_key))
+        logger.info(f"Video {image_id}: resuming at frame {done} ({len(segments)} segments stored)")
+    db.rollback()
+
+    frames = iter_frames(source_path, info, start_frame=done)
+    try:
+        while True:
+            fd, segment_path = tempfile.mkstemp(suffix=".mp4")
+            os.close(fd)
+            encoder = SegmentEncoder(segment_path, info)
+            try:
+                start_frame = done
+                remaining = VIDEO_SEGMENT_FRAMES
+                while remaining > 0:
+                    batch = list(islice(frames, min(VIDEO_BATCH_SIZE, remaining)))
+                    if not batch:
+                        break
+                    predictions = predict(batch).result()
+                    for colorized in colorize_frames(batch, predictions, smoother):
+                        encoder.write(colorized)
+                    done += len(batch)
+                    remaining -= len(batch)
+                    report(done, max(info.frames, done))
+                if done == start_frame:
+                    encoder.abort()
+                    break
+                encoder.close()
+                with open(segment_path, "rb") as segment_file:
+                    key = store.put_stream(segment_file)
+            except BaseException:
+                encoder.abort()
+                raise
+            finally:
+                os.unlink(segment_path)
+
+            db.add(VideoSegment(
+                image_id=image_id,
+                index=len(keys),
+                start_frame=start_frame,
+                frames=done - start_frame,
+                key=key,
+                state_key=store.put(smoother.state()),
+            ))
+            db.commit()
+            keys.append(key)
+            logger.info(f"Video {image_id}: stored segment {len(keys)} (frames {start_frame}-{done - 1})")
+    finally:
+        frames.close()
+
+    if not keys:
+        raise VideoError("The video has no frames")
+    concat_segments([str(store.path_for(key)) for key in keys], source_path, info, output_path)
+    return done
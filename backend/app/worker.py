@@ -0,0 +1,1018 @@
+"""
+Inference workers consuming the durable job queue.
+
+Each worker loads the model once and keeps up to ``JOB_CONCURRENCY`` jobs in
+flight, so the batch scheduler can group them into shared forward passes.
+Workers normally run as separate processes managed by ``WorkerPool``; with
+``JOB_WORKERS=0`` a single worker runs as a thread inside the API process.
+
+Workers talk back to the API process through a message queue (``publish``):
+periodic statistics, and status transitions and progress of each job, which
+the API pushes to clients (see ``events.py``). Trace spans recorded by a
+worker process travel with its statistics (see ``tracing.py``).
+
+Workers also poll for profiling requests and profile the next jobs they
+run when asked to (see ``profiling.py``), and for cancellations of the jobs
+they run, which stop at the next stage boundary.
+
+Every worker advertises its capacity and models in the database (see
+``nodes.py``), so inference nodes can run on other hosts than the API. Run a
+standalone node, optionally serving only some of the models, with::
+
+    python -m app.worker --processes 2 --models artistic
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Collection, Optional
+
+from .config import (
+    CANCEL_POLL_SECONDS,
+    DEFAULT_MODEL,
+    JOB_CONCURRENCY,
+    JOB_LEASE_SECONDS,
+    JOB_POLL_INTERVAL,
+    JOB_WORKERS,
+    LARGE_IMAGE_PIXELS,
+    MODELS,
+    PROFILE_POLL_SECONDS,
+    WORKER_DRAIN_SECONDS,
+    WORKER_MODELS,
+    WORKER_STATS_INTERVAL,
+)
+from .metrics import metrics
+from .profiling import ProfileSession, current_profile
+from .startup import StartupTimer
+from .tracing import current_traces, stage, tracer
+
+logger = logging.getLogger(__name__)
+
+Publisher = Callable[[dict], None]
+
+
+def _discard(message: dict) -> None:
+    """Default publisher: drop messages."""
+
+
+def use_large_path(mode: Optional[str], width: Optional[int], height: Optional[int]) -> bool:
+    """Decide whether a job runs through the large-image path."""
+    if mode == "large":
+        return True
+    if mode == "standard" or not width or not height:
+        return False
+    return width * height > LARGE_IMAGE_PIXELS
+
+
+class CompletionWriter:
+    """
+    Records finished jobs of a worker with group commits.
+
+    Jobs of one inference batch finish within moments of each other. Instead
+    of a transaction per job, a single writer thread commits every
+    completion that queued up while the previous commit was running, so
+    write transactions (the SQLite write lock, WAL syncs) scale with
+    batches rather than with images.
+    """
+
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._closing = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name=f"completions-{worker_id}", daemon=True
+        )
+        self._thread.start()
+
+    def complete(self, image_id: int, colorized_key: str, colorized_mime: str) -> bool:
+        """
+        Mark a job as completed and wait until that is committed.
+
+        Returns:
+            True if the job was updated (False if the worker lost its lease)
+        """
+        future: Future = Future()
+        with self._closing:
+            queued = not self._closed
+            if queued:
+                self._queue.put((image_id, colorized_key, colorized_mime, future))
+        if not queued:
+            # Jobs left running by a drain that timed out finish after the
+            # writer stopped; record them directly instead of waiting forever
+            self._flush([(image_id, colorized_key, colorized_mime, future)])
+        return future.result()
+
+    def shutdown(self) -> None:
+        """Commit what is queued and stop the writer thread."""
+        with self._closing:
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            pending = [item]
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                pending.append(item)
+            self._flush(pending)
+
+    def _flush(self, pending: list) -> None:
+        from .database import SessionLocal
+        from .jobs import complete_jobs
+
+        db = SessionLocal()
+        try:
+            completed = complete_jobs(db, self.worker_id, [item[:3] for item in pending])
+        except Exception as e:
+            for *_, future in pending:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+        metrics.observe("colorizer_completion_batch_size", len(pending))
+        for image_id, _, _, future in pending:
+            future.set_result(image_id in completed)
+
+
+class Worker:
+    """Claims jobs from the queue and runs them through the colorizer."""
+
+    def __init__(
+        self,
+        worker_id: str,
+        publish: Publisher = _discard,
+        concurrency: int = JOB_CONCURRENCY,
+        models: Collection[str] = WORKER_MODELS,
+        drain_seconds: float = WORKER_DRAIN_SECONDS,
+    ):
+        """
+        Initialize the worker.
+
+        Args:
+            worker_id: Unique identifier recorded on claimed jobs
+            publish: Callback receiving status messages for the API process
+            concurrency: Maximum number of jobs in flight
+            models: Models whose jobs this worker claims
+            drain_seconds: How long a stopping worker waits for its jobs
+        """
+        self.worker_id = worker_id
+        self.publish = publish
+        self.concurrency = max(1, concurrency)
+        self.models = tuple(models)
+        self.drain_seconds = drain_seconds
+        # Claim without a model filter when serving everything, so jobs of
+        # models removed from MODELS still run (and fail) instead of waiting
+        self._model_filter = None if set(self.models) >= set(MODELS) else self.models
+        self._stop = threading.Event()
+        self._in_flight: set[int] = set()
+        self._cancelled: set[int] = set()
+        # Inference futures of jobs waiting in the batch scheduler
+        self._waiting: dict[int, Future] = {}
+        self.readiness: dict = {"ready": False, "error": None}
+        self._sessions: dict[int, Optional[str]] = {}
+        self._profile: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix=f"job-{worker_id}"
+        )
+        # Derivatives are rendered after the job completes, off the job threads
+        self._derivatives = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"derivatives-{worker_id}"
+        )
+        self._completions = CompletionWriter(worker_id)
+
+    def stop(self) -> None:
+        """Ask the run loop to exit after the current iteration."""
+        self._stop.set()
+
+    def run(self) -> None:
+        """Claim and process jobs until stopped."""
+        from .database import SessionLocal
+        from .jobs import claim_jobs, requeue_expired
+
+        # Load the model before claiming anything, so a slow start does not eat leases
+        self._warm_up()
+
+        heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        heartbeat.start()
+
+        last_report = last_profile_poll = last_cancel_poll = last_requeue = 0.0
+        while not self._stop.is_set():
+            # Leases run for JOB_LEASE_SECONDS, so expired ones are looked for
+            # far less often than the queue is polled
+            if time.monotonic() - last_requeue >= JOB_LEASE_SECONDS / 2:
+                db = SessionLocal()
+                try:
+                    requeue_expired(db)
+                except Exception as e:
+                    logger.error(f"Worker {self.worker_id} failed to requeue expired jobs: {e}")
+                finally:
+                    db.close()
+                last_requeue = time.monotonic()
+
+            with self._lock:
+                free_slots = self.concurrency - len(self._in_flight)
+
+            claimed = []
+            if free_slots > 0:
+                db = SessionLocal()
+                try:
+                    claimed = claim_jobs(db, self.worker_id, free_slots, self._model_filter)
+                except Exception as e:
+                    logger.error(f"Worker {self.worker_id} failed to claim jobs: {e}")
+                finally:
+                    db.close()
+
+            for image_id in claimed:
+                with self._lock:
+                    self._in_flight.add(image_id)
+                self._executor.submit(self._run_job, image_id)
+
+            if time.monotonic() - last_report >= WORKER_STATS_INTERVAL:
+                self._report_stats()
+                last_report = time.monotonic()
+
+            if time.monotonic() - last_cancel_poll >= CANCEL_POLL_SECONDS:
+                self._poll_cancellations()
+                last_cancel_poll = time.monotonic()
+
+            if self._profile is None and time.monotonic() - last_profile_poll >= PROFILE_POLL_SECONDS:
+                self._poll_profiles()
+                last_profile_poll = time.monotonic()
+
+            if not claimed:
+                self._stop.wait(JOB_POLL_INTERVAL)
+
+        released = self._drain()
+        self._executor.shutdown(wait=not released, cancel_futures=True)
+        self._completions.shutdown()
+        self._derivatives.shutdown(wait=True)
+        self._withdraw()
+
+    def _drain(self) -> int:
+        """
+        Let in-flight jobs finish for up to ``drain_seconds``, then release the rest.
+
+        Returns:
+            Number of jobs put back into the queue
+        """
+        from .database import SessionLocal
+        from .jobs import release_jobs
+
+        deadline = time.monotonic() + self.drain_seconds
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._in_flight:
+                    return 0
+            time.sleep(0.1)
+
+        with self._lock:
+            image_ids = list(self._in_flight)
+        db = SessionLocal()
+        try:
+            released = release_jobs(db, self.worker_id, image_ids)
+        except Exception as e:
+            logger.error(f"Worker {self.worker_id} failed to release its jobs: {e}")
+            return 0
+        finally:
+            db.close()
+        logger.info(f"Worker {self.worker_id} stopped with {released} jobs unfinished, released them")
+        return released
+
+    def _warm_up(self) -> None:
+        """Load the model, run a dummy inference and report readiness."""
+        from .batching import get_batch_scheduler
+        from .colorizer import get_colorizer
+
+        timer = StartupTimer(f"Worker {self.worker_id}")
+        try:
+            with timer.phase("model"):
+                get_batch_scheduler()
+            with timer.phase("warmup"):
+                # Warm up a model this worker serves (the default one if it can)
+                get_colorizer(DEFAULT_MODEL if DEFAULT_MODEL in self.models else self.models[0]).warm_up()
+            self.readiness = {"ready": True, "error": None}
+            logger.info(f"Worker {self.worker_id} ready")
+        except Exception as e:
+            # Keep consuming: jobs will fail with the model error and retry later
+            self.readiness = {"ready": False, "error": str(e)}
+            logger.warning(f"Worker {self.worker_id} colorizer initialization failed: {e}")
+        timer.log()
+        self.readiness["startup"] = timer.summary()
+        self.publish({"type": "ready", "workerId": self.worker_id, **self.readiness})
+        self._advertise()
+
+    def _advertise(self) -> None:
+        """Record this worker's capacity and models in the node registry."""
+        from .database import SessionLocal
+        from .nodes import advertise
+        from .registry import get_registry_stats
+        from .similar import get_similar_index
+
+        with self._lock:
+            in_flight = len(self._in_flight)
+        registry = get_registry_stats()
+        db = SessionLocal()
+        try:
+            advertise(
+                db,
+                self.worker_id,
+                capacity=self.concurrency,
+                in_flight=in_flight,
+                models=list(self.models),
+                loaded=registry["loaded"] if registry else None,
+                ready=self.readiness["ready"],
+            )
+        except Exception as e:
+            logger.warning(f"Worker {self.worker_id} failed to advertise itself: {e}")
+        finally:
+            db.close()
+
+    def _withdraw(self) -> None:
+        """Remove this worker from the node registry."""
+        from .database import SessionLocal
+        from .nodes import withdraw
+
+        db = SessionLocal()
+        try:
+            withdraw(db, self.worker_id)
+        except Exception as e:
+            logger.warning(f"Worker {self.worker_id} failed to withdraw itself: {e}")
+        finally:
+            db.close()
+
+    def _poll_profiles(self) -> None:
+        """Take a pending profiling request, if there is one for this worker."""
+        from .database import SessionLocal
+        from .profiling import claim_profile
+
+        db = SessionLocal()
+        try:
+            self._profile = claim_profile(db, self.worker_id)
+        except Exception as e:
+            logger.warning(f"Worker {self.worker_id} failed to check for profiling requests: {e}")
+        finally:
+            db.close()
+
+    def _poll_cancellations(self) -> None:
+        """Flag in-flight jobs that were cancelled, and drop those still waiting for a batch."""
+        from .database import SessionLocal
+        from .jobs import cancelled_jobs
+
+        with self._lock:
+            running = self._in_flight - self._cancelled
+        if not running:
+            return
+        db = SessionLocal()
+        try:
+            cancelled = cancelled_jobs(db, running)
+        except Exception as e:
+            logger.warning(f"Worker {self.worker_id} failed to check for cancellations: {e}")
+            return
+        finally:
+            db.close()
+        with self._lock:
+            self._cancelled |= cancelled & self._in_flight
+            waiting = [self._waiting[image_id] for image_id in cancelled if image_id in self._waiting]
+        for future in waiting:
+            # Only succeeds while the job is not part of a running batch yet
+            future.cancel()
+
+    def _checkpoint(self, image_id: int) -> None:
+        """
+        Stage boundary of a job: stop here if it was cancelled.
+
+        Raises:
+            JobCancelled: The job was cancelled
+        """
+        from .jobs import JobCancelled
+
+        with self._lock:
+            if image_id in self._cancelled:
+                raise JobCancelled(f"Job {image_id} was cancelled")
+
+    def _infer(self, image_id: int, future: Future):
+        """Wait for a job's inference in the batch scheduler, unless it is cancelled first."""
+        from .jobs import JobCancelled
+
+        with self._lock:
+            self._waiting[image_id] = future
+            cancelled = image_id in self._cancelled
+        if cancelled:
+            future.cancel()
+        try:
+            return future.result()
+        except CancelledError:
+            raise JobCancelled(f"Job {image_id} was cancelled")
+        finally:
+            with self._lock:
+                self._waiting.pop(image_id, None)
+
+    def _finish_profile(self, session: ProfileSession) -> None:
+        """Store the artifact of a finished profiling session."""
+        from .database import SessionLocal
+        from .profiling import store_artifact
+
+        with self._lock:
+            if self._profile is session:
+                self._profile = None
+        db = SessionLocal()
+        try:
+            store_artifact(db, session)
+        except Exception as e:
+            logger.error(f"Worker {self.worker_id} failed to store profile {session.profile_id}: {e}")
+        finally:
+            db.close()
+
+    def _run_job(self, image_id: int) -> None:
+        """Process one claimed job and record its outcome."""
+        from .database import SessionLocal
+        from .jobs import JobCancelled, fail_job
+        from .models import ImageStatus
+
+        session = self._profile
+        if session is not None and not session.claim():
+            session = None
+        current_profile.set(session)
+        current_traces.set(())
+
+        started = time.perf_counter()
+        outcome = "completed"
+        try:
+            with tracer.span("job", image_id=image_id), (session.section() if session else nullcontext()):
+                self.process(image_id)
+        except JobCancelled:
+            logger.info(f"Image {image_id} was cancelled, stopped processing")
+            outcome = "cancelled"
+            from .video import delete_segments
+            db = SessionLocal()
+            try:
+                delete_segments(db, image_id)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Colorization failed for image {image_id}: {e}", exc_info=True)
+            metrics.inc("colorizer_job_errors_total", error=type(e).__name__)
+            outcome = "failed"
+            db = SessionLocal()
+            try:
+                status = fail_job(db, image_id, self.worker_id, str(e))
+                if status is not None:
+                    logger.info(f"Image {image_id} is now {status.value}")
+                    self._publish_status(image_id, status.value, errorMessage=str(e))
+                    if status == ImageStatus.PENDING:
+                        outcome = "requeued"
+                    elif status == ImageStatus.FAILED:
+                        # Segments of a video are only kept for the next attempt
+                        from .video import delete_segments
+                        delete_segments(db, image_id)
+            finally:
+                db.close()
+        finally:
+            metrics.inc("colorizer_jobs_total", status=outcome)
+            metrics.observe("colorizer_job_seconds", time.perf_counter() - started, status=outcome)
+            with self._lock:
+                self._in_flight.discard(image_id)
+                self._cancelled.discard(image_id)
+                self._sessions.pop(image_id, None)
+            if session is not None and session.job_done():
+                self._finish_profile(session)
+
+    def _publish_status(self, image_id: int, status: str, **fields) -> None:
+        """Publish a status transition or progress update of a job."""
+        with self._lock:
+            session_id = self._sessions.get(image_id)
+        self.publish({
+            "type": "status",
+            "imageId": image_id,
+            "sessionId": session_id,
+            "status": status,
+            **fields,
+        })
+
+    def process(self, image_id: int) -> None:
+        """
+        Colorize one image and store the result.
+
+        Raises:
+            Exception: Any failure; the caller records it against the job
+        """
+        from .batching import get_batch_scheduler
+        from .cache import get_result_cache, make_cache_key, model_fingerprint
+        from .inference import backend_id
+        from .database import SessionLocal
+        from .jobs import JobCancelled
+        from .models import Image, ImageStatus
+        from .registry import get_model_registry
+        from .similar import get_similar_index
+        from .storage import get_blob_store, decode_data_url, UPLOADS_BUCKET, PROCESSED_BUCKET
+
+        db = SessionLocal()
+        try:
+            image = db.query(Image).filter(Image.id == image_id).first()
+            if not image:
+                logger.error(f"Image {image_id} not found")
+                return
+            if image.status == ImageStatus.CANCELLED:
+                raise JobCancelled(f"Job {image_id} was cancelled")
+            original_key, render_factor, model = image.original_key, image.render_factor, image.model
+            if image.trace_id:
+                current_traces.set((image.trace_id,))
+            with self._lock:
+                self._sessions[image_id] = image.session_id
+            self._publish_status(image_id, "processing", progress=0.0)
+            if image.kind == "video":
+                db.rollback()
+                self._process_video(db, image_id, original_key, render_factor, model)
+                return
+            large = use_large_path(image.processing_mode, image.width, image.height)
+            size = (image.width, image.height)
+            if not original_key and image.original_url:
+                # Row predates blob storage and was not migrated yet
+                data, _ = decode_data_url(image.original_url)
+                original_key = get_blob_store(UPLOADS_BUCKET).put(data)
+            db.rollback()
+
+            # Only the model's configuration is needed here, nothing is loaded yet
+            registry = get_model_registry()
+            cache = get_result_cache()
+            cache_key = make_cache_key(
+                original_key,
+                f"{model_fingerprint(registry.weights(model))}|{backend_id()}",
+                render_factor or registry.render_factor,
+                "image/jpeg",
+                variant="large" if large else "standard",
+            )
+
+            # Identical input and settings were colorized before: skip inference
+            colorized_bytes = cache.get(cache_key)
+            output_mime_type = "image/jpeg"
+            metrics.inc("colorizer_result_cache_total", result="miss" if colorized_bytes is None else "hit")
+            if colorized_bytes is not None:
+                logger.info(f"Image {image_id} served from result cache")
+                # Still indexed, so that later near-duplicates find this result
+                if get_similar_index().enabled:
+                    self._record_phash(db, image_id, get_blob_store(UPLOADS_BUCKET).get(original_key))
+            else:
+                self._checkpoint(image_id)
+                image_data = get_blob_store(UPLOADS_BUCKET).get(original_key)
+                self._publish_status(image_id, "processing", progress=0.1)
+                # A near-duplicate was colorized before: reuse its colours
+                colorized_bytes = self._reuse_similar(
+                    db, image_id, image_data, model, render_factor or registry.render_factor, size
+                )
+                if colorized_bytes is None:
+                    colorized_bytes, output_mime_type = self._infer(image_id, get_batch_scheduler().submit(
+                        image_data, render_factor, large=large, model=model
+                    ))
+                    # Only model output is cached: the key promises exactly
+                    # this input, not an approximation borrowed from another
+                    cache.put(cache_key, colorized_bytes)
+                self._publish_status(image_id, "processing", progress=0.9)
+
+            self._checkpoint(image_id)
+            with stage("storage_write"):
+                colorized_key = get_blob_store(PROCESSED_BUCKET).put(colorized_bytes)
+            with stage("db_commit"):
+                completed = self._completions.complete(image_id, colorized_key, output_mime_type)
+            if completed:
+                logger.info(f"Image {image_id} colorized successfully")
+                self._publish_status(
+                    image_id, "completed", progress=1.0, colorizedKey=colorized_key
+                )
+                self._derivatives.submit(self._generate_derivatives, colorized_key)
+            else:
+                logger.warning(f"Image {image_id} finished after losing its lease, result dropped")
+        finally:
+            db.close()
+
+    def _reuse_similar(
+        self,
+        db,
+        image_id: int,
+        image_data: bytes,
+        model: Optional[str],
+        render_factor: int,
+        size: tuple[Optional[int], Optional[int]],
+    ) -> Optional[bytes]:
+        """
+        Colour an image with the result of a near-duplicate (see similar.py).
+
+        Also records the perceptual hash of the image, so that later
+        near-duplicates of it find its result.
+
+        Args:
+            render_factor: Render factor of the job (model default applied)
+            size: Width and height of the image
+
+        Returns:
+            Encoded JPEG, or None if no earlier result can be reused
+        """
+        from .inference import backend_id
+        from .registry import get_model_registry
+        from .similar import get_similar_index, reuse_colors
+        from .storage import get_blob_store, PROCESSED_BUCKET
+
+        index = get_similar_index()
+        if not index.enabled:
+            return None
+        phash = self._record_phash(db, image_id, image_data)
+        if phash is None:
+            return None
+
+        width, height = size
+        if not width or not height:
+            index.record("miss")
+            return None
+        try:
+            match = index.find(
+                db, phash, model, backend_id(), render_factor, get_model_registry().render_factor, width / height
+            )
+        finally:
+            db.rollback()
+        if match is None:
+            return None
+        source_id, colorized_key, distance = match
+        with stage("postprocess"):
+            colorized_bytes = reuse_colors(image_data, get_blob_store(PROCESSED_BUCKET).get(colorized_key))
+        logger.info(f"Image {image_id} reused the colours of image {source_id} (distance {distance})")
+        return colorized_bytes
+
+    def _record_phash(self, db, image_id: int, image_data: bytes) -> Optional[str]:
+        """
+        Store the perceptual hash of an image on its row.
+
+        The backend of this node is recorded with it: only results of the
+        same backend are reused for near-duplicates.
+
+        Returns:
+            The hash, or None for featureless images
+        """
+        from .inference import backend_id
+        from .models import Image
+        from .similar import get_similar_index, perceptual_hash
+
+        with stage("phash"):
+            phash = perceptual_hash(image_data)
+        if phash is None:
+            get_similar_index().record("unhashable")
+            return None
+        db.query(Image).filter(Image.id == image_id).update(
+            {"phash": phash, "inference_backend": backend_id()}, synchronize_session=False
+        )
+        db.commit()
+        return phash
+
+    def _process_video(
+        self,
+        db,
+        image_id: int,
+        original_key: str,
+        render_factor: Optional[int],
+        model: Optional[str],
+    ) -> None:
+        """Colorize a video job (see video.py) and store the result."""
+        from .batching import get_batch_scheduler
+        from .storage import get_blob_store, UPLOADS_BUCKET, PROCESSED_BUCKET
+        from .video import VIDEO_MIME, colorize_video, delete_segments
+
+        scheduler = get_batch_scheduler()
+
+        def predict(frames: list):
+            self._checkpoint(image_id)
+            return scheduler.submit_frames(frames, render_factor, model=model)
+
+        def report(done: int, total: int) -> None:
+            self._checkpoint(image_id)
+            self._publish_status(
+                image_id, "processing", progress=min(done / total, 0.99), frame=done, frames=total
+            )
+
+        fd, output_path = tempfile.mkstemp(suffix=".mp4")
+        os.close(fd)
+        try:
+            source_path = str(get_blob_store(UPLOADS_BUCKET).path_for(original_key))
+            colorize_video(db, image_id, source_path, predict, report, output_path)
+            self._checkpoint(image_id)
+            with stage("storage_write"), open(output_path, "rb") as output:
+                colorized_key = get_blob_store(PROCESSED_BUCKET).put_stream(output)
+        finally:
+            os.unlink(output_path)
+
+        with stage("db_commit"):
+            completed = self._completions.complete(image_id, colorized_key, VIDEO_MIME)
+        if completed:
+            logger.info(f"Video {image_id} colorized successfully")
+            delete_segments(db, image_id)
+            self._publish_status(image_id, "completed", progress=1.0, colorizedKey=colorized_key)
+        else:
+            logger.warning(f"Video {image_id} finished after losing its lease, result dropped")
+
+    def _generate_derivatives(self, colorized_key: str) -> None:
+        """Render thumbnails and re-encoded variants of a result."""
+        from .database import SessionLocal
+        from .derivatives import generate_derivatives
+        from .storage import PROCESSED_BUCKET
+
+        db = SessionLocal()
+        try:
+            count = generate_derivatives(db, PROCESSED_BUCKET, colorized_key)
+            logger.info(f"Stored {count} derivatives of {colorized_key[:12]}")
+        except Exception as e:
+            # Clients get the full result while a derivative is missing
+            logger.warning(f"Derivative generation failed for {colorized_key[:12]}: {e}")
+        finally:
+            db.close()
+
+    def _heartbeat_loop(self) -> None:
+        """Extend the leases of in-flight jobs until stopped."""
+        from .database import SessionLocal
+        from .jobs import extend_leases
+
+        interval = JOB_LEASE_SECONDS / 3
+        while not self._stop.wait(interval):
+            with self._lock:
+                image_ids = list(self._in_flight)
+            if not image_ids:
+                continue
+            db = SessionLocal()
+            try:
+                extend_leases(db, self.worker_id, image_ids)
+            except Exception as e:
+                logger.warning(f"Worker {self.worker_id} heartbeat failed: {e}")
+            finally:
+                db.close()
+
+    def _report_stats(self) -> None:
+        """Publish batching and cache statistics."""
+        from .batching import get_batch_stats
+        from .cache import get_result_cache
+        from .registry import get_registry_stats
+        from .similar import get_similar_index
+
+        with self._lock:
+            in_flight = len(self._in_flight)
+        self.publish({
+            "type": "stats",
+            "workerId": self.worker_id,
+            "ready": self.readiness["ready"],
+            "inFlight": in_flight,
+            "concurrency": self.concurrency,
+            "batching": get_batch_stats(),
+            "cache": get_result_cache().stats(),
+            "similar": get_similar_index().stats(),
+            "models": get_registry_stats(),
+            "metrics": metrics.snapshot(),
+            "spans": tracer.drain(),
+        })
+        self._advertise()
+
+
+def worker_main(
+    worker_id: str,
+    events=None,
+    models: Collection[str] = WORKER_MODELS,
+    stopping=None,
+    drain_seconds: float = WORKER_DRAIN_SECONDS,
+) -> None:
+    """
+    Entry point of a worker process.
+
+    Args:
+        stopping: Event set by the pool to stop the worker gracefully
+        drain_seconds: How long the stopping worker waits for its jobs
+    """
+    logging.basicConfig(level=logging.INFO)
+    # Ctrl+C reaches the whole process group; the pool stops its workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    tracer.process = f"worker {worker_id}"
+    tracer.shipping = events is not None
+
+    def publish(message: dict) -> None:
+        if events is None:
+            return
+        try:
+            events.put_nowait(message)
+        except queue.Full:
+            pass
+
+    worker = Worker(worker_id, publish, models=models, drain_seconds=drain_seconds)
+    if stopping is not None:
+        def watch() -> None:
+            stopping.wait()
+            worker.stop()
+
+        threading.Thread(target=watch, daemon=True).start()
+    worker.run()
+    if events is not None:
+        events.close()
+        events.join_thread()
+    # Job threads still running released jobs would hold up a normal exit
+    os._exit(0)
+
+
+class WorkerPool:
+    """Supervises worker processes and relays their messages."""
+
+    def __init__(self, processes: int = JOB_WORKERS, models: Collection[str] = WORKER_MODELS):
+        """
+        Initialize the pool.
+
+        Args:
+            processes: Number of worker processes. 0 runs one worker thread
+                inside the current process instead.
+            models: Models whose jobs the workers claim
+        """
+        self.processes = processes
+        self.models = tuple(models)
+        self._ctx = multiprocessing.get_context("spawn")
+        self.events = self._ctx.Queue(maxsize=10000)
+        # Set on shutdown: tells the worker processes to drain and exit
+        self._stopping = self._ctx.Event()
+        self._workers: dict[str, multiprocessing.Process] = {}
+        self._thread_worker: Optional[Worker] = None
+        self._thread_worker_thread: Optional[threading.Thread] = None
+        self._listeners: list[Publisher] = []
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self.worker_stats: dict[str, dict] = {}
+        self.worker_readiness: dict[str, dict] = {}
+        self.add_listener(self._record_stats)
+        self.add_listener(self._record_readiness)
+        self.add_listener(self._record_spans)
+
+    def add_listener(self, listener: Publisher) -> None:
+        """Register a callback for messages published by workers."""
+        self._listeners.append(listener)
+
+    def start(self) -> None:
+        """Start the workers and the relay/supervisor threads."""
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        if self.processes <= 0:
+            self._thread_worker = Worker(f"{prefix}-inline", self._dispatch, models=self.models)
+            self._thread_worker_thread = self._spawn_thread(self._thread_worker.run, "inline-worker")
+        else:
+            for index in range(self.processes):
+                self._start_process(f"{prefix}-w{index}")
+            self._spawn_thread(self._supervise, "worker-supervisor")
+        self._spawn_thread(self._relay, "worker-relay")
+
+    def stop(self, timeout: float = WORKER_DRAIN_SECONDS + 5) -> None:
+        """
+        Stop all workers.
+
+        Workers finish or release their jobs first (see Worker.run); those
+        still running after ``timeout`` seconds are terminated.
+        """
+        self._stop.set()
+        self._stopping.set()
+        if self._thread_worker:
+            self._thread_worker.stop()
+        deadline = time.monotonic() + timeout
+        if self._thread_worker_thread:
+            self._thread_worker_thread.join(timeout)
+        for process in self._workers.values():
+            process.join(max(deadline - time.monotonic(), 0))
+        for worker_id, process in self._workers.items():
+            if process.is_alive():
+                logger.warning(f"Worker {worker_id} did not stop within {timeout:.0f}s, terminating it")
+                process.terminate()
+                process.join(5)
+
+    def alive_workers(self) -> int:
+        """Number of workers currently running."""
+        if self._thread_worker:
+            return 1
+        return sum(1 for process in self._workers.values() if process.is_alive())
+
+    def ready_workers(self) -> int:
+        """Number of running workers whose model is loaded and warmed up."""
+        ready = [
+            worker_id for worker_id, state in self.worker_readiness.items() if state.get("ready")
+        ]
+        if self._thread_worker:
+            return len(ready)
+        return sum(
+            1 for worker_id in ready
+            if worker_id in self._workers and self._workers[worker_id].is_alive()
+        )
+
+    def worker_metrics(self) -> list:
+        """
+        Latest metrics snapshots of the worker processes.
+
+        An inline worker records into this process's registry and is skipped.
+        """
+        return [
+            stats["metrics"] for worker_id, stats in self.worker_stats.items()
+            if stats.get("metrics") and not (
+                self._thread_worker and worker_id == self._thread_worker.worker_id
+            )
+        ]
+
+    def _spawn_thread(self, target: Callable, name: str) -> threading.Thread:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return thread
+
+    def _start_process(self, worker_id: str) -> None:
+        process = self._ctx.Process(
+            target=worker_main,
+            args=(worker_id, self.events, self.models, self._stopping),
+            name=worker_id,
+            daemon=True,
+        )
+        process.start()
+        self._workers[worker_id] = process
+        logger.info(f"Started worker {worker_id} (pid {process.pid})")
+
+    def _supervise(self) -> None:
+        """Restart worker processes that died."""
+        while not self._stop.wait(1.0):
+            for worker_id, process in list(self._workers.items()):
+                if not process.is_alive() and not self._stop.is_set():
+                    logger.error(f"Worker {worker_id} exited with code {process.exitcode}, restarting")
+                    self.worker_readiness.pop(worker_id, None)
+                    self._start_process(worker_id)
+
+    def _relay(self) -> None:
+        """Forward messages from worker processes to the listeners."""
+        while not self._stop.is_set():
+            try:
+                message = self.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            self._dispatch(message)
+
+    def _dispatch(self, message: dict) -> None:
+        for listener in self._listeners:
+            try:
+                listener(message)
+            except Exception as e:
+                logger.warning(f"Worker message listener failed: {e}")
+
+    def _record_readiness(self, message: dict) -> None:
+        if message.get("type") == "ready":
+            self.worker_readiness[message["workerId"]] = {
+                k: v for k, v in message.items() if k not in ("type", "workerId")
+            }
+
+    def _record_stats(self, message: dict) -> None:
+        if message.get("type") == "stats":
+            self.worker_stats[message["workerId"]] = {
+                **{k: v for k, v in message.items() if k not in ("type", "workerId", "spans")},
+                "reportedAt": time.time(),
+            }
+
+    def _record_spans(self, message: dict) -> None:
+        if message.get("type") == "stats" and message.get("spans"):
+            tracer.add(message["spans"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run colorization workers")
+    parser.add_argument("--processes", type=int, default=max(JOB_WORKERS, 1))
+    parser.add_argument(
+        "--models", default=",".join(WORKER_MODELS),
+        help="Comma-separated models whose jobs this node claims (default: WORKER_MODELS)",
+    )
+    args = parser.parse_args()
+
+    models = [name for name in args.models.split(",") if name]
+    unknown = sorted(set(models) - set(MODELS))
+    if not models or unknown:
+        parser.error(f"--models must name models from MODELS ({', '.join(MODELS)})")
+
+    logging.basicConfig(level=logging.INFO)
+    pool = WorkerPool(args.processes, models)
+    pool.start()
+    # docker stop and Kubernetes send SIGTERM: drain and release jobs as on Ctrl+C
+    terminated = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: terminated.set())
+    try:
+        terminated.wait()
+    except KeyboardInterrupt:
+        pass
+    pool.stop()
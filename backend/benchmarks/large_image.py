@@ -0,0 +1,94 @@
+"""
+Benchmark the standard and large-image colorization paths.
+
+Each path runs in its own subprocess so that peak RSS is measured in
+isolation. Requires DeOldify and model weights.
+
+Usage (from backend/)::
+
+    python -m benchmarks.large_image --size 6000x4000 --runs 3
+"""
+import argparse
+import io
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+
+def make_test_image(width: int, height: int) -> bytes:
+    """Create a grayscale JPEG with enough structure to be realistic."""
+    import numpy as np
+    from PIL import Image
+
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = (127 + 60 * np.sin(x / 37.0) + 60 * np.cos(y / 53.0)).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, mode="L").save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def run_child(path: str, width: int, height: int, runs: int, render_factor: int) -> dict:
+    """Run one path in this process and report latency and peak RSS."""
+    from app.colorizer import ImageColorizer
+
+    data = make_test_image(width, height)
+    colorizer = ImageColorizer(render_factor=render_factor)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        colorizer.colorize_batch([data], render_factor, large=(path == "large"))
+        latencies.append(time.perf_counter() - started)
+
+    # ru_maxrss is in KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "path": path,
+        "size": f"{width}x{height}",
+        "runs": runs,
+        "latencyMeanS": statistics.mean(latencies),
+        "latencyMinS": min(latencies),
+        "peakRssMiB": peak_rss / 1024,
+        "peakRssAboveModelMiB": (peak_rss - baseline_rss) / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", default="6000x4000", help="WIDTHxHEIGHT of the test image")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--render-factor", type=int, default=35)
+    parser.add_argument("--child", choices=["standard", "large"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    if args.child:
+        print(json.dumps(run_child(args.child, width, height, args.runs, args.render_factor)))
+        return
+
+    from app.colorizer import DEOLDIFY_AVAILABLE
+    if not DEOLDIFY_AVAILABLE:
+        sys.exit("DeOldify is not available; install it and the model weights to run this benchmark.")
+
+    results = []
+    for path in ("standard", "large"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.large_image", "--child", path,
+             "--size", args.size, "--runs", str(args.runs),
+             "--render-factor", str(args.render_factor)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'path':<10}{'mean s':>10}{'min s':>10}{'peak RSS MiB':>15}{'above model':>14}")
+    for r in results:
+        print(f"{r['path']:<10}{r['latencyMeanS']:>10.2f}{r['latencyMinS']:>10.2f}"
+              f"{r['peakRssMiB']:>15.0f}{r['peakRssAboveModelMiB']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""
+End-to-end load benchmark of the API and workers.
+
+Drives the real FastAPI app (in-process through ASGI, or a running server
+with ``--url``) with N concurrent sessions. Each session uploads images one
+after another and long-polls each until it is completed. Meanwhile
+``--readers`` clients poll ``GET /api/stats``, a read of the whole images
+table, to measure reads while workers write. The benchmark reports
+upload->completed latency percentiles, throughput, read latency and the
+peak RSS of the API process and its workers.
+
+By default the workers use the deterministic stub model
+(``benchmarks.stub``), so results depend only on the pipeline; ``--real``
+uses DeOldify. Every image size runs in a fresh subprocess with its own
+database and storage, so runs do not share caches or memory.
+
+Usage (from backend/)::
+
+    python -m benchmarks.load --sizes 512x512 2048x1536 --sessions 1 4 16 --output bench.json
+    python -m benchmarks.load --compare baseline.json bench.json
+
+Results are JSON (one entry per size and session count) tagged with the
+git commit, so runs of different commits can be compared; ``--compare``
+exits with status 1 if p95 latency or throughput regressed by more than
+``--threshold``.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+STUB_FACTORY = "benchmarks.stub:create_stub"
+
+
+def make_image(width: int, height: int, seed: int) -> bytes:
+    """A grayscale JPEG, unique per seed so the result cache never hits."""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = 127 + 60 * np.sin(x / 37.0 + seed) + 60 * np.cos(y / 53.0)
+    pixels += rng.normal(0, 4, size=pixels.shape)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), mode="L").save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Linearly interpolated percentile (q in 0-100)."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(latencies: list[float]) -> dict:
+    """Latency percentiles in seconds."""
+    return {
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.fmean(latencies) if latencies else float("nan"),
+        "max": max(latencies, default=float("nan")),
+    }
+
+
+def _rss_kib(pid: int) -> int:
+    """Resident set size of a process from /proc (Linux)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid: int) -> list[int]:
+    """All descendants of a process (Linux)."""
+    parents: dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+    found, stack = [], [pid]
+    while stack:
+        for child in parents.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+class RssSampler:
+    """Samples the RSS of this process and its descendants in the background."""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak_self = 0
+        self.peak_children = 0
+        self.peak_total = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> "RssSampler":
+        if os.path.isdir("/proc"):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        # ru_maxrss is in KiB on Linux
+        self.peak_self = max(self.peak_self, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+    def _run(self) -> None:
+        pid = os.getpid()
+        while not self._stop.wait(self.interval):
+            own = _rss_kib(pid)
+            children = sum(_rss_kib(child) for child in _children(pid))
+            self.peak_self = max(self.peak_self, own)
+            self.peak_children = max(self.peak_children, children)
+            self.peak_total = max(self.peak_total, own + children)
+
+    def result(self) -> dict:
+        return {
+            "apiMiB": round(self.peak_self / 1024, 1),
+            "workersMiB": round(self.peak_children / 1024, 1),
+            "totalMiB": round(self.peak_total / 1024, 1),
+        }
+
+
+async def run_session(client, session_index: int, images: list[bytes], timeout: float) -> tuple[list, int]:
+    """Upload images one by one and wait for each; returns (latencies, failures)."""
+    response = await client.post("/api/session")
+    headers = {"X-Session-ID": response.json()["sessionId"]}
+    latencies, failures = [], 0
+    for index, data in enumerate(images):
+        started = time.perf_counter()
+        response = await client.post(
+            "/api/images",
+            headers=headers,
+            files={"file": (f"s{session_index}-{index}.jpg", data, "image/jpeg")},
+        )
+        if response.status_code != 200:
+            failures += 1
+            continue
+        image_id, status = response.json()["id"], response.json()["status"]
+        deadline = started + timeout
+        while status not in ("completed", "failed") and time.perf_counter() < deadline:
+            response = await client.get(
+                f"/api/images/{image_id}/status",
+                headers=headers,
+                params={"wait": 25, "known": status},
+            )
+            status = response.json()["status"]
+        if status == "completed":
+            latencies.append(time.perf_counter() - started)
+        else:
+            failures += 1
+    return latencies, failures
+
+
+async def run_reader(client, stop: asyncio.Event, interval: float) -> list[float]:
+    """Poll the queue statistics until stopped; returns the request latencies."""
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/api/stats")
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - started)
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+    return latencies
+
+
+async def run_scenario(
+    client,
+    size: tuple[int, int],
+    sessions: int,
+    per_session: int,
+    timeout: float,
+    seed: int,
+    readers: int = 0,
+    read_interval: float = 0.05,
+) -> dict:
+    """N concurrent sessions, each uploading ``per_session`` images, plus polling readers."""
+    width, height = size
+    images = [
+        [make_image(width, height, seed + s * per_session + i) for i in range(per_session)]
+        for s in range(sessions)
+    ]
+    stop = asyncio.Event()
+    reader_tasks = [asyncio.create_task(run_reader(client, stop, read_interval)) for _ in range(readers)]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        run_session(client, s, images[s], timeout) for s in range(sessions)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    reads = [latency for reader in await asyncio.gather(*reader_tasks) for latency in reader]
+    latencies = [latency for session, _ in results for latency in session]
+    return {
+        "size": f"{width}x{height}",
+        "sessions": sessions,
+        "images": sessions * per_session,
+        "completed": len(latencies),
+        "failed": sum(failures for _, failures in results),
+        "wallSeconds": round(elapsed, 3),
+        "throughputPerSecond": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latencySeconds": {name: round(value, 4) for name, value in summarize(latencies).items()},
+        "reads": len(reads),
+        "readLatencySeconds": {name: round(value, 4) for name, value in summarize(reads).items()},
+    }
+
+
+async def wait_until_ready(client, timeout: float) -> None:
+    """Wait for a worker to load and warm up its model."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = await client.get("/readyz")
+        if response.status_code == 200:
+            return
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Workers not ready after {timeout:.0f}s: {response.text}")
+
+
+async def run_child(args) -> list[dict]:
+    """Run all session counts for one image size against one app instance."""
+    import httpx
+
+    size = tuple(int(v) for v in args.child.lower().split("x"))
+    results = []
+
+    async def scenarios(client):
+        await wait_until_ready(client, args.ready_timeout)
+        # One untimed image so the first scenario does not pay for lazy setup
+        await run_scenario(client, size, 1, 1, args.timeout, seed=10**6)
+        for index, sessions in enumerate(args.sessions):
+            with RssSampler() as rss:
+                result = await run_scenario(
+                    client, size, sessions, args.images_per_session, args.timeout, seed=index * 10**4,
+                    readers=args.readers, read_interval=args.read_interval_ms / 1000,
+                )
+            results.append({**result, "peakRss": rss.result()})
+
+    limits = httpx.Limits(max_connections=None)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+            await scenarios(client)
+        return results
+
+    from app.main import app
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60, limits=limits) as client:
+            await scenarios(client)
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    """Run every image size in its own subprocess and collect the results."""
+    results = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory(prefix="colorizer-bench-") as workdir:
+            env = {
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{Path(workdir) / 'bench.db'}",
+                "STORAGE_DIR": str(Path(workdir) / "storage"),
+                "JOB_WORKERS": str(args.workers),
+                "JOB_QUEUE_LIMIT": str(10**6),
+                "STUB_COST_MS": str(args.stub_cost_ms),
+                "STUB_BATCH_OVERHEAD_MS": str(args.stub_batch_overhead_ms),
+            }
+            if not args.real:
+                env["COLORIZER_FACTORY"] = STUB_FACTORY
+            command = [
+                sys.executable, "-m", "benchmarks.load", "--child", size,
+                "--sessions", *map(str, args.sessions),
+                "--images-per-session", str(args.images_per_session),
+                "--readers", str(args.readers),
+                "--read-interval-ms", str(args.read_interval_ms),
+                "--timeout", str(args.timeout),
+                "--ready-timeout", str(args.ready_timeout),
+            ]
+            if args.url:
+                command += ["--url", args.url]
+            print(f"Running {size} ...", file=sys.stderr)
+            output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+            results.extend(json.loads(output.strip().splitlines()[-1]))
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "model": "deoldify" if args.real else "stub",
+            "stubCostMs": None if args.real else args.stub_cost_ms,
+            "stubBatchOverheadMs": None if args.real else args.stub_batch_overhead_ms,
+            "workers": args.workers,
+            "imagesPerSession": args.images_per_session,
+            "readers": args.readers,
+            "url": args.url,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> int:
+    """Print p95 latency, throughput and read p95 changes; 1 if anything regressed beyond threshold."""
+    def index(report):
+        return {(r["size"], r["sessions"]): r for r in report["results"]}
+
+    old, new = index(baseline), index(current)
+    print(f"{baseline.get('commit')} -> {current.get('commit')}")
+    print(f"{'size':<12}{'sessions':>9}{'p95 s':>16}{'change':>9}{'img/s':>16}{'change':>9}{'read p95 s':>16}{'change':>9}")
+    regressed = False
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        p95_before, p95_after = before["latencySeconds"]["p95"], after["latencySeconds"]["p95"]
+        tput_before, tput_after = before["throughputPerSecond"], after["throughputPerSecond"]
+        p95_change = p95_after / p95_before - 1 if p95_before else 0.0
+        tput_change = tput_after / tput_before - 1 if tput_before else 0.0
+        flag = ""
+        if p95_change > threshold or tput_change < -threshold:
+            regressed, flag = True, "  REGRESSION"
+        reads = ""
+        if before.get("reads") and after.get("reads"):
+            read_before, read_after = before["readLatencySeconds"]["p95"], after["readLatencySeconds"]["p95"]
+            read_change = read_after / read_before - 1 if read_before else 0.0
+            if read_change > threshold:
+                regressed, flag = True, "  REGRESSION"
+            reads = f"{read_before:>7.3f} ->{read_after:>6.3f}{read_change:>+9.1%}"
+        print(
+            f"{key[0]:<12}{key[1]:>9}{p95_before:>7.3f} ->{p95_after:>6.3f}{p95_change:>+9.1%}"
+            f"{tput_before:>7.2f} ->{tput_after:>6.2f}{tput_change:>+9.1%}{reads}{flag}"
+        )
+    return 1 if regressed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", nargs="+", default=["512x512", "2048x1536"], help="WIDTHxHEIGHT of the images")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16], help="Concurrent session counts")
+    parser.add_argument("--images-per-session", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=2, help="Clients polling /api/stats during the run")
+    parser.add_argument("--read-interval-ms", type=float, default=50.0, help="Pause between a reader's requests")
+    parser.add_argument("--workers", type=int, default=1, help="JOB_WORKERS for the app")
+    parser.add_argument("--stub-cost-ms", type=float, default=50.0, help="Stub CPU time per image")
+    parser.add_argument("--stub-batch-overhead-ms", type=float, default=20.0, help="Stub CPU time per batch")
+    parser.add_argument("--real", action="store_true", help="Use DeOldify instead of the stub")
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-image completion timeout")
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two reports")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative regression")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        baseline, current = (json.loads(Path(path).read_text()) for path in args.compare)
+        return compare(baseline, current, args.threshold)
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_child(args))))
+        return 0
+
+    if args.real:
+        from app.colorizer import DEOLDIFY_AVAILABLE
+        if not DEOLDIFY_AVAILABLE:
+            sys.exit("DeOldify is not available; install it and the model weights, or drop --real.")
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        Path(args.output).write_text(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Deterministic CPU stand-in for ImageColorizer.
+
+Decodes and encodes images like the real colorizer and spends a fixed,
+configurable amount of CPU time per batch and per image instead of running
+the generator, so the rest of the pipeline (uploads, queue, workers,
+storage, derivatives) can be benchmarked without DeOldify or a GPU.
+Enable it with::
+
+    COLORIZER_FACTORY=benchmarks.stub:create_stub
+
+The cost per image scales with the square of render_factor (the model input
+is render_factor * 16 pixels square), relative to STUB_RENDER_FACTOR.
+"""
+import os
+import time
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.colorizer import ImageColorizer
+
+STUB_COST_MS = float(os.getenv("STUB_COST_MS", "50"))
+STUB_BATCH_OVERHEAD_MS = float(os.getenv("STUB_BATCH_OVERHEAD_MS", "20"))
+STUB_RENDER_FACTOR = 35
+
+
+def burn_cpu(seconds: float) -> None:
+    """Keep one core busy for ``seconds`` (NumPy releases the GIL like torch does)."""
+    deadline = time.perf_counter() + seconds
+    work = np.ones((64, 64), dtype=np.float32)
+    while time.perf_counter() < deadline:
+        work = np.tanh(work @ work)
+
+
+class StubColorizer:
+    """Colorizer with the interface of ImageColorizer and a synthetic cost."""
+
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        render_factor: int = 35,
+        cost_ms: float = STUB_COST_MS,
+        batch_overhead_ms: float = STUB_BATCH_OVERHEAD_MS,
+    ):
+        self.model_path = model_path or "stub"
+        self.render_factor = render_factor
+        self.cost = cost_ms / 1000.0
+        self.batch_overhead = batch_overhead_ms / 1000.0
+
+    def image_cost(self, render_factor: int) -> float:
+        """Seconds of CPU spent per image at a render_factor."""
+        return self.cost * (render_factor / STUB_RENDER_FACTOR) ** 2
+
+    @staticmethod
+    def tint(image: Image.Image) -> Image.Image:
+        """Deterministic 'colorization': map luminance onto a sepia ramp."""
+        return ImageOps.colorize(image.convert("L"), black=(30, 20, 10), white=(255, 240, 215))
+
+    def colorize_batch(
+        self,
+        images: list,
+        render_factor: Optional[int] = None,
+        large: bool = False,
+    ) -> list[tuple[bytes, str]]:
+        originals = [ImageColorizer.load_image(source) for source in images]
+        return [
+            (ImageColorizer.encode_image(image), "image/jpeg")
+            for image in self.colorize_images(originals, render_factor)
+        ]
+
+    def colorize_images(self, images: list, render_factor: Optional[int] = None) -> list:
+        render_factor = render_factor or self.render_factor
+        burn_cpu(self.batch_overhead + self.image_cost(render_factor) * len(images))
+        return [self.tint(image) for image in images]
+
+    def predict_frames(self, frames: list, render_factor: Optional[int] = None) -> list:
+        render_factor = render_factor or self.render_factor
+        burn_cpu(self.batch_overhead + self.image_cost(render_factor) * len(frames))
+        size = render_factor * 16
+        return [np.asarray(self.tint(Image.fromarray(frame).resize((size, size)))) for frame in frames]
+
+    def warm_up(self, size: int = 64) -> None:
+        self.colorize_batch([Image.new("RGB", (size, size), (128, 128, 128))])
+
+    def memory_bytes(self) -> int:
+        return 0
+
+    def release(self) -> None:
+        pass
+
+
+def create_stub(model_path: str, artistic: bool, device: Optional[str], render_factor: int) -> StubColorizer:
+    """Factory for COLORIZER_FACTORY."""
+    return StubColorizer(model_path, render_factor)
@@ -0,0 +1,305 @@
+"""
+Speed/quality sweep over render_factor and inference backend.
+
+Takes a folder of colour photographs as ground truth, converts them to
+grayscale, colorizes them at every render_factor of the sweep with every
+backend, and scores the results against the originals with PSNR and SSIM
+(computed over the whole batch at once with NumPy). Each setting runs in a
+fresh subprocess, so its latency and peak RSS are measured in isolation.
+
+The report lists every setting with its latency, throughput, peak memory
+and quality, and marks the Pareto-optimal ones: no other setting is at
+least as fast with at least the same PSNR and SSIM. These are the
+candidates for the default render_factor of each tier.
+
+By default the stub model (``benchmarks.stub``) is used, which only
+exercises the harness (its cost follows render_factor, its colours do
+not); ``--real`` uses DeOldify. Without ``--images`` a few synthetic colour
+images are used.
+
+Usage (from backend/)::
+
+    python -m benchmarks.sweep --real --images ../ml/data/eval --render-factors 15 25 35 45 \\
+        --backends eager onnx onnx-int8 --output sweep.json
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.load import STUB_FACTORY, git_commit, percentile
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+# SSIM constants of Wang et al. (2004) for 8-bit images
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+
+
+def _gaussian_kernel(size: int = 11, sigma: float = 1.5) -> np.ndarray:
+    offsets = np.arange(size, dtype=np.float32) - (size - 1) / 2
+    kernel = np.exp(-(offsets ** 2) / (2 * sigma ** 2))
+    return kernel / kernel.sum()
+
+
+def _blur(x: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """Separable 'valid' Gaussian blur over the H and W axes of an (N, H, W, C) batch."""
+    size = len(kernel)
+    height, width = x.shape[1] - size + 1, x.shape[2] - size + 1
+    rows = sum(weight * x[:, i:i + height] for i, weight in enumerate(kernel))
+    return sum(weight * rows[:, :, i:i + width] for i, weight in enumerate(kernel))
+
+
+def psnr(reference: np.ndarray, output: np.ndarray) -> np.ndarray:
+    """
+    PSNR in dB of each image of a batch.
+
+    Args:
+        reference, output: uint8 arrays of shape (N, H, W, 3)
+
+    Returns:
+        float array of shape (N,)
+    """
+    error = reference.astype(np.float32) - output.astype(np.float32)
+    mse = np.square(error).mean(axis=(1, 2, 3))
+    with np.errstate(divide="ignore"):
+        return 10 * np.log10(255.0 ** 2 / mse)
+
+
+def ssim(reference: np.ndarray, output: np.ndarray) -> np.ndarray:
+    """
+    Mean SSIM of each image of a batch (11x11 Gaussian window, averaged over channels).
+
+    Args:
+        reference, output: uint8 arrays of shape (N, H, W, C)
+
+    Returns:
+        float array of shape (N,)
+    """
+    kernel = _gaussian_kernel()
+    x, y = reference.astype(np.float32), output.astype(np.float32)
+    mu_x, mu_y = _blur(x, kernel), _blur(y, kernel)
+    var_x = _blur(x * x, kernel) - mu_x * mu_x
+    var_y = _blur(y * y, kernel) - mu_y * mu_y
+    cov = _blur(x * y, kernel) - mu_x * mu_y
+    score = ((2 * mu_x * mu_y + _SSIM_C1) * (2 * cov + _SSIM_C2)) / (
+        (mu_x * mu_x + mu_y * mu_y + _SSIM_C1) * (var_x + var_y + _SSIM_C2)
+    )
+    return score.mean(axis=(1, 2, 3))
+
+
+def load_ground_truth(folder: Optional[str], size: int, limit: int) -> np.ndarray:
+    """
+    Colour images as one batch: centre-cropped to a square and resized.
+
+    Without a folder, smooth random colour fields stand in for photographs.
+
+    Returns:
+        uint8 array of shape (N, size, size, 3)
+    """
+    if folder is None:
+        rng = np.random.default_rng(0)
+        return np.stack([
+            np.asarray(Image.fromarray(rng.integers(0, 256, (6, 6, 3), dtype=np.uint8)).resize(
+                (size, size), Image.Resampling.BICUBIC
+            ))
+            for _ in range(limit)
+        ])
+
+    paths = sorted(
+        path for path in Path(folder).rglob("*") if path.suffix.lower() in IMAGE_EXTENSIONS
+    )[:limit]
+    if not paths:
+        sys.exit(f"No images found in {folder}")
+    images = []
+    for path in paths:
+        image = Image.open(path).convert("RGB")
+        side = min(image.size)
+        left, top = (image.width - side) // 2, (image.height - side) // 2
+        image = image.crop((left, top, left + side, top + side))
+        images.append(np.asarray(image.resize((size, size), Image.Resampling.LANCZOS)))
+    return np.stack(images)
+
+
+def parse_backend(spec: str) -> tuple[str, bool]:
+    """Split a backend name like ``onnx-int8`` into (backend, quantized)."""
+    backend, _, variant = spec.partition("-")
+    return backend, variant == "int8"
+
+
+def load_colorizer(backend_spec: str, render_factor: int, real: bool):
+    """The colorizer of a setting: DeOldify with the backend, or the stub."""
+    from app.registry import get_model_registry, import_factory, is_artistic
+
+    model_path = get_model_registry().weights()
+    if not real:
+        return import_factory(STUB_FACTORY)(model_path, False, None, render_factor)
+    from app.colorizer import ImageColorizer
+
+    backend, quantized = parse_backend(backend_spec)
+    return ImageColorizer(
+        model_path, render_factor, artistic=is_artistic(model_path), backend=backend, quantized=quantized
+    )
+
+
+def run_child(args) -> dict:
+    """Measure one (backend, render_factor) setting in this process."""
+    backend_spec, render_factor = args.child.rsplit(":", 1)
+    render_factor = int(render_factor)
+    truth = load_ground_truth(args.images, args.size, args.limit)
+    grays = [Image.fromarray(image).convert("L").convert("RGB") for image in truth]
+
+    colorizer = load_colorizer(backend_spec, render_factor, args.real)
+    # One untimed batch pays for lazy setup (allocator growth, backend loading)
+    colorizer.colorize_images(grays[:1], render_factor)
+    exported = getattr(colorizer, "_runners", {}).get(render_factor) is not None
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    outputs, latencies = [], []
+    for start in range(0, len(grays), args.batch_size):
+        batch = grays[start:start + args.batch_size]
+        started = time.perf_counter()
+        outputs.extend(colorizer.colorize_images(batch, render_factor))
+        latencies.append(time.perf_counter() - started)
+    # ru_maxrss is in KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    produced = np.stack([np.asarray(image.convert("RGB")) for image in outputs])
+    scores_psnr, scores_ssim = psnr(truth, produced), ssim(truth, produced)
+    total = sum(latencies)
+    result = {
+        "backend": backend_spec,
+        "renderFactor": render_factor,
+        "exported": exported,
+        "images": len(grays),
+        "msPerImage": round(total / len(grays) * 1000, 2),
+        "imagesPerSecond": round(len(grays) / total, 3),
+        "batchLatencySeconds": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+        },
+        "psnr": round(float(np.mean(scores_psnr[np.isfinite(scores_psnr)])), 3),
+        "psnrStdev": round(statistics.pstdev(scores_psnr[np.isfinite(scores_psnr)].tolist()), 3),
+        "ssim": round(float(np.mean(scores_ssim)), 4),
+        "peakRssMiB": round(peak_rss / 1024, 1),
+        "peakRssAboveModelMiB": round((peak_rss - baseline_rss) / 1024, 1),
+    }
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        result["peakCudaMiB"] = round(torch.cuda.max_memory_allocated() / 2**20, 1)
+    return result
+
+
+def pareto(results: list[dict]) -> list[dict]:
+    """
+    Mark the settings no other setting dominates.
+
+    A setting is dominated when another one is at least as fast
+    (msPerImage) with at least the same PSNR and SSIM, and strictly better
+    in one of them.
+    """
+    def dominates(a: dict, b: dict) -> bool:
+        no_worse = a["msPerImage"] <= b["msPerImage"] and a["psnr"] >= b["psnr"] and a["ssim"] >= b["ssim"]
+        better = a["msPerImage"] < b["msPerImage"] or a["psnr"] > b["psnr"] or a["ssim"] > b["ssim"]
+        return no_worse and better
+
+    return [
+        {**result, "pareto": not any(dominates(other, result) for other in results)}
+        for result in results
+    ]
+
+
+def table(results: list[dict]) -> str:
+    """Markdown table of the settings, fastest first; Pareto-optimal ones are starred."""
+    lines = [
+        "| backend | render_factor | ms/image | images/s | p95 batch s | PSNR dB | SSIM | peak RSS MiB | Pareto |",
+        "|---|---:|---:|---:|---:|---:|---:|---:|:---:|",
+    ]
+    for result in sorted(results, key=lambda result: (result["msPerImage"], -result["psnr"])):
+        backend = result["backend"] + ("" if result["exported"] or result["backend"] == "eager" else " (eager)")
+        lines.append(
+            f"| {backend} | {result['renderFactor']} | {result['msPerImage']:.1f} | "
+            f"{result['imagesPerSecond']:.2f} | {result['batchLatencySeconds']['p95']:.3f} | "
+            f"{result['psnr']:.2f} | {result['ssim']:.4f} | {result['peakRssMiB']:.0f} | "
+            f"{'★' if result['pareto'] else ''} |"
+        )
+    return "\n".join(lines)
+
+
+def run(args) -> dict:
+    """Run every setting in its own subprocess and collect the results."""
+    env = dict(os.environ)
+    if not args.real:
+        env["COLORIZER_FACTORY"] = STUB_FACTORY
+    results = []
+    for backend in args.backends:
+        for render_factor in args.render_factors:
+            command = [
+                sys.executable, "-m", "benchmarks.sweep", "--child", f"{backend}:{render_factor}",
+                "--size", str(args.size), "--limit", str(args.limit), "--batch-size", str(args.batch_size),
+            ]
+            if args.images:
+                command += ["--images", args.images]
+            if args.real:
+                command.append("--real")
+            print(f"Running {backend} at render_factor {render_factor} ...", file=sys.stderr)
+            output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "model": "deoldify" if args.real else "stub",
+            "images": args.images,
+            "size": args.size,
+            "limit": args.limit,
+            "batchSize": args.batch_size,
+        },
+        "results": pareto(results),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--images", help="Folder of colour ground-truth images (default: synthetic)")
+    parser.add_argument("--render-factors", type=int, nargs="+", default=[10, 15, 20, 25, 30, 35, 40, 45])
+    parser.add_argument(
+        "--backends", nargs="+", default=["eager"],
+        help="eager, torchscript, onnx or onnx-int8 (exports come from python -m app.export)",
+    )
+    parser.add_argument("--size", type=int, default=512, help="Side of the square evaluation images")
+    parser.add_argument("--limit", type=int, default=32, help="Number of images")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--real", action="store_true", help="Use DeOldify instead of the stub")
+    parser.add_argument("--output", help="Write the JSON report here (the table goes to stdout)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return 0
+
+    if args.real:
+        from app.colorizer import DEOLDIFY_AVAILABLE
+        if not DEOLDIFY_AVAILABLE:
+            sys.exit("DeOldify is not available; install it and the model weights, or drop --real.")
+
+    report = run(args)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    print(table(report["results"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
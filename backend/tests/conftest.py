@@ -0,0 +1,12 @@
+"""
+Shared test setup.
+
+Points the application at a throwaway database and storage directory before
+any app module is imported, so tests never touch the development data.
+"""
+import os
+import tempfile
+
+_test_dir = tempfile.mkdtemp(prefix="colorizer-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_test_dir}/test.db")
+os.environ.setdefault("STORAGE_DIR", _test_dir)
@@ -3,10 +3,20 @@ Basic API tests.
 """
 import pytest
 from fastapi.testclient import TestClient
+from app.database import SessionLocal, init_db
 from app.main import app
+from app.models import Image
 
 client = TestClient(app)
 
+HEADERS = {"X-Session-ID": "a" * 32}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def database():
+    """Create the tables (the app's startup event, which also starts workers, is not run)."""
+    init_db()
+
 
 def test_root():
     """Test root endpoint."""
@@ -17,13 +27,71 @@ def test_root():
 
 def test_list_images_empty():
     """Test listing images when empty."""
-    response = client.get("/api/images")
+    response = client.get("/api/images", headers=HEADERS)
     assert response.status_code == 200
     assert isinstance(response.json(), list)
 
 
+def test_list_images_requires_session():
+    """Test that requests without a session are rejected."""
+    assert client.get("/api/images").status_code == 401
+
+
 def test_get_nonexistent_image():
     """Test getting non-existent image."""
-    response = client.get("/api/images/99999")
+    response = client.get("/api/images/99999", headers=HEADERS)
     assert response.status_code == 404
 
+
+def test_probes_before_workers_are_ready():
+    """Test that liveness passes while readiness waits for a warmed-up worker."""
+    assert client.get("/healthz").status_code == 200
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    body = response.json()
+    assert body["database"]["ok"] and body["workers"]["ready"] == 0
+
+
+def test_frontend_build_does_not_shadow_probes(monkeypatch, tmp_path):
+    """Test that with a built frontend the SPA serves unknown paths but not the probes or API."""
+    import app.main as main
+
+    (tmp_path / "index.html").write_text("<html>spa</html>")
+    monkeypatch.setattr(main, "frontend_dist", str(tmp_path))
+    assert client.get("/").text == "<html>spa</html>"
+    assert client.get("/gallery/42").text == "<html>spa</html>"
+    assert client.get("/healthz").json() == {"status": "ok"}
+    assert client.get("/readyz").status_code == 503
+    assert client.get("/api/images", headers=HEADERS).status_code == 200
+    assert client.get("/api/missing").status_code == 404
+
+
+def test_unknown_model_is_rejected():
+    """Test that uploads can only choose a configured model."""
+    models = client.get("/api/models").json()
+    assert models["default"] in [model["name"] for model in models["models"]]
+    response = client.post(
+        "/api/images",
+        headers=HEADERS,
+        files={"file": ("a.png", b"\x89PNG\r\n\x1a\n", "image/png")},
+        data={"model": "missing"},
+    )
+    assert response.status_code == 400
+
+
+def test_cancel_image():
+    """Test that a queued image can be cancelled once, and only by its session."""
+    db = SessionLocal()
+    try:
+        image = Image(original_key="0" * 64, session_id=HEADERS["X-Session-ID"])
+        db.add(image)
+        db.commit()
+        image_id = image.id
+    finally:
+        db.close()
+
+    assert client.post(f"/api/images/{image_id}/cancel", headers={"X-Session-ID": "b" * 32}).status_code == 404
+    response = client.post(f"/api/images/{image_id}/cancel", headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+    assert client.post(f"/api/images/{image_id}/cancel", headers=HEADERS).status_code == 409
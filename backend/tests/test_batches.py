@@ -0,0 +1,74 @@
+"""
+Tests for bulk ingestion and streamed ZIP downloads.
+"""
+import io
+import tarfile
+import zipfile
+
+from PIL import Image
+
+from app import batches
+from app.storage import BlobStore
+
+
+def make_jpeg(color: tuple) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 24), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_ingest_zip_skips_non_images(tmp_path):
+    """Test that archive entries are filtered and stored one by one."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("scans/a.jpg", make_jpeg((255, 0, 0)))
+        zf.writestr("scans/b.jpg", make_jpeg((0, 255, 0)))
+        zf.writestr("scans/notes.txt", b"hello")
+        zf.writestr("__MACOSX/scans/._a.jpg", b"junk")
+    archive.seek(0)
+
+    store = BlobStore(tmp_path)
+    result = batches.ingest_uploads([("scans.zip", "application/zip", archive)], store)
+
+    assert [f.filename for f in result.files] == ["scans/a.jpg", "scans/b.jpg"]
+    assert all(store.exists(f.key) and (f.width, f.height) == (32, 24) for f in result.files)
+    assert result.skipped == [{"filename": "scans/notes.txt", "reason": "not an image"}]
+
+
+def test_ingest_tar_and_plain_files(tmp_path, monkeypatch):
+    """Test streamed TAR extraction, plain parts and the per-file size limit."""
+    monkeypatch.setattr(batches, "MAX_UPLOAD_BYTES", 2000)
+    big = b"\xff\xd8\xff" + bytes(3000)
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as tf:
+        for name, data in (("c.jpg", make_jpeg((0, 0, 255))), ("big.jpg", big)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    archive.seek(0)
+
+    result = batches.ingest_uploads(
+        [
+            ("scans.tar.gz", "application/gzip", archive),
+            ("d.jpg", "image/jpeg", io.BytesIO(make_jpeg((9, 9, 9)))),
+        ],
+        BlobStore(tmp_path),
+    )
+    assert [f.filename for f in result.files] == ["c.jpg", "d.jpg"]
+    assert result.skipped == [{"filename": "big.jpg", "reason": "file too large"}]
+
+
+def test_stream_zip_roundtrip(tmp_path):
+    """Test that the streamed archive is a valid ZIP with unique names."""
+    store = BlobStore(tmp_path)
+    first, second = store.put(make_jpeg((1, 2, 3))), store.put(make_jpeg((4, 5, 6)))
+    used: set = set()
+    entries = [
+        (batches.archive_name("dir/scan.tif", 1, "image/jpeg", used), store, first),
+        (batches.archive_name("scan.jpg", 2, "image/jpeg", used), store, second),
+    ]
+
+    data = b"".join(batches.stream_zip(entries))
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.namelist() == ["scan_colorized.jpg", "scan_colorized_2.jpg"]
+        assert zf.read("scan_colorized_2.jpg") == store.get(second)
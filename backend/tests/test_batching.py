@@ -0,0 +1,92 @@
+"""
+Tests for the micro-batching scheduler.
+"""
+import threading
+from app.batching import BatchScheduler
+
+
+class FakeColorizer:
+    """Colorizer double that records the batches it receives.
+
+    Also acts as a registry holding itself as the only model.
+    """
+    render_factor = 35
+
+    def __init__(self, fail_on: bytes = None):
+        self.batches = []
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+
+    def resolve(self, name=None):
+        return name or "default"
+
+    def get(self, name=None):
+        return self
+
+    def colorize_batch(self, images, render_factor, large=False):
+        with self.lock:
+            self.batches.append((render_factor, list(images)))
+        if self.fail_on in images:
+            raise RuntimeError("bad image")
+        return [(data[::-1], "image/jpeg") for data in images]
+
+
+def test_jobs_are_batched_by_render_factor():
+    """Test that queued jobs are grouped per render_factor."""
+    colorizer = FakeColorizer()
+    scheduler = BatchScheduler(colorizer, max_batch_size=3, max_wait_ms=200)
+    futures = [scheduler.submit(b"a%d" % i, 20 if i % 2 else 35) for i in range(5)]
+    results = [f.result(timeout=5) for f in futures]
+    scheduler.shutdown()
+
+    assert results[1] == (b"1a", "image/jpeg")
+    assert sorted((rf, len(images)) for rf, images in colorizer.batches) == [(20, 2), (35, 3)]
+    assert scheduler.stats()["images"] == 5
+
+
+def test_failed_batch_is_retried_individually():
+    """Test that one bad image only fails its own job."""
+    colorizer = FakeColorizer(fail_on=b"bad")
+    scheduler = BatchScheduler(colorizer, max_batch_size=2, max_wait_ms=200)
+    good, bad = scheduler.submit(b"ok"), scheduler.submit(b"bad")
+    assert good.result(timeout=5) == (b"ko", "image/jpeg")
+    assert isinstance(bad.exception(timeout=5), RuntimeError)
+    scheduler.shutdown()
+
+    stats = scheduler.stats()
+    assert stats["images"] == 2 and stats["batchSizeHistogram"] == {1: 2}
+
+
+class FakeRegistry(FakeColorizer):
+    """Two models sharing one batch log."""
+
+    def __init__(self):
+        super().__init__()
+        self.loads = []
+
+    def get(self, name=None):
+        self.loads.append(name)
+        registry = self
+
+        class Model:
+            def colorize_batch(self, images, render_factor, large=False):
+                return registry.colorize_batch([name.encode() + data for data in images], render_factor)
+        return Model()
+
+
+def test_jobs_are_batched_by_model():
+    """Test that jobs for different models never share a batch."""
+    registry = FakeRegistry()
+    scheduler = BatchScheduler(registry, max_batch_size=4, max_wait_ms=200)
+    futures = [
+        scheduler.submit(b"%d" % i, model="artistic" if i % 2 else "stable")
+        for i in range(4)
+    ]
+    results = [f.result(timeout=5) for f in futures]
+    scheduler.shutdown()
+
+    assert results[1] == (b"1citsitra", "image/jpeg")
+    assert sorted(registry.loads) == ["artistic", "stable"]
+    assert sorted(images for _, images in registry.batches) == [
+        [b"artistic1", b"artistic3"], [b"stable0", b"stable2"]
+    ]
@@ -0,0 +1,71 @@
+"""
+Tests for the benchmark harness helpers and the stub colorizer.
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+from app.registry import ModelRegistry, import_factory
+from benchmarks.load import compare, percentile
+from benchmarks.stub import StubColorizer
+from benchmarks.sweep import pareto, psnr, ssim
+
+
+def test_stub_is_deterministic_and_pluggable():
+    """Test that the stub loads through the registry and gives stable output."""
+    registry = ModelRegistry(
+        {"stable": "stable.pth"}, "stable", 0, loader=import_factory("benchmarks.stub:create_stub")
+    )
+    stub = registry.get()
+    assert isinstance(stub, StubColorizer)
+    stub.cost = stub.batch_overhead = 0
+
+    buffer = io.BytesIO()
+    Image.new("L", (8, 8), 100).save(buffer, format="PNG")
+    first = stub.colorize_batch([buffer.getvalue()])
+    assert first == stub.colorize_batch([buffer.getvalue()])
+    assert first[0][1] == "image/jpeg"
+    assert stub.image_cost(70) == 4 * stub.image_cost(35)
+
+
+def test_percentile_interpolates():
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert percentile([5.0], 95) == 5.0
+
+
+def test_compare_flags_regressions():
+    """Test that a slower p95 beyond the threshold fails the comparison."""
+    def report(p95, throughput):
+        return {"results": [{
+            "size": "512x512", "sessions": 4,
+            "latencySeconds": {"p95": p95}, "throughputPerSecond": throughput,
+        }]}
+
+    assert compare(report(1.0, 10.0), report(1.05, 10.0), threshold=0.1) == 0
+    assert compare(report(1.0, 10.0), report(1.5, 10.0), threshold=0.1) == 1
+    assert compare(report(1.0, 10.0), report(1.0, 8.0), threshold=0.1) == 1
+
+
+def test_quality_metrics_are_batched_per_image():
+    """Test that PSNR/SSIM score each image of a batch and fall with more noise."""
+    rng = np.random.default_rng(0)
+    reference = rng.integers(0, 256, (3, 40, 40, 3)).astype(np.uint8)
+    noise = rng.normal(0, 1, reference.shape) * np.array([0, 5, 20])[:, None, None, None]
+    output = np.clip(reference + noise, 0, 255).astype(np.uint8)
+
+    scores = ssim(reference, output)
+    assert scores.shape == (3,)
+    assert scores[0] == np.float32(1.0) and scores[0] > scores[1] > scores[2]
+    assert np.isinf(psnr(reference, output)[0])
+    assert psnr(reference, output)[1] > psnr(reference, output)[2] > 20
+    assert np.allclose(ssim(reference[1:2], output[1:2]), scores[1])
+
+
+def test_pareto_keeps_settings_no_other_beats():
+    """Test that slower settings survive only if they buy quality."""
+    def setting(ms, quality):
+        return {"msPerImage": ms, "psnr": quality, "ssim": quality / 100}
+
+    marked = pareto([setting(10, 20), setting(20, 25), setting(30, 24), setting(40, 25)])
+    assert [result["pareto"] for result in marked] == [True, True, False, False]
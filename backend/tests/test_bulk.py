@@ -0,0 +1,79 @@
+"""
+Tests for the offline bulk colorization runner.
+"""
+import json
+
+from PIL import Image
+
+from app.bulk import MANIFEST_NAME, colorize_files, cpu_slices, find_images, read_manifest, run, shard_files
+from benchmarks.stub import StubColorizer
+
+
+def make_tree(root, names):
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.linear_gradient("L").resize((64, 48)).save(path)
+
+
+def test_shards_balance_bytes_and_cores_are_split():
+    """Test that shards carry similar bytes and get disjoint core slices."""
+    files = [{"path": f"{size}.jpg", "size": size} for size in (90, 50, 40, 30, 20, 10)]
+    shards = shard_files(files, 2)
+    assert sorted(sum(file["size"] for file in shard) for shard in shards) == [120, 120]
+    assert shard_files(files[:1], 4) == [files[:1]]
+
+    assert cpu_slices(3, list(range(8))) == [[0, 1], [2, 3, 4], [5, 6, 7]]
+    assert cpu_slices(3, [0, 1]) == [[0], [1], [0]]
+
+
+def test_pipeline_colorizes_tree_and_reports_failures(tmp_path):
+    """Test that every image is written under the destination and broken files are recorded."""
+    source, dest = tmp_path / "raw", tmp_path / "processed"
+    make_tree(source, ["a.png", "a.jpg", "album/c.tif", "album/d.jpeg", "e.png"])
+    (source / "notes.txt").write_text("not an image")
+    (source / "broken.jpg").write_bytes(b"\xff\xd8 truncated")
+
+    files = find_images(source)
+    assert [file["path"] for file in files] == [
+        "a.jpg", "a.png", "album/c.tif", "album/d.jpeg", "broken.jpg", "e.png"
+    ]
+    entries = []
+    stub = StubColorizer(cost_ms=0, batch_overhead_ms=0)
+    seconds = colorize_files(stub, files, source, dest, entries.append, batch_size=4)
+
+    status = {entry["path"]: entry["status"] for entry in entries}
+    assert status.pop("broken.jpg") == "failed"
+    assert set(status.values()) == {"done"}
+    assert Image.open(dest / "album" / "c.tif.jpg").size == (64, 48)
+    # Sources differing only in extension get results of their own
+    assert Image.open(dest / "a.png.jpg").mode == "RGB"
+    assert (dest / "a.jpg.jpg").exists()
+    assert set(seconds) == {"decode", "inference", "encode"}
+
+
+def test_run_resumes_from_manifest(tmp_path, monkeypatch, capsys):
+    """Test that finished files are skipped and an interrupted manifest line is ignored."""
+    monkeypatch.setenv("COLORIZER_FACTORY", "benchmarks.stub:create_stub")
+    monkeypatch.setenv("STUB_COST_MS", "0")
+    source, dest = tmp_path / "raw", tmp_path / "processed"
+    make_tree(source, ["a.png", "b.png", "c/d.png"])
+
+    # A previous run finished a.png and was killed while writing the next line
+    a = next(file for file in find_images(source) if file["path"] == "a.png")
+    make_tree(dest, ["a.png.jpg"])
+    (dest / MANIFEST_NAME).write_text(
+        json.dumps({**a, "status": "done", "output": "a.png.jpg"}) + '\n{"path": "b.png", "sta'
+    )
+
+    summary = run(source, dest, processes=2, report_interval=0)
+    assert (summary["total"], summary["skipped"], summary["done"], summary["failed"]) == (3, 1, 2, 0)
+    assert len(summary["shards"]) == 2
+    assert "images/s, ETA" in capsys.readouterr().out
+    assert {path: entry["status"] for path, entry in read_manifest(dest / MANIFEST_NAME).items()} == {
+        "a.png": "done", "b.png": "done", "c/d.png": "done"
+    }
+    assert (dest / "c" / "d.png.jpg").exists()
+
+    again = run(source, dest, processes=2)
+    assert (again["skipped"], again["done"]) == (3, 0)
@@ -0,0 +1,55 @@
+"""
+Tests for the colorization result cache.
+"""
+from app.cache import ResultCache, make_cache_key
+
+
+def test_key_depends_on_all_parameters():
+    """Test that every parameter changes the cache key."""
+    base = make_cache_key("a" * 64, "model.pth", 35, "image/jpeg")
+    assert base != make_cache_key("b" * 64, "model.pth", 35, "image/jpeg")
+    assert base != make_cache_key("a" * 64, "other.pth", 35, "image/jpeg")
+    assert base != make_cache_key("a" * 64, "model.pth", 20, "image/jpeg")
+    assert base != make_cache_key("a" * 64, "model.pth", 35, "image/webp")
+
+
+def test_hit_miss_and_disk_tier(tmp_path):
+    """Test lookups through both tiers and persistence across instances."""
+    cache = ResultCache(tmp_path, memory_budget_bytes=10, disk_budget_bytes=100)
+    assert cache.get("k1") is None
+    cache.put("k1", b"0123456789")
+    cache.put("k2", b"abcdefghij")
+    assert cache.get("k2") == b"abcdefghij"  # memory
+    assert cache.get("k1") == b"0123456789"  # evicted from memory, read from disk
+    stats = cache.stats()
+    assert (stats["memoryHits"], stats["diskHits"], stats["misses"]) == (1, 1, 1)
+
+    reopened = ResultCache(tmp_path, memory_budget_bytes=10, disk_budget_bytes=100)
+    assert reopened.get("k2") == b"abcdefghij"
+
+
+def test_disk_budget_evicts_least_recently_used(tmp_path):
+    """Test that the disk tier stays within its budget."""
+    cache = ResultCache(tmp_path, memory_budget_bytes=0, disk_budget_bytes=25)
+    for key in ("k1", "k2", "k3"):
+        cache.put(key, b"x" * 10)
+    assert cache.get("k1") is None
+    assert cache.get("k3") == b"x" * 10
+    assert cache.stats()["diskBytes"] <= 25
+
+
+def test_disk_budget_covers_processes_sharing_the_directory(tmp_path):
+    """Test that caches of several processes keep their shared directory within one budget."""
+    first = ResultCache(tmp_path, memory_budget_bytes=0, disk_budget_bytes=35)
+    second = ResultCache(tmp_path, memory_budget_bytes=0, disk_budget_bytes=35)
+    for key in ("k1", "k2", "k3"):
+        first.put(key, b"x" * 10)
+    # Results of the other process are found, and stored ones are counted once
+    assert second.get("k1") == b"x" * 10
+    second.put("k2", b"x" * 10)
+    second.put("k4", b"x" * 10)
+    second.put("k5", b"x" * 10)
+
+    on_disk = sum(path.stat().st_size for path in tmp_path.glob("*/*"))
+    assert on_disk <= 35
+    assert second.stats()["diskBytes"] == on_disk
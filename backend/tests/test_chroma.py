@@ -0,0 +1,26 @@
+"""
+Tests for full-resolution chroma transfer.
+"""
+import numpy as np
+from PIL import Image
+from app.chroma import rgb_to_chroma, transfer_chroma
+
+
+def test_round_trip_at_same_resolution():
+    """Test that luminance + chroma of an image reproduce the image."""
+    rgb = np.random.default_rng(0).integers(0, 256, (37, 53, 3), dtype=np.uint8)
+    luma = np.asarray(Image.fromarray(rgb).convert("L"))
+    out = transfer_chroma(luma, rgb_to_chroma(rgb), strip_rows=8)
+    assert np.abs(out.astype(int) - rgb).max() <= 2
+
+
+def test_upsampled_chroma_keeps_full_resolution_luma():
+    """Test that small chroma is stretched over large luminance."""
+    color = np.empty((4, 4, 3), dtype=np.uint8)
+    color[...] = (150, 120, 100)  # warm sepia everywhere
+    luma = np.tile(np.arange(60, 185, dtype=np.uint8), (90, 1))
+    out = transfer_chroma(luma, rgb_to_chroma(color), strip_rows=16)
+    assert out.shape == (90, 125, 3)
+    assert (out[..., 0] >= out[..., 2]).all()
+    back = np.asarray(Image.fromarray(out).convert("L")).astype(int)
+    assert np.abs(back - luma).max() <= 2
@@ -0,0 +1,63 @@
+"""
+Tests for derivative rendering.
+"""
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import derivatives
+from app.models import Base, Derivative
+from app.storage import BlobStore
+
+
+def make_jpeg(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (120, 80, 40)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_negotiate_format(monkeypatch):
+    """Test that the first configured format the client accepts wins."""
+    monkeypatch.setattr(derivatives, "DERIVATIVE_FORMATS", ("webp", "jpeg"))
+    assert derivatives.negotiate_format("image/avif,image/webp,*/*;q=0.8") == "webp"
+    assert derivatives.negotiate_format("*/*") == "jpeg"
+    assert derivatives.negotiate_format(None) == "jpeg"
+
+
+def test_render_derivative_bounds_longest_side():
+    """Test that thumbnails keep the aspect ratio within the size limit."""
+    data, width, height = derivatives.render_derivative(make_jpeg(1200, 600), 256, "webp")
+    assert (width, height) == (256, 128)
+    assert Image.open(io.BytesIO(data)).format == "WEBP"
+
+
+def test_ensure_derivative_renders_once(tmp_path, monkeypatch):
+    """Test that a derivative is stored once and reused afterwards."""
+    stores = {name: BlobStore(tmp_path / name) for name in ("uploads", "derivatives")}
+    monkeypatch.setattr(derivatives, "get_blob_store", stores.__getitem__)
+    monkeypatch.setattr(derivatives, "_pool", ThreadPoolExecutor(1))
+    rendered = []
+    render = derivatives.render_derivative
+    monkeypatch.setattr(
+        derivatives, "render_derivative", lambda *args: rendered.append(args) or render(*args)
+    )
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    key = stores["uploads"].put(make_jpeg(800, 800))
+
+    first = derivatives.ensure_derivative(db, "uploads", key, "thumb", "jpeg")
+    second = derivatives.ensure_derivative(db, "uploads", key, "thumb", "jpeg")
+    assert first.key == second.key and stores["derivatives"].exists(first.key)
+    assert len(rendered) == 1 and db.query(Derivative).count() == 1
+
+    with pytest.raises(KeyError):
+        derivatives.ensure_derivative(db, "uploads", key, "huge", "jpeg")
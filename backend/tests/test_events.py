@@ -0,0 +1,33 @@
+"""
+Tests for the status event broker.
+"""
+import asyncio
+import threading
+
+from app.events import EventBroker
+
+
+def test_publish_from_thread_reaches_matching_subscribers():
+    """Test that events are routed by session and image across threads."""
+    async def scenario():
+        broker = EventBroker()
+        broker.bind(asyncio.get_running_loop())
+        session = broker.subscribe(session_id="a" * 32)
+        image = broker.subscribe(image_id=2)
+        other = broker.subscribe(session_id="b" * 32)
+
+        message = {"type": "status", "imageId": 2, "sessionId": "a" * 32, "status": "processing"}
+        thread = threading.Thread(target=broker.publish, args=(message,))
+        thread.start()
+        thread.join()
+        broker.publish({"type": "stats", "workerId": "w0"})
+
+        assert await asyncio.wait_for(session.queue.get(), 1) == message
+        assert await asyncio.wait_for(image.queue.get(), 1) == message
+        await asyncio.sleep(0)
+        assert other.queue.empty() and session.queue.empty()
+
+        broker.unsubscribe(session)
+        assert broker.subscriber_count() == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,145 @@
+"""
+Tests for ETags, conditional requests and the shared-image cache.
+"""
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image as PILImage
+
+from app.database import SessionLocal, init_db
+from app.http_cache import IMMUTABLE, PayloadCache, etag_matches
+from app.main import app
+from app.models import Image, ImageStatus
+from app.derivatives import generate_derivatives
+from app.storage import PROCESSED_BUCKET, UPLOADS_BUCKET, get_blob_store
+
+client = TestClient(app)
+SESSION = "c" * 32
+HEADERS = {"X-Session-ID": SESSION}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def database():
+    init_db()
+
+
+def add_image(token: str, status: ImageStatus) -> int:
+    db = SessionLocal()
+    try:
+        image = Image(original_key="1" * 64, session_id=SESSION, public_token=token, status=status)
+        db.add(image)
+        db.commit()
+        return image.id
+    finally:
+        db.close()
+
+
+def set_status(image_id: int, status: ImageStatus) -> None:
+    db = SessionLocal()
+    try:
+        db.get(Image, image_id).status = status
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_etag_matching():
+    """Test If-None-Match lists, wildcards and weak prefixes."""
+    assert etag_matches('"a", "b"', '"b"')
+    assert etag_matches('W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
+
+
+def test_payload_cache_evicts_least_recently_used():
+    cache = PayloadCache(2)
+    cache.put("a", b"1", '"1"')
+    cache.put("b", b"2", '"2"')
+    assert cache.get("a") == (b"1", '"1"')
+    cache.put("c", b"3", '"3"')
+    assert cache.get("b") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_finished_shared_image_is_served_from_memory():
+    """Test that a completed share is answered without the database once cached."""
+    image_id = add_image("shared-completed", ImageStatus.COMPLETED)
+    response = client.get("/api/public/shared-completed")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"].startswith("public, max-age=")
+
+    revalidated = client.get("/api/public/shared-completed", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+
+    # A changed row is not read again: finished images do not change
+    set_status(image_id, ImageStatus.PENDING)
+    assert client.get("/api/public/shared-completed").json() == response.json()
+
+
+def test_unfinished_shared_image_is_not_cached():
+    """Test that an image in progress is re-read and must be revalidated."""
+    image_id = add_image("shared-pending", ImageStatus.PENDING)
+    response = client.get("/api/public/shared-pending")
+    assert response.json()["status"] == "pending"
+    assert response.headers["cache-control"] == "no-cache"
+
+    set_status(image_id, ImageStatus.COMPLETED)
+    response = client.get("/api/public/shared-pending", headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 200
+    assert response.json()["status"] == "completed"
+
+
+def test_image_metadata_is_conditional():
+    """Test ETags on the owner's view of an image."""
+    image_id = add_image("owned", ImageStatus.COMPLETED)
+    response = client.get(f"/api/images/{image_id}", headers=HEADERS)
+    assert response.headers["cache-control"].startswith("private, max-age=")
+    assert "X-Session-ID" in response.headers["vary"]
+    revalidated = client.get(
+        f"/api/images/{image_id}", headers={**HEADERS, "If-None-Match": response.headers["etag"]}
+    )
+    assert revalidated.status_code == 304
+
+
+def test_blobs_are_immutable_and_conditional():
+    """Test that the content key is the ETag, for full and range requests."""
+    key = get_blob_store(UPLOADS_BUCKET).put(b"0123456789")
+    url = f"/api/blobs/uploads/{key}"
+    response = client.get(url)
+    assert response.headers["etag"] == f'"{key}"'
+    assert response.headers["cache-control"] == IMMUTABLE
+
+    assert client.get(url, headers={"If-None-Match": f'"{key}"'}).status_code == 304
+    partial = client.get(url, headers={"Range": "bytes=2-4", "If-Range": f'"{key}"'})
+    assert (partial.status_code, partial.content) == (206, b"234")
+    stale = client.get(url, headers={"Range": "bytes=2-4", "If-Range": '"other"'})
+    assert (stale.status_code, stale.content) == (200, b"0123456789")
+
+
+def test_derivatives_are_never_encoded_on_request():
+    """Test that missing derivatives fall back to the result and originals get none."""
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (600, 400), (120, 80, 40)).save(buffer, "JPEG")
+    data = buffer.getvalue()
+    key = get_blob_store(PROCESSED_BUCKET).put(data)
+    get_blob_store(UPLOADS_BUCKET).put(data)
+    url = f"/api/blobs/processed/{key}/thumb"
+    headers = {"Accept": "image/webp"}
+
+    assert client.get(f"/api/blobs/uploads/{key}/thumb", headers=headers).status_code == 404
+    missing = client.get(url, headers=headers)
+    assert (missing.content, missing.headers["cache-control"]) == (data, "no-cache")
+
+    db = SessionLocal()
+    try:
+        generate_derivatives(db, PROCESSED_BUCKET, key)
+    finally:
+        db.close()
+    rendered = client.get(url, headers={**headers, "If-None-Match": missing.headers["etag"]})
+    assert rendered.status_code == 200
+    assert rendered.headers["cache-control"] == IMMUTABLE
+    assert PILImage.open(io.BytesIO(rendered.content)).size == (256, 171)
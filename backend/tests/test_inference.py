@@ -0,0 +1,40 @@
+"""
+Tests for the exported inference backends (without torch).
+"""
+import pytest
+from PIL import Image
+
+from app.export import main as export_main
+from app.inference import backend_id, export_path, load_runner, pixel_error
+
+
+def test_export_path_names_variants():
+    """Test that artifacts are named per weights, render_factor and quantization."""
+    assert export_path("ml/models/ColorAize_weights.pth", "onnx", 35).name == "ColorAize_weights.rf35.onnx"
+    assert export_path("x/Artistic.pth", "onnx", 21, quantized=True).name == "Artistic.rf21.int8.onnx"
+    assert export_path("x/Artistic.pth", "torchscript", 21).suffix == ".ts"
+
+
+def test_missing_export_falls_back_to_eager():
+    """Test that the eager path is used when nothing was exported."""
+    assert load_runner("eager", "model.pth", 35) is None
+    assert load_runner("onnx", "not-exported.pth", 35, quantized=True) is None
+    with pytest.raises(ValueError):
+        load_runner("tensorrt", "model.pth", 35)
+
+
+def test_pixel_error():
+    """Test the parity metric."""
+    reference = [Image.new("RGB", (4, 4), (100, 100, 100))]
+    candidate = [Image.new("RGB", (4, 4), (100, 103, 100))]
+    assert pixel_error(reference, reference) == {"maxPixelError": 0, "meanPixelError": 0.0}
+    assert pixel_error(reference, candidate) == {"maxPixelError": 3, "meanPixelError": 1.0}
+
+
+def test_backend_id_keeps_results_of_backends_apart():
+    """Test that cached results are keyed by the backend that produced them."""
+    assert [backend_id("eager", True), backend_id("onnx", True), backend_id("onnx", False)] == [
+        "eager", "onnx-int8", "onnx"
+    ]
+    with pytest.raises(SystemExit):
+        export_main(["--format", "torchscript", "--quantize"])
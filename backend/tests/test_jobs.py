@@ -0,0 +1,207 @@
+"""
+Tests for the durable job queue.
+"""
+from concurrent.futures import Future
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import jobs
+from app.config import DEFAULT_MODEL, SQLITE_BUSY_TIMEOUT_MS
+from app.database import create_db_engine
+from app.models import Base, Image, ImageStatus
+from app.worker import CompletionWriter, Worker
+
+
+@pytest.fixture
+def db():
+    """Fresh in-memory database session."""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    for _ in range(3):
+        session.add(Image(original_key="0" * 64, session_id="s" * 32))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_claim_is_exclusive(db):
+    """Test that a claimed job is not handed out twice."""
+    assert jobs.claim_jobs(db, "w1", 2) == [1, 2]
+    assert jobs.claim_jobs(db, "w2", 5) == [3]
+    assert jobs.queue_depth(db) == 0
+    image = db.get(Image, 1)
+    assert (image.status, image.worker_id, image.attempts) == (ImageStatus.PROCESSING, "w1", 1)
+
+
+def test_complete_requires_lease(db):
+    """Test that only the lease holder can complete a job."""
+    jobs.claim_jobs(db, "w1", 1)
+    assert not jobs.complete_job(db, 1, "w2", "a" * 64, "image/jpeg")
+    assert jobs.complete_job(db, 1, "w1", "a" * 64, "image/jpeg")
+    assert db.get(Image, 1).status == ImageStatus.COMPLETED
+
+
+def test_completions_are_committed_together(db):
+    """Test that a group of completions only updates jobs the worker holds."""
+    jobs.claim_jobs(db, "w1", 2)
+    jobs.claim_jobs(db, "w2", 1)
+    results = [(image_id, "a" * 64, "image/jpeg") for image_id in (1, 2, 3)]
+    assert jobs.complete_jobs(db, "w1", results) == {1, 2}
+    assert [db.get(Image, i).status for i in (1, 2, 3)] == [
+        ImageStatus.COMPLETED, ImageStatus.COMPLETED, ImageStatus.PROCESSING
+    ]
+
+
+def test_completion_after_writer_shutdown(db, monkeypatch):
+    """Test that a job finishing after the completion writer stopped is recorded, not stuck."""
+    monkeypatch.setattr("app.database.SessionLocal", sessionmaker(bind=db.get_bind()))
+    jobs.claim_jobs(db, "w1", 1)
+    writer = CompletionWriter("w1")
+    writer.shutdown()
+    assert writer.complete(1, "a" * 64, "image/jpeg")
+    db.expire_all()
+    assert db.get(Image, 1).status == ImageStatus.COMPLETED
+
+
+def test_sqlite_file_database_settings(tmp_path):
+    """Test WAL mode and per-thread connections for SQLite files."""
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    with engine.connect() as first, engine.connect() as second:
+        assert first.connection.dbapi_connection is not second.connection.dbapi_connection
+        settings = {
+            name: first.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout")
+        }
+    # synchronous=1 is NORMAL
+    assert settings == {"journal_mode": "wal", "synchronous": 1, "busy_timeout": SQLITE_BUSY_TIMEOUT_MS}
+    engine.dispose()
+
+
+def test_failed_jobs_retry_until_attempts_run_out(db, monkeypatch):
+    """Test bounded retries."""
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    jobs.claim_jobs(db, "w1", 1)
+    assert jobs.fail_job(db, 1, "w1", "boom") == ImageStatus.PENDING
+    assert db.get(Image, 1).worker_id is None
+    assert jobs.fail_job(db, 1, "w1", "boom") is None
+    jobs.claim_jobs(db, "w1", 1)
+    assert jobs.fail_job(db, 1, "w1", "boom") == ImageStatus.FAILED
+    image = db.get(Image, 1)
+    assert image.error_message == "boom" and image.finished_at is not None
+
+
+def test_expired_leases_are_requeued(db):
+    """Test crash recovery of jobs whose worker disappeared."""
+    jobs.claim_jobs(db, "w1", 2)
+    image = db.get(Image, 1)
+    image.lease_expires_at = jobs.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+    assert jobs.requeue_expired(db) == 1
+    assert db.get(Image, 1).status == ImageStatus.PENDING
+    assert db.get(Image, 2).status == ImageStatus.PROCESSING
+    assert jobs.extend_leases(db, "w1", [1, 2]) == 1
+
+
+def test_expired_leases_without_attempts_left_fail(db, monkeypatch):
+    """Test that a job whose worker disappeared on its last attempt is failed."""
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 1)
+    jobs.claim_jobs(db, "w1", 1)
+    db.get(Image, 1).lease_expires_at = jobs.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+    assert jobs.requeue_expired(db) == 1
+    assert jobs.requeue_expired(db) == 0
+    image = db.get(Image, 1)
+    db.refresh(image)
+    assert image.status == ImageStatus.FAILED and image.worker_id is None
+    assert image.error_message == "Processing did not finish (worker lost)"
+    assert image.finished_at is not None
+
+
+def test_released_jobs_go_back_without_losing_an_attempt(db):
+    """Test that a stopping worker hands its unfinished jobs straight back."""
+    jobs.claim_jobs(db, "w1", 2)
+    assert jobs.release_jobs(db, "w2", [1, 2]) == 0
+    assert jobs.release_jobs(db, "w1", [1]) == 1
+
+    image = db.get(Image, 1)
+    assert (image.status, image.worker_id, image.attempts) == (ImageStatus.PENDING, None, 0)
+    assert db.get(Image, 2).status == ImageStatus.PROCESSING
+    assert jobs.claim_jobs(db, "w2", 1) == [1]
+
+
+def test_queue_positions(db):
+    """Test that positions count pending jobs ahead in claim order."""
+    jobs.claim_jobs(db, "w1", 1)
+    assert jobs.queue_positions(db, [1, 2, 3]) == {2: 1, 3: 2}
+
+
+def test_claim_only_served_models(db):
+    """Test that a worker serving some models leaves other jobs in the queue."""
+    db.get(Image, 1).model = "artistic"
+    db.get(Image, 2).model = DEFAULT_MODEL
+    db.commit()
+    assert jobs.claim_jobs(db, "w1", 5, models=["artistic"]) == [1]
+    # Jobs without a model run on the default one
+    assert jobs.claim_jobs(db, "w2", 5, models=[DEFAULT_MODEL]) == [2, 3]
+
+
+def test_cheap_and_interactive_jobs_go_first(db):
+    """Test cost- and lane-aware claim order, bounded by aging."""
+    db.query(Image).delete()
+    thumbnail = Image(original_key="0" * 64, session_id="s" * 32, width=256, height=256)
+    scan = Image(original_key="0" * 64, session_id="s" * 32, width=8000, height=5000, render_factor=35)
+    bulk = Image(original_key="0" * 64, session_id="s" * 32, width=256, height=256)
+    for image, lane in ((bulk, jobs.BULK_LANE), (scan, jobs.INTERACTIVE_LANE), (thumbnail, jobs.INTERACTIVE_LANE)):
+        jobs.schedule(image, lane)
+        db.add(image)
+    db.commit()
+    assert jobs.queue_positions(db, [thumbnail.id, scan.id, bulk.id]) == {thumbnail.id: 1, scan.id: 2, bulk.id: 3}
+    assert jobs.claim_jobs(db, "w1", 3) == [thumbnail.id, scan.id, bulk.id]
+
+    # A bulk job queued long enough ago is no longer overtaken
+    old_bulk = Image(original_key="0" * 64, session_id="s" * 32)
+    jobs.schedule(old_bulk, jobs.BULK_LANE)
+    old_bulk.queue_key -= jobs.SCHEDULER_BULK_DELAY + jobs.SCHEDULER_MAX_COST_DELAY
+    fresh = Image(original_key="0" * 64, session_id="s" * 32, width=256, height=256)
+    jobs.schedule(fresh)
+    db.add_all([fresh, old_bulk])
+    db.commit()
+    assert jobs.claim_jobs(db, "w1", 1) == [old_bulk.id]
+
+
+def test_cancelled_jobs_are_neither_claimed_nor_completed(db):
+    """Test cancelling queued, running and finished jobs."""
+    jobs.claim_jobs(db, "w1", 1)
+    jobs.complete_job(db, 1, "w1", "a" * 64, "image/jpeg")
+    jobs.claim_jobs(db, "w1", 1)
+    assert jobs.cancel_jobs(db, [1, 2, 3]) == {2: ImageStatus.PROCESSING, 3: ImageStatus.PENDING}
+    assert jobs.claim_jobs(db, "w1", 5) == []
+    assert not jobs.complete_job(db, 2, "w1", "a" * 64, "image/jpeg")
+    assert jobs.fail_job(db, 2, "w1", "boom") is None
+    assert jobs.cancelled_jobs(db, [1, 2]) == {2}
+    assert db.get(Image, 1).status == ImageStatus.COMPLETED
+
+
+def test_worker_drops_cancelled_job_waiting_for_a_batch():
+    """Test that a cancelled job does not wait for (or join) its inference batch."""
+    worker = Worker("w-cancel")
+    try:
+        with pytest.raises(jobs.JobCancelled):
+            worker._cancelled.add(7)
+            worker._checkpoint(7)
+        future = Future()
+        with pytest.raises(jobs.JobCancelled):
+            worker._infer(7, future)
+        # The batch scheduler skips futures that were cancelled
+        assert not future.set_running_or_notify_cancel()
+    finally:
+        worker._completions.shutdown()
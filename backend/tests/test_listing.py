@@ -0,0 +1,75 @@
+"""
+Tests for the paginated image listing.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import get_db
+from app.main import app
+from app.models import Base, Image
+
+SESSION = "a" * 32
+HEADERS = {"X-Session-ID": SESSION}
+
+
+@pytest.fixture
+def client():
+    """Test client backed by a fresh in-memory database with 5 images."""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    for _ in range(5):
+        db.add(Image(original_key="0" * 64, original_url="data:image/jpeg;base64,AAAA", session_id=SESSION))
+    db.add(Image(original_key="1" * 64, session_id="b" * 32))
+    db.commit()
+    db.close()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    def override_get_db():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    test_client = TestClient(app)
+    test_client.statements = statements
+    yield test_client
+    app.dependency_overrides.clear()
+
+
+def test_keyset_pagination_walks_all_pages(client):
+    """Test that following the cursor returns every image exactly once, newest first."""
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/images", params=params, headers=HEADERS)
+        assert response.status_code == 200
+        seen.extend(image["id"] for image in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == [5, 4, 3, 2, 1]
+
+
+def test_field_selection_skips_large_columns(client):
+    """Test that a projected listing neither returns nor loads unrequested columns."""
+    response = client.get("/api/images", params={"fields": "id,status"}, headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json()[0] == {"id": 5, "status": "pending"}
+    assert not any("original_url" in sql for sql in client.statements)
+
+
+def test_invalid_listing_parameters(client):
+    """Test rejection of unknown fields and malformed cursors."""
+    assert client.get("/api/images", params={"fields": "id,bogus"}, headers=HEADERS).status_code == 400
+    assert client.get("/api/images", params={"cursor": "!!"}, headers=HEADERS).status_code == 400
@@ -0,0 +1,67 @@
+"""
+Tests for the Prometheus metrics.
+"""
+from fastapi.testclient import TestClient
+
+from app.database import init_db
+from app.main import app
+from app.metrics import MetricsRegistry, merge, render
+
+
+def make_registry():
+    registry = MetricsRegistry()
+    registry.histogram("stage_seconds", "Stage durations", ("stage",), buckets=(0.1, 1.0))
+    registry.counter("jobs_total", "Jobs", ("status",))
+    return registry
+
+
+def test_histogram_and_counter_rendering():
+    """Test cumulative buckets, sums and label rendering."""
+    registry = make_registry()
+    for value in (0.05, 0.5, 5.0):
+        registry.observe("stage_seconds", value, stage="inference")
+    registry.inc("jobs_total", status="completed")
+
+    text = render(registry.snapshot(), [("queue_jobs", "Queued", [({"status": "pending"}, 3)])])
+    assert '# TYPE stage_seconds histogram' in text
+    assert 'stage_seconds_bucket{stage="inference",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="inference",le="1.0"} 2' in text
+    assert 'stage_seconds_bucket{stage="inference",le="+Inf"} 3' in text
+    assert 'stage_seconds_sum{stage="inference"} 5.55' in text
+    assert 'jobs_total{status="completed"} 1.0' in text
+    assert 'queue_jobs{status="pending"} 3.0' in text
+
+
+def test_snapshots_of_processes_are_summed():
+    """Test merging worker snapshots into the API's metrics."""
+    api, worker = make_registry(), make_registry()
+    api.inc("jobs_total", status="failed")
+    worker.inc("jobs_total", 2, status="failed")
+    worker.observe("stage_seconds", 0.5, stage="encode")
+    api.observe("stage_seconds", 0.5, stage="encode")
+
+    merged = merge([api.snapshot(), worker.snapshot()])
+    assert merged["jobs_total"]["samples"][("failed",)] == 3
+    assert merged["stage_seconds"]["samples"][("encode",)] == [0, 2, 1.0, 2]
+
+
+def test_metrics_endpoint():
+    """Test that /metrics serves the text format with queue gauges."""
+    init_db()
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'colorizer_queue_jobs{status="pending"}' in response.text
+    assert "# TYPE colorizer_stage_seconds histogram" in response.text
+
+
+def test_metrics_endpoint_with_frontend_build(monkeypatch, tmp_path):
+    """Test that the SPA fallback of a built frontend does not shadow /metrics."""
+    import app.main as main
+
+    init_db()
+    (tmp_path / "index.html").write_text("<html>spa</html>")
+    monkeypatch.setattr(main, "frontend_dist", str(tmp_path))
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
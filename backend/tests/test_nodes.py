@@ -0,0 +1,69 @@
+"""
+Tests for the registry of worker nodes.
+"""
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import nodes
+from app.database import SessionLocal, init_db
+from app.main import app
+from app.models import Base, WorkerNode
+
+
+@pytest.fixture
+def db():
+    """Fresh in-memory database session."""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def advertise(db, worker_id: str, ready: bool = True, models=("stable",)) -> None:
+    nodes.advertise(
+        db, worker_id, capacity=8, in_flight=2, models=list(models), loaded=list(models), ready=ready
+    )
+
+
+def test_nodes_are_listed_until_they_go_silent(db):
+    """Test that live nodes are reported and silent ones pruned."""
+    advertise(db, "a")
+    advertise(db, "b", ready=False, models=("artistic",))
+    assert [node["id"] for node in nodes.live_nodes(db)] == ["a", "b"]
+    assert nodes.cluster_summary(nodes.live_nodes(db)) == {
+        "nodes": 2, "ready": 1, "capacity": 8, "inFlight": 4, "models": ["stable"],
+    }
+
+    db.get(WorkerNode, "b").heartbeat_at -= timedelta(seconds=nodes.NODE_TIMEOUT_SECONDS + 1)
+    db.commit()
+    assert [node["id"] for node in nodes.live_nodes(db)] == ["a"]
+    # The next report of another node removes the row
+    advertise(db, "a")
+    assert db.get(WorkerNode, "b") is None
+
+    nodes.withdraw(db, "a")
+    assert nodes.live_nodes(db) == []
+
+
+def test_api_is_ready_with_a_remote_node():
+    """Test that a worker node on another host makes the API ready."""
+    init_db()
+    client = TestClient(app)
+    db = SessionLocal()
+    try:
+        advertise(db, "remote-host-1")
+        response = client.get("/readyz")
+        assert response.status_code == 200
+        assert [node["id"] for node in response.json()["nodes"]] == ["remote-host-1"]
+        assert client.get("/api/stats").json()["cluster"]["capacity"] == 8
+    finally:
+        nodes.withdraw(db, "remote-host-1")
+        db.close()
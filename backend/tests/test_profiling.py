@@ -0,0 +1,160 @@
+"""
+Tests for trace spans, profiling sessions and the admin API.
+"""
+import os
+import pstats
+import tempfile
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import config
+from app.batching import BatchScheduler
+from app.database import SessionLocal, init_db
+from app.main import app
+from app.models import Profile
+from app.profiling import ProfileSession, claim_profile, current_profile
+from app.tracing import Tracer, chrome_trace, current_traces, tracer
+
+from tests.test_batching import FakeColorizer
+
+client = TestClient(app)
+ADMIN = {"Authorization": "Bearer secret"}
+
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    init_db()
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "secret")
+
+
+def load_pstats(data: bytes) -> pstats.Stats:
+    fd, path = tempfile.mkstemp(suffix=".prof")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    try:
+        return pstats.Stats(path)
+    finally:
+        os.unlink(path)
+
+
+def test_chrome_trace_format():
+    """Test that spans become complete events tagged with their traces."""
+    local = Tracer(capacity=10, process="worker w0")
+    token = current_traces.set(("aaaa1111",))
+    try:
+        with local.span("job", image_id=7):
+            pass
+    finally:
+        current_traces.reset(token)
+    with local.span("untraced"):
+        pass
+
+    trace = chrome_trace(local.spans("aaaa1111"))
+    event, metadata = trace["traceEvents"]
+    assert event["ph"] == "X" and event["name"] == "job"
+    assert event["args"] == {"image_id": 7, "traces": ["aaaa1111"]}
+    assert metadata == {"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "worker w0"}}
+    assert len(local.spans()) == 2
+
+
+def test_batch_runs_under_the_traces_and_profile_of_its_jobs():
+    """Test that the scheduler thread continues the submitting jobs' context."""
+    session = ProfileSession("p1", "cprofile", 1)
+    scheduler = BatchScheduler(FakeColorizer(), max_batch_size=2, max_wait_ms=1000)
+    futures = []
+    for trace_id, profile in (("aaaa0001", session), ("aaaa0002", None)):
+        current_traces.set((trace_id,))
+        current_profile.set(profile)
+        futures.append(scheduler.submit(b"x"))
+    current_traces.set(())
+    current_profile.set(None)
+    for future in futures:
+        future.result(timeout=5)
+    scheduler.shutdown()
+
+    batch = [span for span in tracer.spans("aaaa0001") if span["name"] == "batch"][-1]
+    assert batch["traces"] == ["aaaa0001", "aaaa0002"]
+    data, mime = session.render()
+    assert mime == "application/octet-stream"
+    assert load_pstats(data).total_calls > 0
+
+
+def test_cprofile_session_merges_threads():
+    """Test slot accounting and merging of per-thread profiles."""
+    session = ProfileSession("p2", "cprofile", 2)
+    assert session.claim() and session.claim(exclusive=False)
+    assert not session.claim()
+
+    def work():
+        return sum(range(10000))
+
+    def job():
+        with session.section():
+            work()
+
+    threads = [threading.Thread(target=job) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not session.job_done()
+    assert session.job_done()
+
+    stats = load_pstats(session.render()[0])
+    assert any(func[2] == "work" and stat[1] == 2 for func, stat in stats.stats.items())
+
+
+def test_workers_claim_pending_profiles_once():
+    """Test that a profiling request is taken by exactly one worker."""
+    init_db()
+    db = SessionLocal()
+    try:
+        db.add(Profile(id="c" * 32, mode="cprofile", target="jobs", jobs=3, worker_id="w1"))
+        db.commit()
+        assert claim_profile(db, "w0") is None
+        session = claim_profile(db, "w1")
+        assert (session.profile_id, session.limit) == ("c" * 32, 3)
+        assert claim_profile(db, "w1") is None
+        assert db.query(Profile).filter(Profile.id == "c" * 32).one().status == "running"
+    finally:
+        db.close()
+
+
+def test_admin_api_requires_token(admin_token, monkeypatch):
+    """Test that the admin API is hidden without a token and checks it otherwise."""
+    assert client.get("/api/admin/traces").status_code == 401
+    assert client.get("/api/admin/traces", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    assert client.get("/api/admin/traces", headers=ADMIN).status_code == 200
+    monkeypatch.setattr(config, "ADMIN_TOKEN", None)
+    assert client.get("/api/admin/traces", headers=ADMIN).status_code == 404
+
+
+def test_profile_api_requests(admin_token):
+    """Test profiling the next API requests and downloading the artifact."""
+    response = client.post("/api/admin/profiles", json={"target": "requests", "jobs": 2}, headers=ADMIN)
+    assert response.status_code == 200
+    profile = response.json()
+    assert profile["status"] == "running"
+    assert client.post("/api/admin/profiles", json={"target": "requests"}, headers=ADMIN).status_code == 409
+
+    traced = client.get("/", headers={"X-Trace-ID": "feedface00000001"})
+    assert traced.headers["X-Trace-ID"] == "feedface00000001"
+    client.get("/api/models")
+
+    profile = client.get(f"/api/admin/profiles/{profile['id']}", headers=ADMIN).json()
+    assert profile["status"] == "completed" and profile["profiled"] == 2
+    artifact = client.get(profile["artifactUrl"], headers=ADMIN)
+    assert artifact.headers["content-type"] == "application/octet-stream"
+    assert ".prof" in artifact.headers["content-disposition"]
+    assert load_pstats(artifact.content).total_calls > 0
+
+    events = client.get("/api/admin/traces?trace=feedface00000001", headers=ADMIN).json()["traceEvents"]
+    assert [event["args"]["path"] for event in events if event["ph"] == "X"] == ["/"]
+
+
+def test_profile_request_validation(admin_token):
+    """Test rejected profiling requests."""
+    for body in ({"mode": "perf"}, {"target": "gpu"}, {"jobs": 0}, {"mode": "torch", "target": "requests"}):
+        assert client.post("/api/admin/profiles", json=body, headers=ADMIN).status_code == 400
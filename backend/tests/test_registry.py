@@ -0,0 +1,73 @@
+"""
+Tests for the model registry.
+"""
+import pytest
+
+from app.registry import ModelRegistry, is_artistic
+
+
+class FakeModel:
+    """Stand-in for a loaded colorizer of a given size."""
+
+    def __init__(self, path, artistic, size):
+        self.path = path
+        self.artistic = artistic
+        self.size = size
+        self.released = False
+
+    def memory_bytes(self):
+        return self.size
+
+    def release(self):
+        self.released = True
+
+
+def make_registry(budget, sizes):
+    loaded = []
+
+    def loader(path, artistic, device, render_factor):
+        model = FakeModel(path, artistic, sizes[path])
+        loaded.append(model)
+        return model
+
+    models = {name: f"/weights/{name}.pth" for name in sizes}
+    sizes = {f"/weights/{name}.pth": size for name, size in sizes.items()}
+    return ModelRegistry(models, next(iter(models)), budget, loader=loader), loaded
+
+
+def test_models_are_loaded_once_and_shared():
+    """Test on-demand loading and reuse of a loaded generator."""
+    registry, loaded = make_registry(100, {"stable": 40, "artistic": 40})
+    assert registry.loaded() == []
+    assert registry.get() is registry.get("stable")
+    assert registry.get("artistic").artistic is True  # file name decides
+    assert len(loaded) == 2
+    assert registry.stats()["memoryBytes"] == 80
+    with pytest.raises(KeyError):
+        registry.get("missing")
+
+
+def test_least_recently_used_model_is_evicted():
+    """Test that loading past the budget unloads the least recently used model."""
+    registry, loaded = make_registry(100, {"a": 40, "b": 40, "c": 40})
+    first = registry.get("a")
+    registry.get("b")
+    registry.get("a")  # b is now least recently used
+    registry.get("c")
+
+    assert registry.loaded() == ["a", "c"]
+    assert loaded[1].released and not first.released
+    assert registry.stats()["evictions"] == 1
+
+
+def test_oversized_model_is_kept_alone():
+    """Test that a model larger than the budget still loads, replacing the others."""
+    registry, _ = make_registry(100, {"small": 40, "huge": 150})
+    registry.get("small")
+    registry.get("huge")
+    assert registry.loaded() == ["huge"]
+
+
+def test_artistic_is_detected_from_file_name():
+    assert is_artistic("ml/models/ColorizeArtistic_gen.pth")
+    assert not is_artistic("ml/models/ColorAize_weights.pth")
@@ -0,0 +1,127 @@
+"""
+Tests for near-duplicate detection and colour reuse.
+"""
+import io
+import random
+
+import numpy as np
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.jobs import utcnow
+from app.models import Base, Image as ImageRow, ImageStatus
+from app.similar import BKTree, SimilarIndex, hamming_distance, perceptual_hash, reuse_colors
+
+
+def photo(seed: int, size=(640, 480)) -> Image.Image:
+    """A smooth grayscale picture with some structure."""
+    rng = np.random.default_rng(seed)
+    coarse = Image.fromarray(rng.integers(0, 256, (6, 8), dtype=np.uint8))
+    return coarse.resize(size, Image.Resampling.BICUBIC)
+
+
+def encode(image: Image.Image, **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", **kwargs)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def db():
+    """Fresh in-memory database session."""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_hash_survives_rescaling_and_recompression():
+    """Test that a resized, recompressed copy stays close and other pictures do not."""
+    original = perceptual_hash(encode(photo(1), quality=95))
+    rescan = perceptual_hash(encode(photo(1).resize((400, 300)), quality=40))
+    other = perceptual_hash(encode(photo(2), quality=95))
+    assert hamming_distance(original, rescan) <= 4
+    assert hamming_distance(original, other) > 16
+
+
+def test_featureless_images_are_not_hashed():
+    """Test that blank pages do not all match each other."""
+    assert perceptual_hash(encode(Image.new("L", (300, 200), 240))) is None
+
+
+def test_bk_tree_search_matches_brute_force():
+    """Test that the tree finds exactly the hashes within the distance."""
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(500)]
+    # Some near neighbours of the query
+    query = hashes[0]
+    hashes += [query ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for _ in range(20)]
+    tree = BKTree()
+    for item, value in enumerate(hashes):
+        tree.add(value, item)
+
+    found = tree.search(query, 6)
+    expected = sorted(
+        (bin(value ^ query).count("1"), item)
+        for item, value in enumerate(hashes)
+        if bin(value ^ query).count("1") <= 6
+    )
+    assert sorted(found) == expected
+    assert [distance for distance, _ in found] == sorted(distance for distance, _ in found)
+
+
+def test_find_requires_same_settings_and_shape(db):
+    """Test that only completed results with matching model, backend, render factor and aspect are reused."""
+    phash = perceptual_hash(encode(photo(1)))
+    near = f"{int(phash, 16) ^ 0b101:016x}"
+    rows = [
+        ImageRow(status=ImageStatus.COMPLETED, phash=phash, colorized_key="a" * 64, width=640, height=480),
+        ImageRow(status=ImageStatus.COMPLETED, phash=phash, colorized_key="b" * 64, width=640, height=480,
+                 model="artistic-other"),
+        ImageRow(status=ImageStatus.COMPLETED, phash=phash, colorized_key="c" * 64, width=480, height=640),
+        ImageRow(status=ImageStatus.FAILED, phash=phash, width=640, height=480),
+        ImageRow(status=ImageStatus.COMPLETED, phash=phash, colorized_key="e" * 64, width=640, height=480,
+                 inference_backend="onnx-int8"),
+    ]
+    for row in rows:
+        row.session_id = "s" * 32
+        row.inference_backend = row.inference_backend or "eager"
+        row.finished_at = utcnow()
+    db.add_all(rows)
+    db.commit()
+
+    index = SimilarIndex(max_distance=6)
+    match = index.find(db, near, None, "eager", 35, 35, 4 / 3)
+    assert match == (rows[0].id, "a" * 64, 2)
+    assert index.find(db, near, None, "onnx-int8", 35, 35, 4 / 3)[1] == "e" * 64
+    assert index.find(db, near, None, "eager", 20, 35, 4 / 3) is None
+    assert index.find(db, f"{int(phash, 16) ^ 0xFF:016x}", None, "eager", 35, 35, 4 / 3) is None
+    stats = index.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["hitRate"]) == (4, 2, 2, 1 / 2)
+
+    # Results completed later are picked up by the next lookup
+    db.add(ImageRow(status=ImageStatus.COMPLETED, phash=phash, colorized_key="d" * 64,
+                    width=640, height=480, render_factor=20, session_id="s" * 32, finished_at=utcnow(),
+                    inference_backend="eager"))
+    db.commit()
+    assert index.find(db, near, None, "eager", 20, 35, 4 / 3)[1] == "d" * 64
+
+
+def test_reuse_colors_keeps_new_luminance():
+    """Test that reused colours are laid over the new image's own detail."""
+    gray = photo(1)
+    earlier = Image.merge("RGB", [gray.point(lambda v: min(v + 40, 255)), gray, gray.point(lambda v: v // 2)])
+    rescan = gray.resize((1000, 750))
+
+    out = Image.open(io.BytesIO(reuse_colors(encode(rescan, quality=90), encode(earlier.resize((320, 240))))))
+    assert out.size == (1000, 750)
+    rgb = np.asarray(out).astype(int)
+    assert (rgb[..., 0] >= rgb[..., 2]).mean() > 0.95
+    luma = np.asarray(out.convert("L")).astype(int)
+    assert np.abs(luma - np.asarray(rescan).astype(int)).mean() < 4
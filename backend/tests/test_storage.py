@@ -0,0 +1,52 @@
+"""
+Tests for blob storage.
+"""
+import io
+
+import pytest
+from app.storage import BlobStore, parse_range_header, sniff_mime
+
+
+def test_put_is_content_addressed(tmp_path):
+    """Test that identical content maps to the same sharded key."""
+    store = BlobStore(tmp_path)
+    key = store.put(b"hello")
+    assert store.put(b"hello") == key
+    assert store.path_for(key) == tmp_path / key[:2] / key[2:4] / key
+    assert store.get(key) == b"hello"
+
+
+def test_put_stream(tmp_path):
+    """Test storing a file object in chunks, with a size limit."""
+    store = BlobStore(tmp_path)
+    data = bytes(range(256)) * 10
+    key = store.put_stream(io.BytesIO(data), chunk_size=100)
+    assert key == store.put(data) and store.get(key) == data
+    with pytest.raises(ValueError):
+        store.put_stream(io.BytesIO(data + b"x"), max_bytes=len(data))
+    assert not any((tmp_path / ".tmp").iterdir())
+
+
+def test_iter_range(tmp_path):
+    """Test streaming a byte range."""
+    store = BlobStore(tmp_path)
+    key = store.put(bytes(range(100)))
+    assert b"".join(store.iter_range(key, 10, 19, chunk_size=3)) == bytes(range(10, 20))
+
+
+def test_parse_range_header():
+    """Test Range header parsing."""
+    assert parse_range_header("bytes=0-9", 100) == (0, 9)
+    assert parse_range_header("bytes=-10", 100) == (90, 99)
+    assert parse_range_header("bytes=50-", 100) == (50, 99)
+    assert parse_range_header("bytes=0-1,5-6", 100) is None
+    with pytest.raises(ValueError):
+        parse_range_header("bytes=100-", 100)
+
+
+def test_sniff_mime():
+    """Test MIME detection from magic bytes."""
+    assert sniff_mime(b"\x89PNG\r\n\x1a\n....") == "image/png"
+    assert sniff_mime(b"\xff\xd8\xff\xe0") == "image/jpeg"
+    assert sniff_mime(b"\x00\x00\x00\x20ftypisom") == "video/mp4"
+    assert sniff_mime(b"nope") == "application/octet-stream"
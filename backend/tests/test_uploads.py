@@ -0,0 +1,230 @@
+"""
+Tests for streamed uploads.
+"""
+import hashlib
+import io
+import struct
+import zipfile
+import zlib
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image as PILImage
+
+from app.config import MAX_UPLOAD_BYTES
+from app.database import SessionLocal, init_db
+from app import main
+from app.main import app
+from app.models import Image
+from app.storage import UPLOADS_BUCKET, get_blob_store
+from app.uploads import ImageInspector, UploadRejected
+
+client = TestClient(app)
+HEADERS = {"X-Session-ID": "b" * 32}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def database():
+    init_db()
+
+
+def png_bytes(size=(40, 30)) -> bytes:
+    buffer = io.BytesIO()
+    PILImage.new("RGB", size, (90, 90, 90)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def png_header(width: int, height: int) -> bytes:
+    """The start of a PNG declaring the given size, up to the first pixel data."""
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    chunk = struct.pack(">I", len(ihdr)) + b"IHDR" + ihdr
+    idat = struct.pack(">I", 1000) + b"IDAT"
+    return b"\x89PNG\r\n\x1a\n" + chunk + struct.pack(">I", zlib.crc32(chunk[4:])) + idat
+
+
+def leftover_temp_files() -> list:
+    return list((get_blob_store(UPLOADS_BUCKET).root / ".tmp").iterdir())
+
+
+def test_upload_is_stored_with_sniffed_format_and_size():
+    """Test that the fields and file are read from the stream."""
+    data = png_bytes()
+    response = client.post(
+        "/api/images",
+        headers=HEADERS,
+        files={"file": ("photo.png", data, "image/png")},
+        data={"render_factor": "20", "mode": "standard"},
+    )
+    assert response.status_code == 200
+
+    db = SessionLocal()
+    try:
+        image = db.query(Image).filter(Image.id == response.json()["id"]).one()
+        assert (image.width, image.height) == (40, 30)
+        assert (image.render_factor, image.processing_mode) == (20, "standard")
+        assert (image.original_mime, image.filename) == ("image/png", "photo.png")
+        assert get_blob_store(UPLOADS_BUCKET).get(image.original_key) == data
+    finally:
+        db.close()
+
+
+def test_oversized_upload_is_cut_off():
+    """Test that the size limit is enforced while streaming, leaving nothing behind."""
+    data = png_bytes() + b"\x00" * MAX_UPLOAD_BYTES
+
+    def body():
+        # Chunked, so the early Content-Length check does not apply
+        yield b"--x\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.png\"\r\n"
+        yield b"Content-Type: image/png\r\n\r\n"
+        for offset in range(0, len(data), 1024 * 1024):
+            yield data[offset:offset + 1024 * 1024]
+        yield b"\r\n--x--\r\n"
+
+    response = client.post(
+        "/api/images",
+        headers={**HEADERS, "Content-Type": "multipart/form-data; boundary=x"},
+        content=body(),
+    )
+    assert response.status_code == 413
+    assert leftover_temp_files() == []
+
+    response = client.post(
+        "/api/images", headers=HEADERS, files={"file": ("a.png", data, "image/png")}
+    )
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("content", [b"<html>not an image</html>", b"GIF"])
+def test_non_images_are_rejected(content):
+    """Test that the content, not the declared type, decides what is an image."""
+    response = client.post(
+        "/api/images", headers=HEADERS, files={"file": ("a.png", content, "image/png")}
+    )
+    assert response.status_code == 400
+    assert leftover_temp_files() == []
+
+
+def test_decompression_bomb_is_rejected():
+    """Test that a small file declaring a huge image is refused from its header."""
+    response = client.post(
+        "/api/images",
+        headers=HEADERS,
+        files={"file": ("bomb.png", png_header(50000, 50000) + b"\x00" * 1000, "image/png")},
+    )
+    assert response.status_code == 413
+    assert "pixels" in response.json()["detail"]
+
+
+def test_size_is_read_past_a_long_header(monkeypatch):
+    """Test that images whose header outgrows the buffer are measured once stored."""
+    monkeypatch.setattr(main, "ImageInspector", lambda: ImageInspector(header_bytes=64))
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (50, 20)).save(buffer, "JPEG", comment=b"x" * 5000)
+    response = client.post(
+        "/api/images", headers=HEADERS, files={"file": ("long.jpg", buffer.getvalue(), "image/jpeg")}
+    )
+    assert response.status_code == 200
+
+    db = SessionLocal()
+    try:
+        image = db.query(Image).filter(Image.id == response.json()["id"]).one()
+        assert (image.width, image.height) == (50, 20)
+    finally:
+        db.close()
+
+
+def test_images_without_readable_size_are_rejected():
+    """Test that content with image magic bytes but no readable size is refused."""
+    response = client.post(
+        "/api/images",
+        headers=HEADERS,
+        files={"file": ("a.png", b"\x89PNG\r\n\x1a\n" + b"\x00" * 500, "image/png")},
+    )
+    assert response.status_code == 400
+    assert "dimensions" in response.json()["detail"]
+    assert leftover_temp_files() == []
+
+
+def test_second_file_leaves_nothing_behind():
+    """Test that a form with two files is refused without storing the first one."""
+    data = png_bytes((41, 31))
+    response = client.post(
+        "/api/images",
+        headers=HEADERS,
+        files=[("file", ("a.png", data, "image/png")), ("file", ("b.png", png_bytes(), "image/png"))],
+    )
+    assert response.status_code == 400
+    assert not get_blob_store(UPLOADS_BUCKET).exists(hashlib.sha256(data).hexdigest())
+    assert leftover_temp_files() == []
+
+
+def test_inspector_reads_headers_split_across_chunks():
+    """Test that the header is buffered until the dimensions can be read."""
+    data = png_bytes((123, 45))
+    inspector = ImageInspector()
+    for offset in range(0, len(data), 7):
+        inspector.feed(data[offset:offset + 7])
+    inspector.finish()
+    assert (inspector.mime, inspector.width, inspector.height) == ("image/png", 123, 45)
+
+    inspector = ImageInspector(max_pixels=100)
+    with pytest.raises(UploadRejected):
+        inspector.feed(data)
+
+
+def test_batch_upload_is_streamed():
+    """Test that files, archives and fields of a bulk upload are read from the stream."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("scans/one.png", png_bytes((20, 10)))
+        zf.writestr("readme.txt", "not an image")
+    response = client.post(
+        "/api/batches",
+        headers=HEADERS,
+        files=[
+            ("files", ("two.png", png_bytes(), "image/png")),
+            ("files", ("scans.zip", archive.getvalue(), "application/zip")),
+        ],
+        data={"render_factor": "20"},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert sorted(image["filename"] for image in body["images"]) == ["scans/one.png", "two.png"]
+    assert [entry["filename"] for entry in body["skipped"]] == ["readme.txt"]
+
+    db = SessionLocal()
+    try:
+        image = db.query(Image).filter(Image.id == body["images"][0]["id"]).one()
+        assert image.render_factor == 20
+    finally:
+        db.close()
+
+
+def test_oversized_batch_upload_is_cut_off(monkeypatch):
+    """Test that the total size of a bulk upload is capped while it is received."""
+    monkeypatch.setattr(main, "BATCH_UPLOAD_MAX_BYTES", 100_000)
+
+    def body():
+        # Chunked, so the early Content-Length check does not apply
+        for index in range(3):
+            yield f'--x\r\nContent-Disposition: form-data; name="files"; filename="{index}.png"\r\n'.encode()
+            yield b"Content-Type: image/png\r\n\r\n"
+            for _ in range(10):
+                yield b"\x00" * 10_000
+            yield b"\r\n"
+        yield b"--x--\r\n"
+
+    response = client.post(
+        "/api/batches",
+        headers={**HEADERS, "Content-Type": "multipart/form-data; boundary=x"},
+        content=body(),
+    )
+    assert response.status_code == 413
+    assert leftover_temp_files() == []
+
+    response = client.post(
+        "/api/batches",
+        headers=HEADERS,
+        files=[("files", ("big.png", b"\x00" * 200_000, "image/png"))],
+    )
+    assert response.status_code == 413
@@ -0,0 +1,172 @@
+"""
+Tests for the video pipeline.
+"""
+import shutil
+import subprocess
+from fractions import Fraction
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import video
+from app.batching import BatchScheduler
+from app.database import SessionLocal, init_db
+from app.main import app
+from app.models import VideoSegment
+from app.video import ChromaSmoother, VideoInfo, colorize_video, delete_segments
+
+from tests.test_batching import FakeColorizer
+
+HAS_FFMPEG = bool(shutil.which("ffmpeg") and shutil.which("ffprobe"))
+
+
+def frame(value: int, size=(8, 8)) -> np.ndarray:
+    return np.full((*size, 3), value, dtype=np.uint8)
+
+
+def predict_sepia(frames):
+    """Generator double: a constant warm colour for every frame."""
+    from concurrent.futures import Future
+
+    future = Future()
+    future.set_result([np.tile(np.array([200, 150, 100], dtype=np.uint8), (4, 4, 1)) for _ in frames])
+    return future
+
+
+def test_chroma_smoothing_and_scene_cuts():
+    """Test that chroma is averaged over frames but not across cuts."""
+    smoother = ChromaSmoother(smoothing=0.5, scene_cut=30)
+    red, blue = np.full((4, 4, 2), 10.0), np.full((4, 4, 2), -10.0)
+    assert np.allclose(smoother(red, frame(100)[..., 0]), 10)
+    assert np.allclose(smoother(blue, frame(105)[..., 0]), 0)
+    assert np.allclose(smoother(blue, frame(240)[..., 0]), -10)  # cut: no blending
+
+    restored = ChromaSmoother(smoothing=0.5)
+    restored.restore(smoother.state())
+    assert np.allclose(restored(red, frame(240)[..., 0]), 0)
+    assert ChromaSmoother().state() == b""
+
+
+def test_frames_are_scheduled_as_one_batch():
+    """Test that a chunk of frames reaches the colorizer as one batch."""
+    class FrameColorizer(FakeColorizer):
+        def predict_frames(self, frames, render_factor):
+            self.batches.append((render_factor, len(frames)))
+            return [f[::2, ::2] for f in frames]
+
+    colorizer = FrameColorizer()
+    scheduler = BatchScheduler(colorizer, max_batch_size=2, max_wait_ms=1000)
+    predictions = scheduler.submit_frames([frame(1)] * 5, 21).result(timeout=5)
+    scheduler.shutdown()
+    assert colorizer.batches == [(21, 5)]
+    assert predictions[0].shape == (4, 4, 3)
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """Replace ffmpeg with in-memory decoding/encoding of a 10-frame clip."""
+    info = VideoInfo(width=8, height=8, fps=Fraction(25), frames=10, has_audio=False)
+    decoded_from = []
+
+    def iter_frames(path, info, start_frame=0):
+        decoded_from.append(start_frame)
+        for index in range(start_frame, info.frames):
+            yield frame(index * 20)
+
+    class Encoder:
+        def __init__(self, path, info):
+            self.path, self.frames = path, []
+
+        def write(self, colorized):
+            self.frames.append(colorized)
+
+        def close(self):
+            np.save(self.path, np.stack(self.frames), allow_pickle=False)
+            shutil.move(self.path + ".npy", self.path)
+
+        def abort(self):
+            pass
+
+    def concat(paths, source, info, output):
+        with open(output, "wb") as out:
+            for path in paths:
+                out.write(open(path, "rb").read())
+
+    monkeypatch.setattr(video, "probe", lambda path: info)
+    monkeypatch.setattr(video, "iter_frames", iter_frames)
+    monkeypatch.setattr(video, "SegmentEncoder", Encoder)
+    monkeypatch.setattr(video, "concat_segments", concat)
+    monkeypatch.setattr(video, "VIDEO_SEGMENT_FRAMES", 4)
+    monkeypatch.setattr(video, "VIDEO_BATCH_SIZE", 3)
+    return decoded_from
+
+
+def test_interrupted_video_resumes_after_last_segment(fake_ffmpeg, tmp_path):
+    """Test that a restarted job keeps finished segments and continues after them."""
+    init_db()
+    db = SessionLocal()
+    calls = []
+
+    def failing_predict(frames):
+        calls.append(len(frames))
+        if sum(calls) > 6:
+            raise RuntimeError("worker restarted")
+        return predict_sepia(frames)
+
+    try:
+        with pytest.raises(RuntimeError):
+            colorize_video(db, 501, "clip.mp4", failing_predict, lambda done, total: None, str(tmp_path / "a"))
+        segments = db.query(VideoSegment).filter(VideoSegment.image_id == 501).all()
+        assert [(s.index, s.start_frame, s.frames) for s in segments] == [(0, 0, 4)]
+
+        progress = []
+        frames = colorize_video(
+            db, 501, "clip.mp4", predict_sepia, lambda done, total: progress.append(done), str(tmp_path / "b")
+        )
+        assert frames == 10 and fake_ffmpeg == [0, 4]
+        assert progress == [7, 8, 10]
+        segments = db.query(VideoSegment).filter(VideoSegment.image_id == 501).order_by(VideoSegment.index).all()
+        assert [(s.start_frame, s.frames) for s in segments] == [(0, 4), (4, 4), (8, 2)]
+
+        delete_segments(db, 501)
+        assert not db.query(VideoSegment).filter(VideoSegment.image_id == 501).count()
+    finally:
+        db.close()
+
+
+@pytest.mark.skipif(not HAS_FFMPEG, reason="ffmpeg is not installed")
+def test_video_round_trip_with_ffmpeg(tmp_path, monkeypatch):
+    """Test decoding, segmented encoding and joining with the real ffmpeg."""
+    source = tmp_path / "clip.mp4"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=size=64x48:rate=10:duration=2",
+         "-pix_fmt", "yuv420p", str(source)],
+        check=True,
+    )
+    info = video.probe(str(source))
+    assert (info.width, info.height, info.frames) == (64, 48, 20)
+    assert len(list(video.iter_frames(str(source), info, start_frame=15))) == 5
+
+    monkeypatch.setattr(video, "VIDEO_SEGMENT_FRAMES", 8)
+    init_db()
+    db = SessionLocal()
+    try:
+        output = tmp_path / "out.mp4"
+        assert colorize_video(db, 502, str(source), predict_sepia, lambda *_: None, str(output)) == 20
+        assert video.probe(str(output)).frames == 20
+    finally:
+        db.close()
+
+
+def test_video_upload_requires_a_video(monkeypatch):
+    """Test that the video endpoint only accepts video files."""
+    init_db()
+    # Checked while the body streams in, after the ffmpeg check
+    monkeypatch.setattr("app.main.video_tools_available", lambda: True)
+    response = TestClient(app).post(
+        "/api/videos",
+        headers={"X-Session-ID": "a" * 32},
+        files={"file": ("a.jpg", b"\xff\xd8\xff", "image/jpeg")},
+    )
+    assert response.status_code == 400
@@ -1,13 +1,14 @@
 import { clsx } from "clsx";
-import { Loader2, CheckCircle2, XCircle, Clock } from "lucide-react";
+import { Loader2, CheckCircle2, XCircle, Clock, Ban } from "lucide-react";
 
-type Status = "pending" | "processing" | "completed" | "failed";
+type Status = "pending" | "processing" | "completed" | "failed" | "cancelled";
 
 const statusLabels: Record<Status, string> = {
   pending: "Ожидание",
   processing: "Обработка",
   completed: "Готово",
   failed: "Ошибка",
+  cancelled: "Отменено",
 };
 
 export function StatusBadge({ status }: { status: Status }) {
@@ -19,12 +20,14 @@ export function StatusBadge({ status }: { status: Status }) {
         "bg-blue-50 text-blue-700 border-blue-200": status === "processing",
         "bg-green-50 text-green-700 border-green-200": status === "completed",
         "bg-red-50 text-red-700 border-red-200": status === "failed",
+        "bg-gray-50 text-gray-600 border-gray-200": status === "cancelled",
       }
     )}>
       {status === "pending" && <Clock className="w-3 h-3" />}
       {status === "processing" && <Loader2 className="w-3 h-3 animate-spin" />}
       {status === "completed" && <CheckCircle2 className="w-3 h-3" />}
       {status === "failed" && <XCircle className="w-3 h-3" />}
+      {status === "cancelled" && <Ban className="w-3 h-3" />}
       {statusLabels[status]}
     </div>
   );
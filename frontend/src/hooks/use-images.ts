@@ -1,4 +1,5 @@
-import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
+import { useEffect, useState } from "react";
+import { useQuery, useInfiniteQuery, useMutation, useQueryClient } from "@tanstack/react-query";
 import { useToast } from "@/hooks/use-toast";
 import { getApiSessionId } from "@/lib/session";
 
@@ -19,18 +20,46 @@ export interface Image {
   id: number;
   originalUrl: string;
   colorizedUrl: string | null;
-  status: "pending" | "processing" | "completed" | "failed";
+  // Downscaled renditions (of the result once available, else of the original);
+  // the server picks AVIF/WebP/JPEG from the Accept header
+  thumbnailUrl?: string | null;
+  previewUrl?: string | null;
+  status: "pending" | "processing" | "completed" | "failed" | "cancelled";
   errorMessage: string | null;
   createdAt: string;
   publicToken?: string | null;
+  // Pushed by the status stream while the image is queued or processing
+  queuePosition?: number | null;
+  progress?: number | null;
 }
 
-// Fetch all images
+// Status-only update from /api/events or /api/images/{id}/status
+export interface ImageStatusUpdate {
+  id: number;
+  status: Image["status"];
+  queuePosition: number | null;
+  progress: number | null;
+  errorMessage: string | null;
+  colorizedUrl: string | null;
+}
+
+// Fields needed by the gallery grid (the listing loads only these columns)
+const LIST_FIELDS = "id,status,createdAt,thumbnailUrl,originalUrl,colorizedUrl";
+
+export interface ImagePage {
+  images: Image[];
+  nextCursor: string | null;
+}
+
+// Fetch the gallery listing, one page at a time (newest first)
 export function useImages() {
-  return useQuery({
+  return useInfiniteQuery({
     queryKey: ["images"],
-    queryFn: async (): Promise<Image[]> => {
-      const res = await fetch(`${API_BASE_URL}/api/images`, {
+    initialPageParam: null as string | null,
+    queryFn: async ({ pageParam }): Promise<ImagePage> => {
+      const params = new URLSearchParams({ fields: LIST_FIELDS });
+      if (pageParam) params.set("cursor", pageParam);
+      const res = await fetch(`${API_BASE_URL}/api/images?${params}`, {
         headers: getApiHeaders(),
       });
       if (!res.ok) {
@@ -39,16 +68,24 @@ export function useImages() {
         }
         throw new Error("Failed to fetch images");
       }
-      return await res.json();
+      return {
+        images: await res.json(),
+        nextCursor: res.headers.get("X-Next-Cursor"),
+      };
     },
+    getNextPageParam: (lastPage) => lastPage.nextCursor,
     // Refresh occasionally to check for updates
     refetchInterval: 5000, 
   });
 }
 
-// Fetch single image with smart polling
+// Fetch single image; status changes are pushed over Server-Sent Events,
+// with polling as a fallback when the stream is unavailable
 export function useImage(id: number) {
-  return useQuery({
+  const queryClient = useQueryClient();
+  const [streamFailed, setStreamFailed] = useState(false);
+
+  const query = useQuery({
     queryKey: ["images", id],
     queryFn: async (): Promise<Image> => {
       const res = await fetch(`${API_BASE_URL}/api/images/${id}`, {
@@ -65,12 +102,53 @@ export function useImage(id: number) {
       }
       return await res.json();
     },
-    // Poll faster if status is pending or processing
+    // Poll only if the event stream could not be used
     refetchInterval: (query) => {
       const status = query.state.data?.status;
-      return status === "pending" || status === "processing" ? 1000 : false;
+      const active = status === "pending" || status === "processing";
+      return active && streamFailed ? 1000 : false;
     },
   });
+
+  const status = query.data?.status;
+  const active = status === "pending" || status === "processing";
+
+  useEffect(() => {
+    if (!active) return;
+    if (typeof EventSource === "undefined") {
+      setStreamFailed(true);
+      return;
+    }
+
+    const params = new URLSearchParams({ session: getApiSessionId(), image: String(id) });
+    const source = new EventSource(`${API_BASE_URL}/api/events?${params}`);
+
+    source.addEventListener("status", (event) => {
+      const update: ImageStatusUpdate = JSON.parse((event as MessageEvent).data);
+      queryClient.setQueryData<Image>(["images", id], (old) =>
+        old && {
+          ...old,
+          status: update.status,
+          errorMessage: update.errorMessage,
+          colorizedUrl: update.colorizedUrl ?? old.colorizedUrl,
+          queuePosition: update.queuePosition,
+          progress: update.progress,
+        }
+      );
+      if (update.status === "completed" || update.status === "failed" || update.status === "cancelled") {
+        source.close();
+        queryClient.invalidateQueries({ queryKey: ["images"] });
+      }
+    });
+    source.onerror = () => {
+      source.close();
+      setStreamFailed(true);
+    };
+
+    return () => source.close();
+  }, [id, active, queryClient]);
+
+  return query;
 }
 
 // Upload new image
@@ -158,3 +236,33 @@ export function useUploadImage() {
     },
   });
 }
+
+// Cancel a queued or running colorization
+export function useCancelImage() {
+  const queryClient = useQueryClient();
+  const { toast } = useToast();
+
+  return useMutation({
+    mutationFn: async (id: number): Promise<void> => {
+      const res = await fetch(`${API_BASE_URL}/api/images/${id}/cancel`, {
+        method: "POST",
+        headers: getApiHeaders(),
+      });
+      if (!res.ok && res.status !== 409) {
+        throw new Error("Не удалось отменить обработку");
+      }
+    },
+    onSuccess: (_, id) => {
+      // 409: the image finished meanwhile; either way, reload it
+      queryClient.invalidateQueries({ queryKey: ["images", id] });
+      queryClient.invalidateQueries({ queryKey: ["images"] });
+    },
+    onError: (error) => {
+      toast({
+        title: "Ошибка",
+        description: error.message,
+        variant: "destructive",
+      });
+    },
+  });
+}
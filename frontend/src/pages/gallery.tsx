@@ -5,7 +5,8 @@ import { ArrowRight, ImageOff } from "lucide-react";
 import { motion } from "framer-motion";
 
 export default function Gallery() {
-  const { data: images, isLoading, error } = useImages();
+  const { data, isLoading, error, hasNextPage, fetchNextPage, isFetchingNextPage } = useImages();
+  const images = data?.pages.flatMap((page) => page.images);
 
   if (isLoading) {
     return (
@@ -64,7 +65,7 @@ export default function Gallery() {
               <div className="liquid-glass rounded-2xl border border-gray-200 overflow-hidden hover:border-gray-300 transition-all duration-300 hover:shadow-xl h-full flex flex-col">
                 <div className="aspect-square relative overflow-hidden bg-gray-100">
                   <img
-                    src={image.colorizedUrl || image.originalUrl}
+                    src={image.thumbnailUrl || image.colorizedUrl || image.originalUrl}
                     alt="Gallery thumbnail"
                     className="w-full h-full object-cover transition-transform duration-500 group-hover:scale-105"
                     loading="lazy"
@@ -89,6 +90,18 @@ export default function Gallery() {
           </motion.div>
         ))}
       </div>
+
+      {hasNextPage && (
+        <div className="flex justify-center">
+          <button
+            onClick={() => fetchNextPage()}
+            disabled={isFetchingNextPage}
+            className="px-6 py-2 border border-gray-300 rounded-xl text-gray-900 hover:bg-gray-100 transition-colors disabled:opacity-50"
+          >
+            {isFetchingNextPage ? "Загрузка..." : "Показать ещё"}
+          </button>
+        </div>
+      )}
     </div>
   );
 }
@@ -23,7 +23,7 @@ interface PublicImage {
   id: number;
   originalUrl: string;
   colorizedUrl: string | null;
-  status: "pending" | "processing" | "completed" | "failed";
+  status: "pending" | "processing" | "completed" | "failed" | "cancelled";
   errorMessage: string | null;
   createdAt: string;
 }
@@ -86,7 +86,7 @@ export default function PublicResult() {
   }
 
   const isProcessing = image.status === "pending" || image.status === "processing";
-  const isFailed = image.status === "failed";
+  const isFailed = image.status === "failed" || image.status === "cancelled";
   const isComplete = image.status === "completed";
 
   const handleViewOriginal = () => {
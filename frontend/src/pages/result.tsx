@@ -1,11 +1,11 @@
 import { useRoute } from "wouter";
-import { useImage } from "@/hooks/use-images";
+import { useCancelImage, useImage } from "@/hooks/use-images";
 import { ImageCompare } from "@/components/image-compare";
 import { StatusBadge } from "@/components/status-badge";
 import { ImageViewer } from "@/components/image-viewer";
 import { useShare } from "@/hooks/use-share";
 import { useToast } from "@/hooks/use-toast";
-import { Download, Share2, ArrowLeft, RefreshCw, AlertTriangle, Eye, Copy, ExternalLink, Maximize2, Info } from "lucide-react";
+import { Download, Share2, ArrowLeft, RefreshCw, AlertTriangle, Eye, Copy, ExternalLink, Maximize2, Info, Ban } from "lucide-react";
 import { Link } from "wouter";
 import { Button } from "@/components/ui/button";
 import { motion } from "framer-motion";
@@ -23,6 +23,7 @@ export default function Result() {
   const id = parseInt(params?.id || "0");
   const { data: image, isLoading, error } = useImage(id);
   const { share, isSharing } = useShare();
+  const cancelImage = useCancelImage();
   const { toast } = useToast();
   const [viewerImage, setViewerImage] = useState<string | null>(null);
   const [viewerTitle, setViewerTitle] = useState("");
@@ -49,6 +50,7 @@ export default function Result() {
 
   const isProcessing = image.status === "pending" || image.status === "processing";
   const isFailed = image.status === "failed";
+  const isCancelled = image.status === "cancelled";
   const isComplete = image.status === "completed";
 
   const handleShare = () => {
@@ -240,7 +242,30 @@ export default function Result() {
               <p className="text-gray-600 max-w-md">
                 Наша нейронная сеть анализирует черно-белые паттерны и добавляет цветовые каналы. Обычно это занимает 5-10 секунд.
               </p>
+              {image.status === "pending" && image.queuePosition != null && (
+                <p className="text-sm text-gray-500">Позиция в очереди: {image.queuePosition}</p>
+              )}
+              {image.status === "processing" && image.progress != null && (
+                <p className="text-sm text-gray-500">Выполнено: {Math.round(image.progress * 100)}%</p>
+              )}
+            </div>
+            <Button
+              variant="outline"
+              className="gap-2"
+              disabled={cancelImage.isPending}
+              onClick={() => cancelImage.mutate(image.id)}
+            >
+              <Ban className="w-4 h-4" /> Отменить
+            </Button>
+          </div>
+        )}
+
+        {isCancelled && (
+          <div className="flex flex-col items-center justify-center py-20 text-center space-y-4">
+            <div className="w-20 h-20 rounded-full bg-gray-100 flex items-center justify-center">
+              <Ban className="w-10 h-10 text-gray-500" />
             </div>
+            <h3 className="text-xl font-semibold text-gray-700">Обработка отменена</h3>
           </div>
         )}
 